@@ -3,8 +3,15 @@ import streamlit as st
 import pandas as pd
 from data_manager import load_data, get_shift_columns
 import scheduler
+import availability
 import uuid  # For unique IDs
+import functools
+import time
 from excel_exporter import generate_styled_excel
+import solve_cache
+import solve_jobs
+import scenarios
+import repair_suggestions
 
 # --- Shared Constants ---
 ROW_LABELS = {
@@ -371,7 +378,8 @@ if st.session_state.get('employees_df') is not None:
             
             no_overlap = st.checkbox("איסור חפיפת משמרות", value=c['no_overlap'])
             no_back_to_back = st.checkbox("איסור משמרות רצופות", value=c['no_back_to_back'])
-            min_rest = st.number_input("שעות מנוחה מינימליות", min_value=0, value=c['min_rest'])
+            min_rest = st.number_input("שעות מנוחה מינימליות", min_value=0, value=c['min_rest'],
+                                       help="כאשר 'איסור משמרות רצופות' פעיל - מספר השעות המינימלי בין סוף משמרת לתחילת המשמרת הבאה של אותו עובד")
             allow_double = st.checkbox("אפשר כפולות (ברירת מחדל לכולם)", value=c['allow_double'])
             
             if st.button("🪄 אישור כפולות גורף לכל העובדים", use_container_width=True, help="לחיצה על הכפתור תעדכן את כל העובדים שזמינים לבוקר להיות זמינים גם לכפולת בוקר, ומי שזמין ללילה לכפולת לילה."):
@@ -381,29 +389,22 @@ if st.session_state.get('employees_df') is not None:
                         st.session_state['firebase_constraints_base'] = {}
                     
                     # Logic to update all employees based on current M/N availability
-                    for idx, row in df.iterrows():
-                        # Determine current file-based availability
-                        day_cols = [c for c in df.columns if c in potential_shifts]
-                        
+                    # Determine current file-based availability (all employees at once)
+                    day_cols = [c for c in df.columns if c in potential_shifts]
+                    file_avail = availability.parse_file_availability(df, day_cols)
+                    for emp_i, idx in enumerate(df.index):
                         # Get existing override if any, else build from scratch
                         if str(idx) in st.session_state['firebase_constraints_base']:
                             emp_df = st.session_state['firebase_constraints_base'][str(idx)].copy()
                         else:
                             # Build initial from file
-                            data_dict = {}
-                            for s_col in day_cols:
-                                val = str(row[s_col]).lower()
-                                is_m = 'בוקר' in val or 'morning' in val
-                                is_a = 'צהריים' in val or 'afternoon' in val
-                                is_n = 'לילה' in val or 'night' in val
-                                data_dict[s_col] = [is_m, is_a, is_n, False, False]
-                            emp_df = pd.DataFrame(data_dict, index=[
+                            emp_df = availability.editor_frame(file_avail, emp_i, day_cols, [
                                 ROW_LABELS["morning"], ROW_LABELS["afternoon"], ROW_LABELS["night"],
                                 ROW_LABELS["double_m"], ROW_LABELS["double_n"]
                             ]).reset_index().rename(columns={'index': 'סוג משמרת'})
 
                         # Apply the update
-                        for col in day_cols:
+                        for col in [str(c).strip() for c in day_cols]:
                             if col in emp_df.columns:
                                 is_m = emp_df.loc[emp_df['סוג משמרת'] == ROW_LABELS["morning"], col].values[0]
                                 is_n = emp_df.loc[emp_df['סוג משמרת'] == ROW_LABELS["night"], col].values[0]
@@ -549,6 +550,10 @@ if st.session_state.get('employees_df') is not None:
             collected_fixed_shifts = {} # Store per-employee fixed assignments (IRON shifts)
 
 
+            # File availability of every employee, parsed once for all the editors below
+            file_avail = availability.parse_file_availability(df, potential_shifts)
+            file_avail_row = {idx: i for i, idx in enumerate(df.index)}
+
             for idx, row in all_emp_rows:
                 emp_name = row[name_col]
                 header_text = f"👤 {emp_name}"
@@ -583,17 +588,7 @@ if st.session_state.get('employees_df') is not None:
                         st.markdown("---")
 
                         # Build initial from file (Always source of truth for structure)
-                        data_dict = {}
-                        for s_col in potential_shifts:
-                            val = str(row[s_col]).lower()
-                            day_label = str(s_col).strip()
-                            is_m = 'בוקר' in val or 'morning' in val
-                            is_a = 'צהריים' in val or 'afternoon' in val
-                            is_n = 'לילה' in val or 'night' in val
-
-                            data_dict[day_label] = [is_m, is_a, is_n, False, False]
-
-                        df_emp = pd.DataFrame(data_dict, index=[
+                        df_emp = availability.editor_frame(file_avail, file_avail_row[idx], potential_shifts, [
                             ROW_LABELS["morning"],
                             ROW_LABELS["afternoon"],
                             ROW_LABELS["night"],
@@ -626,7 +621,7 @@ if st.session_state.get('employees_df') is not None:
                         col_config = {
                             "סוג משמרת": st.column_config.TextColumn("סוג משמרת", disabled=True)
                         }
-                        for col in data_dict.keys():
+                        for col in df_emp.columns:
                             col_config[col] = st.column_config.CheckboxColumn(disabled=False)
 
                         # Data Editor
@@ -739,39 +734,273 @@ if st.session_state.get('employees_df') is not None:
         with col2:
              st.info(f"אילוצים פעילים: {len([k for k,v in st.session_state['constraints'].items() if v])}")
              
-        calc_potential_ui = st.checkbox("חשב והצג מועמדים פוטנציאליים לגישור פערים (מאריך את זמן החישוב)", value=False)
+        calc_potential_ui = st.checkbox("חשב והצג מועמדים פוטנציאליים לגישור פערים", value=False,
+                                        help="מועמדים מוסמכים לעמדה, פנויים באותו יום ועומדים בכלל המנוחה - מדורגים לפי העדפה ומכסת משמרות פנויה")
+
+        profile_options = ['auto'] + list(scheduler.SOLVE_PROFILES.keys())
+        solve_profile_ui = st.selectbox(
+            "פרופיל חישוב",
+            options=profile_options,
+            index=0,
+            format_func=lambda p: "אוטומטי (לפי גודל הבעיה)" if p == 'auto' else scheduler.SOLVE_PROFILES[p]['label'],
+            key="solve_profile",
+            help="תצוגה מהירה מחזירה פתרון טוב תוך שניות. יסודי ממשיך עד הוכחת אופטימליות (עלול לקחת דקות)."
+        )
+        lexicographic_ui = st.checkbox(
+            "אופטימיזציה בשלבים: קודם מינימום חוסרים, אחר כך מקסימום שיבוצים ולבסוף העדפות",
+            value=False,
+            key="lexicographic_objective",
+            help="כל שלב נפתר בנפרד ומקבע את התוצאה של השלב הקודם. מוכיח אופטימליות מהר יותר באתרים גדולים."
+        )
+        alt_col1, alt_col2 = st.columns(2)
+        with alt_col1:
+            num_rosters_ui = st.number_input(
+                "מספר חלופות שיבוץ להצגה", min_value=1, max_value=5, value=1, step=1, key="num_rosters",
+                help="מעבר לשיבוץ הטוב ביותר, מחפש שיבוצים חלופיים טובים ושונים זה מזה (לא זמין בפתרון בחלונות מתגלגלים)."
+            )
+        with alt_col2:
+            min_difference_ui = st.number_input(
+                "הבדל מינימלי בין חלופות (מספר שיבוצים)", min_value=1, value=10, step=1, key="min_difference",
+                disabled=num_rosters_ui <= 1
+            )
         
-        generate_clicked = st.button("התחל שיבוץ אוטומטי (AutoShift)", type="primary")
-        if generate_clicked:
-            with st.spinner("מבצע אופטימיזציה..."):
-                try:
-                    current_overrides = collected_overrides
-                    shifts_to_use = st.session_state.get('selected_shifts', potential_shifts)
-                    col_map_to_use = st.session_state.get('col_map', {"name": name_col, "pos": role_col, "note": None})
-                    
-                    # Filter out excluded employees (deleted) before solving
-                    df_all = st.session_state['employees_df']
-                    excluded_names = st.session_state.get('excluded_employees', set())
-                    df_solver = df_all[~df_all[name_col].astype(str).isin(excluded_names)].copy()
-                    if role_col and collected_role_updates:
-                        for r_idx, r_list in collected_role_updates.items():
-                            df_solver.at[r_idx, role_col] = ", ".join(r_list)
-                    
-                    results = scheduler.solve_roster(
+        prev_results = st.session_state.get('latest_roster_results')
+        has_prev_roster = bool(prev_results) and prev_results.get('roster') is not None
+        warm_start_ui = st.checkbox(
+            "התחל מהשיבוץ הקודם (מאיץ הרצות חוזרות אחרי שינויים קטנים)",
+            value=has_prev_roster,
+            disabled=not has_prev_roster,
+            key="warm_start"
+        )
+
+        rolling_ui = False
+        if len(st.session_state.get('selected_shifts', potential_shifts)) > 7:
+            rolling_ui = st.checkbox(
+                "פתרון בחלונות שבועיים מתגלגלים (לסידור חודשי גדול שפתרון אחד איטי מדי עבורו)",
+                value=False,
+                key="rolling_horizon",
+                help="הסידור נפתר שבוע אחרי שבוע עם יום חפיפה. המנוחה בין משמרות ומכסת המשמרות (מחולקת באופן יחסי בין השבועות) נשמרות בין השבועות. מהיר יותר, אבל התוצאה אינה מובטחת כאופטימלית ועלולים להיווצר יותר חוסרים מאשר בפתרון אחד."
+            )
+        
+        current_overrides = collected_overrides
+        shifts_to_use = st.session_state.get('selected_shifts', potential_shifts)
+        col_map_to_use = st.session_state.get('col_map', {"name": name_col, "pos": role_col, "note": None})
+        
+        # Filter out excluded employees (deleted) before solving
+        df_all = st.session_state['employees_df']
+        excluded_names = st.session_state.get('excluded_employees', set())
+        df_solver = df_all[~df_all[name_col].astype(str).isin(excluded_names)].copy()
+        if role_col and collected_role_updates:
+            for r_idx, r_list in collected_role_updates.items():
+                df_solver.at[r_idx, role_col] = ", ".join(r_list)
+
+        # Quick max-flow capacity check (milliseconds, no optimization)
+        with st.expander("📊 בדיקת קיבולת מהירה (לפני שיבוץ)"):
+            try:
+                # Expander bodies run on every rerun - recompute only when the inputs change
+                _, capacity_key = solve_cache.fingerprint_inputs(
+                    df_solver, st.session_state['positions'], st.session_state['constraints'], col_map_to_use,
+                    shifts_to_use, solve_fn=scheduler.analyze_capacity, avail_overrides=current_overrides,
+                    fixed_shifts_map=collected_fixed_shifts
+                )
+                cached_capacity = st.session_state.get('capacity_check')
+                if cached_capacity is not None and cached_capacity[0] == capacity_key:
+                    capacity = cached_capacity[1]
+                else:
+                    capacity = scheduler.analyze_capacity(
                         df_solver,
                         st.session_state['positions'],
                         st.session_state['constraints'],
                         col_map=col_map_to_use,
                         shifts=shifts_to_use,
                         avail_overrides=current_overrides,
-                        pref_weights=collected_pref_weights,
-                        max_shifts_map=collected_max_shifts,
-                        fixed_shifts_map=collected_fixed_shifts,
-                        calc_potentials=calc_potential_ui
+                        fixed_shifts_map=collected_fixed_shifts
                     )
-                    st.session_state['latest_roster_results'] = results
+                    st.session_state['capacity_check'] = (capacity_key, capacity)
+                if capacity:
+                    st.caption(f"דרישה: {capacity['demand']} | כיסוי מקסימלי אפשרי: {capacity['max_coverage']} | חוסר מובטח: {capacity['guaranteed_shortage']} ({capacity['wall_time'] * 1000:.0f} ms)")
+                    day_rows = [
+                        {"יום": d, "דרישה": v['demand'], "כיסוי מקסימלי": v['max_coverage'], "חוסר מובטח": v['guaranteed_shortage']}
+                        for d, v in capacity['days'].items()
+                    ]
+                    st.dataframe(pd.DataFrame(day_rows), hide_index=True, use_container_width=True)
+                    slot_rows = [
+                        {"יום": s_info['day'], "עמדה": s_info['position'], "משמרת": s_info['shift'], "נדרש": s_info['required'],
+                         "כשירים וזמינים": s_info['eligible'], "חוסר מובטח": s_info['guaranteed_shortage'], "לא מכוסה (הערכה)": s_info['unfilled']}
+                        for s_info in capacity['slots'] if s_info['guaranteed_shortage'] > 0 or s_info['unfilled'] > 0
+                    ]
+                    if slot_rows:
+                        st.dataframe(pd.DataFrame(slot_rows), hide_index=True, use_container_width=True)
+                    else:
+                        st.success("אין חוסרים מבניים - כל המשבצות ניתנות לכיסוי מבחינת זמינות וכשירות.")
+            except Exception as e:
+                st.warning(f"לא ניתן לחשב קיבולת: {e}")
+        
+        # What-if comparison: several variants of the current input solved side by side
+        with st.expander("🔀 השוואת תרחישים (מה אם...?)"):
+            if 'whatif_scenarios' not in st.session_state:
+                st.session_state['whatif_scenarios'] = []
+            shift_options = {'M': "בוקר", 'A': "צהריים", 'N': "לילה"}
+            pos_names = [p['name'] for p in st.session_state['positions']]
+
+            sc_name = st.text_input("שם התרחיש", key="whatif_name", placeholder="למשל: שומר נוסף בלילה בשער")
+            wc1, wc2, wc3 = st.columns(3)
+            with wc1:
+                sc_pos = st.selectbox("עמדה", options=["ללא"] + pos_names, key="whatif_pos")
+            with wc2:
+                sc_shift = st.selectbox("משמרת", options=list(shift_options), format_func=shift_options.get, key="whatif_shift")
+            with wc3:
+                sc_delta = st.number_input("שינוי במספר המאבטחים", value=1, step=1, key="whatif_delta")
+            sc_doubles = st.selectbox(
+                "כפולות", options=[None, True, False], key="whatif_doubles",
+                format_func=lambda v: "ללא שינוי" if v is None else ("לאפשר" if v else "לאסור")
+            )
+            sc_exclude = st.multiselect("ללא העובדים", options=df_solver[name_col].astype(str).tolist(), key="whatif_exclude")
+
+            if st.button("➕ הוסף תרחיש", key="whatif_add"):
+                scenario = {'name': sc_name.strip() or f"תרחיש {len(st.session_state['whatif_scenarios']) + 1}"}
+                if sc_pos != "ללא" and sc_delta:
+                    scenario['guards'] = {sc_pos: {sc_shift: int(sc_delta)}}
+                if sc_doubles is not None:
+                    scenario['constraints'] = {'allow_double': sc_doubles}
+                if sc_exclude:
+                    scenario['exclude'] = sc_exclude
+                st.session_state['whatif_scenarios'].append(scenario)
+
+            for sc in st.session_state['whatif_scenarios']:
+                parts = [f"{pos} {shift_options[code]} {delta:+d}" for pos, deltas in sc.get('guards', {}).items() for code, delta in deltas.items()]
+                if 'constraints' in sc:
+                    parts.append("כפולות: " + ("מותרות" if sc['constraints']['allow_double'] else "אסורות"))
+                if sc.get('exclude'):
+                    parts.append("ללא: " + ", ".join(sc['exclude']))
+                st.caption(f"• {sc['name']}: {' | '.join(parts) or 'ללא שינוי'}")
+
+            wr1, wr2 = st.columns(2)
+            with wr1:
+                run_whatif = st.button("▶️ הרץ השוואה", key="whatif_run", disabled=not st.session_state['whatif_scenarios'])
+            with wr2:
+                if st.button("🗑️ נקה תרחישים", key="whatif_clear"):
+                    st.session_state['whatif_scenarios'] = []
+                    st.session_state.pop('whatif_table', None)
+                    st.rerun()
+
+            if run_whatif:
+                try:
+                    with st.spinner("פותר את כל התרחישים במקביל..."):
+                        # Queued in the shared solve pool, within its worker budget
+                        whatif_job = solve_jobs.submit_batch(
+                            scenarios.run_scenarios,
+                            df_solver,
+                            st.session_state['positions'],
+                            st.session_state['constraints'],
+                            col_map_to_use,
+                            shifts_to_use,
+                            st.session_state['whatif_scenarios'],
+                            avail_overrides=current_overrides,
+                            max_shifts_map=collected_max_shifts,
+                            fixed_shifts_map=collected_fixed_shifts,
+                            pref_weights=collected_pref_weights,
+                            solve_profile='quick'
+                        )
+                        whatif, whatif_error = solve_jobs.wait_job(whatif_job)
+                    if whatif_error is not None:
+                        raise whatif_error
+                    if whatif is not None:
+                        st.session_state['whatif_table'] = whatif['table']
+                except ValueError as e:
+                    st.warning(f"תרחיש לא תקין: {e}")
                 except Exception as e:
-                    st.error(f"שגיאה בתהליך השיבוץ: {e}")
+                    st.error(f"שגיאה בהרצת התרחישים: {e}")
+            if st.session_state.get('whatif_table') is not None:
+                st.dataframe(st.session_state['whatif_table'], hide_index=True, use_container_width=True)
+
+        generate_clicked = st.button("התחל שיבוץ אוטומטי (AutoShift)", type="primary")
+        if generate_clicked:
+            solve_fn = scheduler.solve_roster_rolling if rolling_ui else scheduler.solve_roster_decomposed
+            # The solve runs as a background job (shared, capped pool) so this session stays responsive
+            # and intermediate rosters can be shown while it searches
+            if st.session_state.get('solve_job_id'):
+                solve_jobs.cancel_job(st.session_state['solve_job_id'])
+            # Instant greedy preview, computed in the job: shown while the optimiser runs, and its warm start
+            preview_fn = None
+            if not rolling_ui:
+                preview_fn = functools.partial(
+                    scheduler.solve_roster,
+                    df_solver,
+                    st.session_state['positions'],
+                    st.session_state['constraints'],
+                    col_map=col_map_to_use,
+                    shifts=shifts_to_use,
+                    avail_overrides=current_overrides,
+                    pref_weights=collected_pref_weights,
+                    max_shifts_map=collected_max_shifts,
+                    fixed_shifts_map=collected_fixed_shifts,
+                    engine='greedy'
+                )
+            # Identical inputs are served from the result cache; near-identical ones warm-start from it
+            st.session_state['solve_job_id'] = solve_jobs.submit_solve(
+                solve_cache.cached_solve,
+                solve_fn,
+                df_solver,
+                st.session_state['positions'],
+                st.session_state['constraints'],
+                stream=not rolling_ui,
+                preview_fn=preview_fn,
+                col_map=col_map_to_use,
+                shifts=shifts_to_use,
+                avail_overrides=current_overrides,
+                pref_weights=collected_pref_weights,
+                max_shifts_map=collected_max_shifts,
+                fixed_shifts_map=collected_fixed_shifts,
+                calc_potentials=calc_potential_ui,
+                solve_profile=solve_profile_ui,
+                objective_mode='lexicographic' if lexicographic_ui else 'weighted',
+                hint_roster=prev_results['roster'] if (warm_start_ui and has_prev_roster) else None,
+                num_rosters=1 if rolling_ui else int(num_rosters_ui),
+                min_difference=int(min_difference_ui)
+            )
+
+        # Poll the running solve job (survives reruns, e.g. the "good enough" click)
+        job_id = st.session_state.get('solve_job_id')
+        if job_id:
+            if not solve_jobs.is_finished(job_id):
+                if st.button("✋ מספיק טוב - עצור והצג את הפתרון הנוכחי", key="stop_solve"):
+                    solve_jobs.cancel_job(job_id)
+                progress_box = st.empty()
+                shown = None
+                while not solve_jobs.is_finished(job_id):
+                    job = solve_jobs.job_status(job_id)
+                    snap = job['latest']
+                    if job['status'] == 'queued':
+                        state = ('queued', job['queue_position'])
+                        if state != shown:
+                            progress_box.info(f"⏳ ממתין בתור לחישוב ({job['queue_position']} עבודות לפניך)")
+                    elif snap is None:
+                        preview = job['preview']
+                        state = ('running', 0, preview is not None)
+                        if state != shown:
+                            if preview is not None:
+                                with progress_box.container():
+                                    st.info(f"תצוגה מקדימה מהירה | חוסרים: {sum(preview['shortage_summary'].values())} - האופטימיזציה ממשיכה לשפר")
+                                    st.dataframe(preview['roster'].drop(columns=['raw_shift']), hide_index=True, use_container_width=True)
+                            else:
+                                progress_box.info("מבצע אופטימיזציה... ממתין לפתרון ראשון")
+                    else:
+                        state = ('running', snap['solutions'])
+                        if state != shown:
+                            with progress_box.container():
+                                st.info(f"פתרון ביניים #{snap['solutions']} | חוסרים: {snap['shortage']} | {snap['elapsed']:.1f} שניות - החיפוש ממשיך לשפר")
+                                if snap['roster'] is not None:
+                                    st.dataframe(snap['roster'].drop(columns=['raw_shift']), hide_index=True, use_container_width=True)
+                    shown = state
+                    time.sleep(0.5)
+                progress_box.empty()
+            results, job_error = solve_jobs.pop_job_result(job_id)
+            del st.session_state['solve_job_id']
+            if job_error is not None:
+                st.error(f"שגיאה בתהליך השיבוץ: {job_error}")
+            elif results is not None:
+                st.session_state['latest_roster_results'] = results
 
         # Render saved roster if it exists, matching the inner indentation scope
         if 'latest_roster_results' in st.session_state:
@@ -783,6 +1012,53 @@ if st.session_state.get('employees_df') is not None:
                     results = st.session_state['latest_roster_results']
                     if results and results.get('roster') is not None:
                         st.success(f"נמצא פתרון! (סטטוס: {results['status']})")
+                        solve_info = results.get('solve_stats')
+                        if solve_info:
+                            gap_txt = f"{solve_info['gap'] * 100:.2f}%" if solve_info.get('gap') is not None else "—"
+                            if solve_info['profile'] == 'flow':
+                                profile_label = "זרימה (פתרון מדויק ללא כפולות ומנוחה)"
+                            elif solve_info['profile'] == 'greedy':
+                                profile_label = "תצוגה מקדימה חמדנית (ללא אופטימיזציה)"
+                            else:
+                                profile_label = scheduler.SOLVE_PROFILES.get(solve_info['profile'], {}).get('label', solve_info['profile'])
+                            st.caption(f"⏱️ זמן חישוב: {solve_info['wall_time']:.2f} שניות | פער מאופטימום: {gap_txt} | פרופיל: {profile_label}")
+                        prune_info = results.get('prune_stats')
+                        if prune_info and prune_info['pruned_vars']:
+                            st.caption(f"✂️ הוסרו מראש {prune_info['pruned_vars']} אפשרויות שיבוץ שאינן יכולות לכסות דרישה (ללא דרישה: {prune_info['no_demand']}, כפולה מיותרת: {prune_info['dominated_double']}, מכסה מנוצלת במשמרות ברזל: {prune_info['fixed_budget']})")
+                        cache_info = results.get('cache')
+                        if cache_info and cache_info['hit']:
+                            st.caption("⚡ תוצאה זהה נשלפה מהמטמון - לא בוצע חישוב חוזר")
+                        elif cache_info and cache_info['warm_start']:
+                            st.caption("♻️ החישוב התחיל משיבוץ שמור של אותם עובדים ועמדות")
+                        hint_info = results.get('hint_stats')
+                        if hint_info and hint_info['rows']:
+                            st.caption(f"♻️ התחלה מהשיבוץ הקודם: {hint_info['kept']} מתוך {hint_info['rows']} שיבוצים נשמרו כנקודת פתיחה ({hint_info['ratio'] * 100:.0f}%)")
+                        metrics_info = results.get('metrics')
+                        if metrics_info:
+                            with st.expander("🩺 ביצועים (זמן לפי שלב, שיא זיכרון של התהליך)", expanded=False):
+                                phase_names = {
+                                    'parse': "קריאת עובדים", 'presolve': "ניתוח מקדים", 'build': "בניית מודל",
+                                    'solve': "פתרון", 'extract': "חילוץ פתרון", 'alternatives': "חלופות",
+                                    'shortages': "ניתוח חוסרים", 'roster_frame': "בניית טבלה", 'surplus': "דוח עודפים",
+                                }
+                                st.dataframe(pd.DataFrame([
+                                    {
+                                        "שלב": phase_names.get(name, name),
+                                        "שניות": phase['seconds'],
+                                        "שיא זיכרון התהליך (MB)": phase['process_peak_rss_mb'],
+                                        "העלאת שיא התהליך (MB)": phase['process_peak_growth_mb'],
+                                    }
+                                    for name, phase in metrics_info['phases'].items()
+                                ]), hide_index=True, use_container_width=True)
+                                st.caption("הזיכרון הוא שיא ה-RSS של כל תהליך השרת מאז עלייתו (כולל פתרונות קודמים), לא צריכה של השלב עצמו.")
+                                mc1, mc2, mc3, mc4 = st.columns(4)
+                                mc1.metric("סה\"כ שניות", f"{metrics_info['total_seconds']:.2f}")
+                                if metrics_info.get('model'):
+                                    mc2.metric("משתנים", metrics_info['model']['variables'], help=f"הוסרו מראש: {metrics_info['model']['pruned_vars']}")
+                                    mc3.metric("אילוצים", metrics_info['model']['constraints'])
+                                if metrics_info.get('search'):
+                                    mc4.metric("ענפים / קונפליקטים", f"{metrics_info['search']['branches']:,} / {metrics_info['search']['conflicts']:,}")
+                                st.caption(f"מנוע: {metrics_info['engine']} | גדלים: " + ", ".join(f"{k}={v}" for k, v in metrics_info['sizes'].items()))
                         
                         # Process Roster for Visualization
                         roster = results['roster']
@@ -1023,6 +1299,29 @@ if st.session_state.get('employees_df') is not None:
                             use_container_width=True
                         )
 
+                        # --- ALTERNATIVE ROSTERS (diff against the recommended one) ---
+                        alternatives = results.get('alternatives') or []
+                        if alternatives:
+                            st.divider()
+                            st.header("🔀 חלופות שיבוץ")
+                            base_shortage = sum(results.get('shortage_summary', {}).values())
+                            alt_tabs = st.tabs([f"חלופה {i + 1}" for i in range(len(alternatives))])
+                            for alt_i, (alt_tab, alt) in enumerate(zip(alt_tabs, alternatives)):
+                                with alt_tab:
+                                    alt_shortage = sum(alt.get('shortage_summary', {}).values())
+                                    st.caption(f"שונה ב-{alt['difference']} שיבוצים מהשיבוץ המומלץ | חוסרים: {alt_shortage} (מומלץ: {base_shortage}) | ציון: {alt['solve_stats']['objective']:.0f} (מומלץ: {solve_info['objective']:.0f})")
+                                    diff = scheduler.roster_diff(roster, alt['roster']).rename(
+                                        columns={'only_a': "שיבוץ מומלץ", 'only_b': f"חלופה {alt_i + 1}"})
+                                    st.dataframe(diff, hide_index=True, use_container_width=True)
+                                    excel_alt = generate_styled_excel(alt['roster'], sorted(alt['roster']['יום'].unique()), alt['roster']['עמדה'].unique())
+                                    st.download_button(
+                                        label=f"📥 הורד חלופה {alt_i + 1} (Excel)",
+                                        data=excel_alt,
+                                        file_name=f"roster_alt_{alt_i + 1}.xlsx",
+                                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                                        key=f"download_alt_{alt_i}"
+                                    )
+
                         # --- SURPLUS REPORT (right after schedule) ---
                         surplus_data = results.get('surplus_report', {})
                         if surplus_data:
@@ -1044,60 +1343,15 @@ if st.session_state.get('employees_df') is not None:
                         
                         if not roster.empty:
                             # 1. Calculate Per-Employee Availability Count
-                            # Iterate exactly as we did for the scheduler input to count marked "V"s
-                            emp_availability = {}
-                            
-                            # Determine effective list of employees
-                            active_emp_indices = [
-                                idx for idx, r in st.session_state['employees_df'].iterrows() 
-                                if str(r[name_col]) not in st.session_state.get('excluded_employees', set())
+                            # Same availability array the scheduler consumes (overrides merged in).
+                            # If employee marked ANY shift in a day -> Availability = 1,
+                            # because they can only be assigned once per day.
+                            active_emp_df = st.session_state['employees_df'][
+                                ~st.session_state['employees_df'][name_col].astype(str).isin(st.session_state.get('excluded_employees', set()))
                             ]
-
-                            for idx in active_emp_indices:
-                                row = st.session_state['employees_df'].loc[idx]
-                                ename = row[name_col]
-                                
-                                # Access override if exists
-                                ov_data = collected_overrides.get(idx)
-                                
-                                # Count 'True's in availability (M, A, N, M_double, N_double)
-                                total_marked = 0
-                                shifts_to_use_dashboard = st.session_state.get('selected_shifts', potential_shifts)
-                                
-                                for s_col in shifts_to_use_dashboard:
-                                    clean_d = str(s_col).strip()
-                                    
-                                    # Check Override
-                                    if ov_data is not None and clean_d in ov_data.columns:
-                                        # ov_data is a DataFrame with cols=Days, rows=Shifts
-                                        # We need to sum the boolean trues for this day column
-                                        try:
-                                            # The override DF index is ['Morning', 'Afternoon', 'Night', 'DoubleM', 'DoubleN']
-                                            # We just count how many checkmarks are True for this column
-                                            day_vals = ov_data[clean_d]
-                                            
-                                            # LOGIC CHANGE: 
-                                            # If employee marked ANY shift in a day (Morning AND/OR Night) -> Availability = 1
-                                            # Because they can only be assigned once per day.
-                                            if day_vals.any():
-                                                total_marked += 1
-                                        except:
-                                            pass
-                                    else:
-                                        # Use File Data
-                                        val = str(row[s_col]).lower()
-                                        if 'nan' not in val:
-                                            # Using keywords check implies availability.
-                                            # If ANY keyword exists, it's a "Yes" for this day.
-                                            is_avail_day = False
-                                            if 'בוקר' in val or 'morning' in val: is_avail_day = True
-                                            if 'צהריים' in val or 'afternoon' in val: is_avail_day = True
-                                            if 'לילה' in val or 'night' in val: is_avail_day = True
-                                            
-                                            if is_avail_day:
-                                                total_marked += 1
-                                
-                                emp_availability[ename] = total_marked
+                            shifts_to_use_dashboard = st.session_state.get('selected_shifts', potential_shifts)
+                            dashboard_avail = availability.build_availability(active_emp_df, shifts_to_use_dashboard, collected_overrides)
+                            emp_availability = dict(zip(active_emp_df[name_col], availability.available_days_count(dashboard_avail).tolist()))
 
                             # 2. Build Analysis DataFrame
                             # Group roster by employee
@@ -1199,6 +1453,39 @@ if st.session_state.get('employees_df') is not None:
                                         "כמות חסרה": st.column_config.NumberColumn("כמות חסרה", format="%d ❌")
                                     }
                                 )
+
+                                # View 3: Root causes - min-cut of each day's availability / eligibility network
+                                st.markdown("##### 3. סיבות שורש (צווארי בקבוק)")
+                                if 'shortage_causes' not in results:
+                                    results['shortage_causes'] = scheduler.analyze_shortage_causes(
+                                        df_solver,
+                                        st.session_state['positions'],
+                                        st.session_state['constraints'],
+                                        col_map_to_use,
+                                        shifts_to_use,
+                                        avail_overrides=current_overrides,
+                                        max_shifts_map=collected_max_shifts,
+                                        fixed_shifts_map=collected_fixed_shifts
+                                    )
+                                causes = results['shortage_causes']
+                                window_names = {w[0]: w[5] for w in scheduler.DEMAND_WINDOWS}
+                                for day, info in causes.items():
+                                    with st.expander(f"📌 {day} - חסרים {info['shortage']} גם בשיבוץ המיטבי ביותר של אותו יום"):
+                                        competing = "; ".join(f"{pos} ({', '.join(labels)})" for pos, labels in info['competing'].items())
+                                        st.markdown(f"**עמדות שמתחרות על אותה קבוצת מאבטחים:** {competing}")
+                                        st.markdown(f"**קבוצת המאבטחים ({len(info['pool'])}), כולם כבר מנוצלים:** " + ", ".join(str(n) for n in info['pool']))
+                                        if info['unlock']:
+                                            st.caption("זמינות נוספת של אחד מאלה באותו יום תאפשר כיסוי:")
+                                            st.markdown("\n".join(
+                                                f"- **{name}**: {', '.join(window_names.get(w, w) for w in windows)}"
+                                                for name, windows in info['unlock'][:15]
+                                            ))
+                                        else:
+                                            st.caption("אין מאבטחים מוסמכים נוספים לעמדות החסרות - נדרש גיוס או הסמכה.")
+                                short_days = {label.split('|')[0] for label in shortages}
+                                weekly = [d for d in shifts_to_use if d in short_days and d not in causes]
+                                if weekly:
+                                    st.info("חוסרים ב: " + ", ".join(weekly) + " - הזמינות באותו יום מספיקה; החוסר נובע ממגבלות שבועיות (מכסת משמרות, מנוחה בין משמרות).")
                             else:
                                 st.success("כל העמדות מאוישות! אין חוסרים. 👏")
                             
@@ -1250,7 +1537,44 @@ if st.session_state.get('employees_df') is not None:
                                                     st.markdown(poten_text)
                                             
                                             st.divider()
-                            
+
+                            # --- SOLVER-VERIFIED REPAIRS ---
+                            if shortages:
+                                st.divider()
+                                st.header("🛠️ הצעות תיקון מאומתות")
+                                st.caption("לכל חוסר נפתרת בעיה קטנה סביב המשבצת (שאר הסידור קפוא) שחייבת למלא אותו לפחות ביחידה אחת - כל שרשרת עומדת בכל האילוצים, כולל מכסות ומנוחה. המחיר (חוסרים אחרים, שינוי בציון) מוצג לכל הצעה.")
+                                if st.button("חשב הצעות תיקון", key="calc_repairs"):
+                                    with st.spinner("מחפש תיקונים לכל החוסרים במקביל..."):
+                                        # Queued in the shared solve pool, within its worker budget
+                                        repair_job = solve_jobs.submit_batch(
+                                            repair_suggestions.suggest_repairs,
+                                            results,
+                                            df_solver,
+                                            st.session_state['positions'],
+                                            st.session_state['constraints'],
+                                            col_map_to_use,
+                                            shifts_to_use,
+                                            avail_overrides=current_overrides,
+                                            max_shifts_map=collected_max_shifts,
+                                            fixed_shifts_map=collected_fixed_shifts,
+                                            pref_weights=collected_pref_weights
+                                        )
+                                        suggestions, repair_error = solve_jobs.wait_job(repair_job)
+                                    if repair_error is not None:
+                                        st.error(f"שגיאה בחישוב הצעות התיקון: {repair_error}")
+                                    else:
+                                        results['repair_suggestions'] = suggestions
+                                for sug in results.get('repair_suggestions') or []:
+                                    with st.container():
+                                        st.markdown(f"#### 🔧 עבור: {sug['shortage']}")
+                                        if not sug['chain']:
+                                            st.caption("לא נמצא תיקון שממלא את החוסר בסביבת המשבצת - לא בוצע שינוי.")
+                                            continue
+                                        st.markdown("\n".join([f"{i}. {line}" for i, line in enumerate(sug['chain'], 1)]))
+                                        st.caption(
+                                            f"ממלא {sug['filled']} מהחוסר | שינוי בסה\"כ חוסרים: {sug['shortage_change']:+d}"
+                                            + (f" | שינוי בציון: {sug['objective_change']:+.0f}" if sug['objective_change'] is not None else "")
+                                        )
 
                         else:
                             st.info("אין נתונים להצגה (הרוסטר ריק)")
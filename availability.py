@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+# Last axis of the availability array - same order as the rows of the per-employee editor
+# (0=M, 1=A, 2=N, 3=DoubleM, 4=DoubleN)
+AVAILABILITY_CODES = ('M', 'A', 'N', 'DM', 'DN')
+
+# Keywords of each single shift in the sheet cells (matched case-insensitively)
+SHIFT_KEYWORDS = {
+    'M': ('בוקר', 'morning'),
+    'A': ('צהריים', 'afternoon'),
+    'N': ('לילה', 'night'),
+}
+
+
+def parse_file_availability(employees_df, days):
+    """
+    Parses the sheet's availability cells for all employees at once.
+    Returns a bool array [employee row, day, M/A/N]; days missing from the frame are all False.
+    """
+    arr = np.zeros((len(employees_df), len(days), 3), dtype=bool)
+    present = [(j, d) for j, d in enumerate(days) if d in employees_df.columns]
+    if not present or employees_df.empty:
+        return arr
+
+    cols = [j for j, _ in present]
+    cells = employees_df[[d for _, d in present]].astype(str).apply(lambda c: c.str.lower())
+    for s_i, code in enumerate(('M', 'A', 'N')):
+        pattern = '|'.join(SHIFT_KEYWORDS[code])
+        arr[:, cols, s_i] = cells.apply(lambda c: c.str.contains(pattern, regex=True)).to_numpy(dtype=bool)
+    return arr
+
+
+def double_default_flags(employees_df, note_col=None):
+    """
+    Per employee: are doubles allowed by default on days that come from the file?
+    Always True unless a notes column is mapped, in which case it must mention a double.
+    """
+    if not note_col or note_col in ('None', 'ללא') or note_col not in employees_df.columns:
+        return np.ones(len(employees_df), dtype=bool)
+    notes = employees_df[note_col].astype(str).str.lower()
+    return notes.str.contains('double|כפולה|כן', regex=True).to_numpy(dtype=bool)
+
+
+def build_availability(employees_df, days, avail_overrides=None, note_col=None):
+    """
+    Effective availability of every employee, with the manual per-employee overrides merged in.
+
+    Returns a dict with:
+      'array'          - bool [employee row, day, M/A/N/DM/DN]
+      'from_override'  - bool [employee row, day]: the day comes from a manual override
+                         (such days must NOT get automatic doubles)
+      'row'            - {df index: employee row}
+      'days'           - the days, in order
+    File days get DM/DN from double_default_flags; override days take exactly what the user
+    set (0=M, 1=A, 2=N, 3=DoubleM, 4=DoubleN).
+    """
+    days = list(days)
+    n_emp = len(employees_df)
+    arr = np.zeros((n_emp, len(days), len(AVAILABILITY_CODES)), dtype=bool)
+    from_override = np.zeros((n_emp, len(days)), dtype=bool)
+
+    arr[:, :, :3] = parse_file_availability(employees_df, days)
+    in_file = np.array([d in employees_df.columns for d in days], dtype=bool)
+    doubles = double_default_flags(employees_df, note_col)
+    arr[:, :, 3] = doubles[:, None] & in_file[None, :]
+    arr[:, :, 4] = arr[:, :, 3]
+
+    row = {idx: i for i, idx in enumerate(employees_df.index)}
+    for idx, override_df in (avail_overrides or {}).items():
+        i = row.get(idx)
+        if i is None or override_df is None or not hasattr(override_df, 'columns'):
+            continue
+        for j, d in enumerate(days):
+            day_label = str(d).strip()
+            if day_label not in override_df.columns:
+                continue
+            arr[i, j] = False
+            try:
+                vals = override_df[day_label].tolist()
+                if len(vals) >= 3:
+                    arr[i, j, :3] = [bool(v) for v in vals[:3]]
+                if len(vals) >= 5:
+                    arr[i, j, 3:] = [bool(v) for v in vals[3:5]]
+                from_override[i, j] = True
+            except Exception:
+                arr[i, j] = False
+
+    return {'array': arr, 'from_override': from_override, 'row': row, 'days': days}
+
+
+def editor_frame(file_avail, i, days, row_labels):
+    """
+    Initial table of the per-employee availability editor (rows M, A, N, DoubleM, DoubleN,
+    one column per day) for employee row i of parse_file_availability(...). Doubles start unchecked.
+    """
+    data = {str(d).strip(): [bool(v) for v in file_avail[i, j]] + [False, False] for j, d in enumerate(days)}
+    return pd.DataFrame(data, index=row_labels)
+
+
+def available_days_count(avail):
+    """
+    Days each employee marked as available: any shift (doubles included) on override days,
+    any of M/A/N on file days. Returns an int array per employee row.
+    """
+    arr = avail['array']
+    marked = np.where(avail['from_override'], arr.any(axis=2), arr[:, :, :3].any(axis=2))
+    return marked.sum(axis=1)
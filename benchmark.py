@@ -0,0 +1,310 @@
+"""
+Benchmark harness for the roster solver.
+
+Generates seeded synthetic availability sheets (same layout data_manager.load_data reads:
+'עובדים' / 'תפקידים' / 'הערות' columns, one column per day with Hebrew shift keywords),
+solves them with solve_roster under fixed solve profiles and appends one CSV row per run:
+build / solve time, objective, shortages, model size and peak RSS, tagged with the git
+commit - so a CSV collected over several commits compares them directly.
+
+    python benchmark.py                                   # default size sweep, 'quick' profile
+    python benchmark.py --sizes 20x5x7,500x40x14 --profiles quick,balanced --seeds 0,1
+    python benchmark.py --grid --employees 20,200,2000 --positions 5,50,150 --days 7,31
+"""
+import argparse
+import csv
+import datetime
+import io
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import time
+
+import pandas as pd
+
+# (employees, positions, days) - from a small team up to a large multi-site month
+DEFAULT_SWEEP = (
+    (20, 5, 7),
+    (50, 8, 7),
+    (100, 15, 14),
+    (250, 30, 14),
+    (500, 50, 31),
+    (1000, 100, 31),
+    (2000, 150, 31),
+)
+DEFAULT_PROFILES = ('quick',)
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results.csv")
+
+DAY_NAMES = ('א', 'ב', 'ג', 'ד', 'ה', 'ו', 'ש')
+FIRST_DAY = datetime.date(2025, 1, 5)  # a Sunday, so the labels start at 'א'
+POSITIONS_PER_SITE = 5
+DEMAND_RATIO = 0.9  # demanded shifts / shifts the guards can work - a little short, like most real weeks
+
+# Availability cell texts, in the spellings found in real sheets
+CELL_TEXTS = {
+    ('M',): ('בוקר', 'בוקר', 'morning'),
+    ('A',): ('צהריים', 'צהריים'),
+    ('N',): ('לילה', 'לילה', 'Night'),
+    ('M', 'A'): ('בוקר, צהריים', 'בוקר/צהריים'),
+    ('A', 'N'): ('צהריים, לילה', 'צהריים / לילה'),
+    ('M', 'N'): ('בוקר + לילה',),
+}
+UNAVAILABLE_TEXTS = ('', '', 'לא זמין', '-')
+
+CSV_FIELDS = (
+    'commit', 'timestamp', 'employees', 'positions', 'days', 'seed', 'profile', 'engine', 'status',
+    'parse_seconds', 'build_seconds', 'solve_seconds', 'post_seconds', 'total_seconds',
+    'objective', 'best_bound', 'shortages', 'assignments', 'variables', 'constraints', 'pruned_vars',
+    'peak_rss_mb', 'ortools', 'python', 'cpus',
+)
+
+
+def day_labels(n_days):
+    """Day column labels as they appear in the sheets: 'א 05/01', 'ב 06/01', ..."""
+    return [f"{DAY_NAMES[i % 7]} {(FIRST_DAY + datetime.timedelta(days=i)).strftime('%d/%m')}" for i in range(n_days)]
+
+
+def synthetic_instance(n_employees, n_positions, n_days, seed=0):
+    """
+    A reproducible solve_roster input. Positions are grouped into sites of POSITIONS_PER_SITE;
+    most guards hold one to three roles of their home site, some also one elsewhere. Every
+    guard marks about 60% of the days (one or two shifts), a fifth note that they take doubles,
+    and a few get manual overrides, max_shifts limits or an iron shift. Guard counts follow
+    DEMAND_RATIO.
+    Returns a dict with the solve_roster arguments: employees_df, positions, constraints,
+    col_map, shifts, avail_overrides, max_shifts_map, fixed_shifts_map, pref_weights.
+    """
+    rnd = random.Random(f"{n_employees}x{n_positions}x{n_days}/{seed}")
+    days = day_labels(n_days)
+    pos_names = [f"אתר {i // POSITIONS_PER_SITE + 1} - עמדה {i % POSITIONS_PER_SITE + 1}" for i in range(n_positions)]
+    sites = [pos_names[i:i + POSITIONS_PER_SITE] for i in range(0, n_positions, POSITIONS_PER_SITE)]
+    cell_options = list(CELL_TEXTS.items())
+    cell_weights = [6, 4, 5, 1, 1, 1]
+
+    rows = []
+    roles_of = []
+    for e in range(n_employees):
+        site = sites[e % len(sites)]
+        roles = rnd.sample(site, rnd.randint(1, min(3, len(site))))
+        if len(sites) > 1 and rnd.random() < 0.15:
+            roles.append(rnd.choice(rnd.choice(sites)))
+        roles = list(dict.fromkeys(roles))
+        roles_of.append(roles)
+        row = {'עובדים': f"עובד {e + 1:04d}", 'תפקידים': ", ".join(roles),
+               'הערות': rnd.choice(('כפולה', 'כן לכפולות')) if rnd.random() < 0.2 else ''}
+        for d in days:
+            if rnd.random() < 0.6:
+                _, texts = rnd.choices(cell_options, weights=cell_weights)[0]
+                row[d] = rnd.choice(texts)
+            else:
+                row[d] = rnd.choice(UNAVAILABLE_TEXTS)
+        rows.append(row)
+    employees_df = pd.DataFrame(rows)
+
+    # Demand is sized to DEMAND_RATIO of what the guards can give per day (availability and
+    # max_shifts both cap it), so every size is similarly tight
+    per_day = n_employees * min(0.6, 5.5 / n_days) * DEMAND_RATIO / n_positions
+
+    def _guards(share):
+        return max(0, round(per_day * share * rnd.uniform(0.6, 1.4)))
+
+    positions = []
+    for i, name in enumerate(pos_names):
+        positions.append({
+            'id': f"pos-{i}",
+            'name': name,
+            'guards_morning': max(1, _guards(0.45)),
+            'guards_afternoon': _guards(0.35),
+            'guards_night': _guards(0.2),
+            'priority': rnd.randint(1, 10),
+            'priority_morning': 1,
+            'priority_afternoon': rnd.randint(1, 3),
+            'priority_night': rnd.randint(1, 2),
+            'active_shifts': {d: {'M': True, 'A': True, 'N': DAY_NAMES.index(d[0]) != 6 or rnd.random() < 0.5}
+                              for d in days},
+        })
+
+    # Manual overrides: the per-employee editor's frame (rows M, A, N, DM, DN; one column per day)
+    avail_overrides = {}
+    for e in rnd.sample(range(n_employees), max(1, n_employees // 30)):
+        changed = rnd.sample(days, min(2, n_days))
+        avail_overrides[e] = pd.DataFrame({d: [rnd.random() < 0.5 for _ in range(5)] for d in changed})
+
+    max_shifts_map = {e: rnd.randint(2, 5) for e in range(n_employees) if rnd.random() < 0.3}
+
+    fixed_shifts_map = {}
+    for e in rnd.sample(range(n_employees), max(1, n_employees // 50)):
+        fixed_shifts_map[e] = [{'day': rnd.choice(days), 'shift': rnd.choice(('M', 'A', 'N')),
+                                'pos_name': rnd.choice(roles_of[e])}]
+
+    pref_weights = {e: {p: rnd.randint(0, 10) for p in roles_of[e]} for e in range(n_employees) if rnd.random() < 0.3}
+
+    return {
+        'employees_df': employees_df,
+        'positions': positions,
+        'constraints': {"no_overlap": True, "no_back_to_back": True, "min_rest": 8, "allow_double": True},
+        'col_map': {'name': 'עובדים', 'pos': 'תפקידים', 'note': 'הערות'},
+        'shifts': days,
+        'avail_overrides': avail_overrides,
+        'max_shifts_map': max_shifts_map,
+        'fixed_shifts_map': fixed_shifts_map,
+        'pref_weights': pref_weights,
+    }
+
+
+def to_excel(employees_df, path_or_buffer, title="דוח זמינות"):
+    """
+    Writes a generated sheet as an uploadable Excel file (title row above the header, like the
+    real ones). The title must not contain the header keyword load_data searches for.
+    """
+    with pd.ExcelWriter(path_or_buffer, engine='openpyxl') as writer:
+        pd.DataFrame([[title]]).to_excel(writer, index=False, header=False)
+        employees_df.to_excel(writer, index=False, startrow=2)
+
+
+def through_load_data(employees_df):
+    """The generated sheet as the app sees it: written to Excel and read back with load_data."""
+    from data_manager import load_data
+
+    buffer = io.BytesIO()
+    to_excel(employees_df, buffer)
+    buffer.seek(0)
+    df, info = load_data(buffer)
+    if df is None:
+        raise ValueError(f"load_data rejected the generated sheet: {info}")
+    return df.reset_index(drop=True)
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or 'unknown'
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+
+
+def run_case(case):
+    """
+    Generates and solves one (employees, positions, days, seed, profile) case; returns its CSV
+    row. Runs in a fresh process (see run_benchmark), so peak_rss_mb belongs to this case only.
+    """
+    from ortools import __version__ as ortools_version
+
+    import scheduler
+    from solve_metrics import peak_rss_mb
+
+    instance = synthetic_instance(case['employees'], case['positions'], case['days'], case['seed'])
+    if case.get('via_excel'):
+        instance['employees_df'] = through_load_data(instance['employees_df'])
+
+    t0 = time.perf_counter()
+    result = scheduler.solve_roster(
+        instance['employees_df'], instance['positions'], instance['constraints'], instance['col_map'],
+        instance['shifts'], avail_overrides=instance['avail_overrides'], pref_weights=instance['pref_weights'],
+        max_shifts_map=instance['max_shifts_map'], fixed_shifts_map=instance['fixed_shifts_map'],
+        solve_profile=case['profile'], engine=case['engine'], max_search_workers=case['search_workers']
+    )
+    total = time.perf_counter() - t0
+
+    metrics = result.get('metrics') or {'phases': {}, 'model': None}
+    phases = {name: p['seconds'] for name, p in metrics['phases'].items()}
+    stats = result.get('solve_stats') or {}
+    model = metrics.get('model') or {}
+    roster = result.get('roster')
+    return {
+        'commit': case['commit'],
+        'timestamp': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'employees': case['employees'],
+        'positions': case['positions'],
+        'days': case['days'],
+        'seed': case['seed'],
+        'profile': case['profile'],
+        'engine': metrics.get('engine', case['engine']),
+        'status': result.get('status'),
+        'parse_seconds': phases.get('parse'),
+        'build_seconds': round(phases.get('presolve', 0) + phases.get('build', 0), 4),
+        'solve_seconds': phases.get('solve'),
+        'post_seconds': round(sum(v for k, v in phases.items() if k not in ('parse', 'presolve', 'build', 'solve')), 4),
+        'total_seconds': round(total, 4),
+        'objective': stats.get('objective'),
+        'best_bound': stats.get('best_bound'),
+        'shortages': sum(result.get('shortage_summary', {}).values()) if roster is not None else None,
+        'assignments': int((roster['raw_shift'] != 'SHORTAGE').sum()) if roster is not None else None,
+        'variables': model.get('variables'),
+        'constraints': model.get('constraints'),
+        'pruned_vars': model.get('pruned_vars'),
+        'peak_rss_mb': peak_rss_mb(),
+        'ortools': ortools_version,
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run_benchmark(sizes=DEFAULT_SWEEP, profiles=DEFAULT_PROFILES, seeds=(0,), output=DEFAULT_OUTPUT,
+                  engine='auto', search_workers=1, via_excel=False, echo=print):
+    """
+    Solves every size x profile x seed case, one at a time, each in its own process, and
+    appends the rows to the CSV at output (the header is written once, when the file is new).
+    search_workers defaults to 1 so timings do not depend on the machine's core count.
+    Returns the rows as a DataFrame.
+    """
+    commit = git_commit()
+    cases = [
+        {'employees': n_emp, 'positions': n_pos, 'days': n_days, 'seed': seed, 'profile': profile,
+         'engine': engine, 'search_workers': search_workers, 'via_excel': via_excel, 'commit': commit}
+        for n_emp, n_pos, n_days in sizes for profile in profiles for seed in seeds
+    ]
+    rows = []
+    new_file = not os.path.exists(output)
+    ctx = multiprocessing.get_context('spawn')
+    with open(output, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        if new_file:
+            writer.writeheader()
+        for case in cases:
+            with ctx.Pool(1, maxtasksperchild=1) as pool:
+                row = pool.apply(run_case, (case,))
+            writer.writerow(row)
+            f.flush()
+            rows.append(row)
+            if echo:
+                echo(f"{row['employees']}x{row['positions']}x{row['days']} seed={row['seed']} {row['profile']}: "
+                     f"{row['status']} build {row['build_seconds']}s, solve {row['solve_seconds']}s, "
+                     f"shortages {row['shortages']}, peak {row['peak_rss_mb']} MB")
+    return pd.DataFrame(rows, columns=CSV_FIELDS)
+
+
+def _ints(text):
+    return [int(v) for v in text.split(',') if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Roster solver benchmark on seeded synthetic instances")
+    parser.add_argument('--sizes', help="comma-separated EMPLOYEESxPOSITIONSxDAYS cases (default: the built-in sweep)")
+    parser.add_argument('--grid', action='store_true', help="every combination of --employees / --positions / --days")
+    parser.add_argument('--employees', default="20,200,2000")
+    parser.add_argument('--positions', default="5,50,150")
+    parser.add_argument('--days', default="7,31")
+    parser.add_argument('--profiles', default=",".join(DEFAULT_PROFILES), help="solve profiles, e.g. quick,balanced")
+    parser.add_argument('--seeds', default="0")
+    parser.add_argument('--engine', default='auto', choices=('auto', 'cp_sat', 'flow', 'greedy'))
+    parser.add_argument('--search-workers', type=int, default=1)
+    parser.add_argument('--via-excel', action='store_true', help="round-trip every sheet through load_data")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+
+    if args.grid:
+        sizes = [(e, p, d) for e in _ints(args.employees) for p in _ints(args.positions) for d in _ints(args.days)]
+    elif args.sizes:
+        sizes = [tuple(int(v) for v in case.lower().split('x')) for case in args.sizes.split(',')]
+    else:
+        sizes = DEFAULT_SWEEP
+    run_benchmark(sizes, [p.strip() for p in args.profiles.split(',')], _ints(args.seeds), args.output,
+                  args.engine, args.search_workers, args.via_excel)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import scenarios
+import scheduler
+
+# Set in every pool worker by _init_worker - pickled once per process, not once per search
+_shared = None
+
+
+def shortage_cells(result):
+    """{(day, position name): [shortage labels]} of a solved result, in shortage_summary order."""
+    cells = {}
+    for label in result.get('shortage_summary', {}):
+        parts = label.split('|')
+        if len(parts) >= 3:
+            cells.setdefault((parts[0], parts[1]), []).append(label)
+    return cells
+
+
+def neighbourhood(roster, parsed, positions, day, pos_name, radius=0, shifts=None):
+    """
+    Free (day, position name) cells of the search around one shortage: the short position
+    plus every position worked that day by someone qualified for it (they may move over and
+    be replaced), on day +- radius days.
+    """
+    emp_list, elig = parsed
+    p_idx = next((i for i, p in enumerate(positions) if p['name'] == pos_name), None)
+    rows_by_name = {}
+    for e_i, e in enumerate(emp_list):
+        rows_by_name.setdefault(str(e['name']), []).append(e_i)
+
+    open_positions = {pos_name}
+    worked = roster[(roster['raw_shift'] != 'SHORTAGE') & (roster['יום'] == day)]
+    for emp_name, worked_pos in zip(worked['עובד'], worked['עמדה']):
+        if p_idx is not None and any(elig['qualified'][e_i, p_idx] for e_i in rows_by_name.get(str(emp_name), [])):
+            open_positions.add(worked_pos)
+
+    days = [day]
+    if radius and shifts and day in shifts:
+        i = list(shifts).index(day)
+        days = list(shifts)[max(0, i - radius):i + radius + 1]
+    return {(d, p) for d in days for p in open_positions}
+
+
+def plain_objective(result):
+    """Objective of a repair-mode result without the stability bonus (None when unsolved)."""
+    objective = (result.get('solve_stats') or {}).get('objective')
+    if objective is None or result.get('repair_stats') is None:
+        return None
+    return objective - scheduler.REPAIR_STABILITY_BONUS * result['repair_stats'].get('kept', 0)
+
+
+def repair_steps(before, after):
+    """
+    The moves that turn roster `before` into `after` (non-shortage rows only), per day:
+    'swap' (two employees trade positions), 'move' (same employee, other position / shift),
+    'assign' (newly on shift) and 'unassign'. Each step is a dict with 'action', 'day',
+    'employee', 'from' / 'to' ((position, shift) or None) and, for swaps, 'other'.
+    """
+    def _cells(roster):
+        rows = roster[roster['raw_shift'] != 'SHORTAGE']
+        return {(str(n), d): (p, s) for n, d, p, s in zip(rows['עובד'], rows['יום'], rows['עמדה'], rows['משמרת'])}
+
+    old, new = _cells(before), _cells(after)
+    changed = sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+    steps = []
+    done = set()
+    for name, day in changed:
+        if (name, day) in done:
+            continue
+        src, dst = old.get((name, day)), new.get((name, day))
+        if src and dst:
+            # Swap: the employee now working src came from dst
+            partner = next((other for (other, d) in changed
+                            if d == day and other != name and (other, d) not in done
+                            and old.get((other, d)) == dst and new.get((other, d)) == src), None)
+            if partner is not None:
+                done.update({(name, day), (partner, day)})
+                steps.append({'action': 'swap', 'day': day, 'employee': name, 'other': partner, 'from': src, 'to': dst})
+                continue
+        done.add((name, day))
+        action = 'move' if src and dst else ('assign' if dst else 'unassign')
+        steps.append({'action': action, 'day': day, 'employee': name, 'from': src, 'to': dst})
+    return steps
+
+
+def describe_step(step):
+    """One line of a repair chain, in the roster's language."""
+    name, day = step['employee'], step['day']
+    if step['action'] == 'swap':
+        return f"{day}: החלף בין {name} ({step['from'][0]}) ל-{step['other']} ({step['to'][0]})"
+    if step['action'] == 'move':
+        return f"{day}: העבר את {name} מ-{step['from'][0]} ({step['from'][1]}) ל-{step['to'][0]} ({step['to'][1]})"
+    if step['action'] == 'assign':
+        return f"{day}: שבץ את {name} ב-{step['to'][0]} ({step['to'][1]})"
+    return f"{day}: הורד את {name} מ-{step['from'][0]} ({step['from'][1]})"
+
+
+def _search(employees_df, positions, constraints, col_map, shifts, parsed, roster, search, solve_kwargs):
+    free_cells, shortage_caps = search
+    return scheduler.solve_roster(
+        employees_df, positions, constraints, col_map, shifts, parsed=parsed,
+        repair_from=roster, repair_free_cells=free_cells, shortage_caps=shortage_caps, **solve_kwargs
+    )
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _search_in_worker(search):
+    return _search(search=search, **_shared)
+
+
+def suggest_repairs(result, employees_df, positions, constraints, col_map, shifts, avail_overrides=None,
+                    max_shifts_map=None, fixed_shifts_map=None, radius=0, max_workers=None, **solve_kwargs):
+    """
+    Repair suggestions for every shortage of a solved result: a small repair-mode CP-SAT search
+    (see scheduler.repair_roster) around each short (day, position) cell - everything outside
+    neighbourhood() stays frozen - that must cover at least one more unit of that shortage
+    (shortage_caps), run in parallel worker processes. The solver checks every rule
+    (availability, qualifications, max_shifts, rest), so each chain is feasible as is; its
+    price may be other shortages or a lower objective elsewhere.
+    solve_kwargs go to every solve_roster call (pref_weights, solve_profile - 'quick' by default).
+
+    Returns one dict per shortage label, in shortage_summary order:
+      'shortage', 'day', 'position' - the shortage
+      'status'          - CP-SAT status of the search (INFEASIBLE: no repair in the neighbourhood)
+      'steps' / 'chain' - repair_steps() moves and their descriptions (empty: no repair found)
+      'filled'          - units of this shortage the chain covers
+      'shortage_change' - change in the roster's total shortage (other shortages may grow)
+      'objective_change'- change in the roster objective (shortage penalties, shifts,
+                          preferences) - negative when the repair costs more than it gains
+    """
+    roster = result.get('roster')
+    cells = shortage_cells(result)
+    if roster is None or not cells:
+        return []
+
+    parsed = scenarios.parse_base(employees_df, positions, col_map, shifts, avail_overrides, max_shifts_map, fixed_shifts_map)
+    solve_kwargs.setdefault('solve_profile', 'quick')
+    # Identities matter and every previous assignment must stay representable
+    solve_kwargs.update({'engine': 'cp_sat', 'objective_mode': 'weighted', 'prune': False, 'calc_potentials': False})
+
+    shortage = result.get('shortage_summary', {})
+    targets = []  # (day, position, label, free cells)
+    for day, pos_name in cells:
+        free_cells = neighbourhood(roster, parsed, positions, day, pos_name, radius, shifts)
+        targets.extend((day, pos_name, label, free_cells) for label in cells[(day, pos_name)])
+    # The first search frees nothing: it prices the current roster under the same model.
+    # Every other one must leave its shortage at least one unit smaller.
+    searches = [(set(), None)] + [
+        (free_cells, {label: shortage.get(label, 0) - 1}) for _, _, label, free_cells in targets
+    ]
+
+    cpu = os.cpu_count() or 1
+    workers = min(max_workers or cpu, len(searches))
+    solve_kwargs['max_search_workers'] = max(1, (solve_kwargs.get('max_search_workers') or cpu) // max(1, workers))
+    shared = {
+        'employees_df': employees_df, 'positions': positions, 'constraints': constraints, 'col_map': col_map,
+        'shifts': shifts, 'parsed': parsed, 'roster': roster, 'solve_kwargs': solve_kwargs,
+    }
+    if workers <= 1:
+        outcomes = [_search(search=search, **shared) for search in searches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as pool:
+            outcomes = list(pool.map(_search_in_worker, searches))
+
+    base, repaired = outcomes[0], outcomes[1:]
+    base_objective = plain_objective(base)
+    base_shortage = base.get('shortage_summary') if base.get('roster') is not None else shortage
+
+    suggestions = []
+    for (day, pos_name, label, _), outcome in zip(targets, repaired):
+        new_roster = outcome.get('roster')
+        steps = repair_steps(roster, new_roster) if new_roster is not None else []
+        new_shortage = outcome.get('shortage_summary', base_shortage) if new_roster is not None else base_shortage
+        objective = plain_objective(outcome)
+        suggestions.append({
+            'shortage': label,
+            'day': day,
+            'position': pos_name,
+            'status': outcome.get('status'),
+            'steps': steps,
+            'chain': [describe_step(s) for s in steps],
+            'filled': base_shortage.get(label, 0) - new_shortage.get(label, 0),
+            'shortage_change': sum(new_shortage.values()) - sum(base_shortage.values()),
+            'objective_change': (objective - base_objective
+                                 if objective is not None and base_objective is not None else None),
+        })
+    return suggestions
@@ -0,0 +1,134 @@
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import scheduler
+
+# Guard-count key of each demand window in a position dict
+GUARD_KEYS = {'M': 'guards_morning', 'A': 'guards_afternoon', 'N': 'guards_night'}
+BASE_SCENARIO_NAME = "בסיס (ללא שינוי)"
+
+# Set in every pool worker by _init_worker - pickled once per process, not once per scenario
+_shared = None
+
+
+def parse_base(employees_df, positions, col_map, shifts, avail_overrides=None, max_shifts_map=None,
+               fixed_shifts_map=None):
+    """
+    Parses the employees once for a whole batch: (emp_list, elig) as solve_roster(parsed=...)
+    expects it. Scenario deltas never change position names or the days, so it stays valid.
+    """
+    emp_list = scheduler.parse_employees(employees_df, col_map, shifts, avail_overrides, max_shifts_map, fixed_shifts_map)
+    return emp_list, scheduler.build_eligibility_index(emp_list, positions, shifts)
+
+
+def _without_employees(parsed, names):
+    """The shared (emp_list, elig) restricted to the employees not named in names."""
+    emp_list, elig = parsed
+    keep = [i for i, e in enumerate(emp_list) if str(e['name']) not in names]
+    kept = [emp_list[i] for i in keep]
+    ids = {e['id'] for e in kept}
+    return kept, {
+        'qualified': elig['qualified'][keep],
+        'fixed': {f for f in elig['fixed'] if f[0] in ids},
+        'fixed_any': {f for f in elig['fixed_any'] if f[0] in ids},
+        'emp_row': {e['id']: i for i, e in enumerate(kept)},
+        'day_index': elig['day_index'],
+    }
+
+
+def apply_scenario(positions, constraints, parsed, scenario):
+    """
+    Applies one scenario's deltas to the base inputs (the inputs are not modified):
+      'guards'      - {position name: {'M' / 'A' / 'N': +n / -n guards}}
+      'constraints' - constraint overrides, e.g. {'allow_double': True}
+      'exclude'     - employee names to leave out
+    Returns (positions, constraints, parsed). Raises ValueError for unknown positions / employees.
+    """
+    positions = copy.deepcopy(positions)
+    by_name = {p['name']: p for p in positions}
+    for pos_name, deltas in scenario.get('guards', {}).items():
+        if pos_name not in by_name:
+            raise ValueError(f"Scenario {scenario.get('name')}: unknown position {pos_name}")
+        for code, delta in deltas.items():
+            key = GUARD_KEYS[code]
+            by_name[pos_name][key] = max(0, by_name[pos_name][key] + delta)
+
+    constraints = {**constraints, **scenario.get('constraints', {})}
+
+    exclude = {str(n) for n in scenario.get('exclude', [])}
+    if exclude:
+        unknown = exclude - {str(e['name']) for e in parsed[0]}
+        if unknown:
+            raise ValueError(f"Scenario {scenario.get('name')}: unknown employees {', '.join(sorted(unknown))}")
+        parsed = _without_employees(parsed, exclude)
+    return positions, constraints, parsed
+
+
+def _solve_scenario(employees_df, positions, constraints, col_map, shifts, parsed, scenario, solve_kwargs):
+    positions, constraints, parsed = apply_scenario(positions, constraints, parsed, scenario)
+    t0 = time.perf_counter()
+    result = scheduler.solve_roster(employees_df, positions, constraints, col_map, shifts, parsed=parsed, **solve_kwargs)
+    return result, time.perf_counter() - t0
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _solve_in_worker(scenario):
+    return _solve_scenario(scenario=scenario, **_shared)
+
+
+def scenario_row(name, result, runtime):
+    """One line of the comparison table."""
+    roster = result.get('roster')
+    return {
+        'תרחיש': name,
+        'סטטוס': result.get('status'),
+        'חוסרים': sum(result.get('shortage_summary', {}).values()) if roster is not None else None,
+        'סה"כ משמרות': int((roster['raw_shift'] != 'SHORTAGE').sum()) if roster is not None else None,
+        'זמן ריצה (שניות)': round(runtime, 2),
+    }
+
+
+def run_scenarios(employees_df, positions, constraints, col_map, shifts, scenarios, avail_overrides=None,
+                  max_shifts_map=None, fixed_shifts_map=None, max_workers=None, include_base=True, **solve_kwargs):
+    """
+    What-if batch: solves the base input plus every scenario (see apply_scenario for the deltas,
+    'name' labels it) side by side in worker processes. The employees are parsed once and the
+    parsed structure is shipped to each worker once. solve_kwargs go to every solve_roster call
+    (pref_weights, solve_profile, ...).
+
+    Returns {'table': comparison DataFrame (one row per scenario, shortages / total shifts /
+    runtime, plus the change in shortages against the base), 'results': {name: result}}.
+    """
+    parsed = parse_base(employees_df, positions, col_map, shifts, avail_overrides, max_shifts_map, fixed_shifts_map)
+    batch = ([{'name': BASE_SCENARIO_NAME}] if include_base else []) + list(scenarios)
+    names = [s.get('name') or f"תרחיש {i + 1}" for i, s in enumerate(batch)]
+    # Validate every scenario before starting any solve
+    for s in batch:
+        apply_scenario(positions, constraints, parsed, s)
+
+    cpu = os.cpu_count() or 1
+    workers = min(max_workers or cpu, len(batch))
+    solve_kwargs['max_search_workers'] = max(1, (solve_kwargs.get('max_search_workers') or cpu) // max(1, workers))
+    shared = {
+        'employees_df': employees_df, 'positions': positions, 'constraints': constraints, 'col_map': col_map,
+        'shifts': shifts, 'parsed': parsed, 'solve_kwargs': solve_kwargs,
+    }
+    if workers <= 1:
+        outcomes = [_solve_scenario(scenario=s, **shared) for s in batch]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as pool:
+            outcomes = list(pool.map(_solve_in_worker, batch))
+
+    rows = [scenario_row(name, result, runtime) for name, (result, runtime) in zip(names, outcomes)]
+    table = pd.DataFrame(rows)
+    if include_base and rows[0]['חוסרים'] is not None:
+        table['שינוי בחוסרים'] = table['חוסרים'] - rows[0]['חוסרים']
+    return {'table': table, 'results': {name: result for name, (result, _) in zip(names, outcomes)}}
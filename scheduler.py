@@ -1,283 +1,1570 @@
+import copy
+import functools
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 from ortools.sat.python import cp_model
+import numpy as np
 import pandas as pd
 
-def solve_roster(employees_df, positions, constraints, col_map, shifts, avail_overrides=None, pref_weights=None, max_shifts_map=None, fixed_shifts_map=None, calc_potentials=False):
+from availability import build_availability
+from shift_templates import DEMAND_WINDOWS, compile_coverage, interval_minutes, rest_conflicts
+from solve_metrics import PhaseTimer, append_metrics_log, build_metrics, merge_metrics
+
+
+def _parse_roles(pos_str):
+    """Split an employee's comma separated roles into normalized (stripped, lower-cased) tokens."""
+    pos_str = str(pos_str) if pos_str else ""
+    return [r.strip().lower() for r in pos_str.split(',') if r.strip()]
+
+
+def _is_qualified(emp_roles, norm_pos_name):
+    """Flexible containment match between an employee's roles and a position name."""
+    if 'all' in emp_roles:
+        return True
+    # 1. Exact token match
+    if norm_pos_name in emp_roles:
+        return True
+    # 2. Substring match (e.g. "Security" in "Head of Security"), in either direction
+    return any(norm_pos_name in r or r in norm_pos_name for r in emp_roles)
+
+
+def build_eligibility_index(emp_list, positions, shifts):
     """
-    Main solver function with updated Double Shift logic.
-    Double Morning (DM): 07:00-19:00 (Covers M + First half A)
-    Double Night (DN): 19:00-07:00 (Covers Second half A + N)
+    Precomputes everything the model build needs to know about who may work where.
+    Built once per solve so the variable-creation loop (and the post-solve passes)
+    only do lookups instead of re-parsing role strings and rescanning fixed shifts.
+
+    Returns a dict with:
+      'qualified'  - bool matrix [employee row, position idx] from the role strings
+      'fixed'      - set of (emp_id, day, pos_name, shift) iron shifts
+      'fixed_any'  - set of (emp_id, day, pos_name) with at least one iron shift
+      'emp_row'    - {emp_id: row in the matrix}
+      'day_index'  - {day: position in shifts}
+    """
+    norm_pos_names = [p['name'].strip().lower() for p in positions]
+    qualified = np.zeros((len(emp_list), len(positions)), dtype=bool)
+    fixed = set()
+    fixed_any = set()
+
+    # Cache by raw role string - many guards share the exact same roles cell
+    role_cache = {}
+    for e_i, e in enumerate(emp_list):
+        pos_str = e['pos']
+        row = role_cache.get(pos_str)
+        if row is None:
+            emp_roles = _parse_roles(pos_str)
+            row = np.array([_is_qualified(emp_roles, n) for n in norm_pos_names], dtype=bool)
+            role_cache[pos_str] = row
+        qualified[e_i] = row
+
+        for f in e.get('fixed_shifts', []):
+            fixed.add((e['id'], f['day'], f['pos_name'], f['shift']))
+            fixed_any.add((e['id'], f['day'], f['pos_name']))
+
+    return {
+        'qualified': qualified,
+        'fixed': fixed,
+        'fixed_any': fixed_any,
+        'emp_row': {e['id']: e_i for e_i, e in enumerate(emp_list)},
+        'day_index': {d: i for i, d in enumerate(shifts)},
+    }
+
+
+SHIFT_DISPLAY_NAMES = {
+    'M': 'בוקר (07-15)',
+    'A': 'צהריים (15-23)',
+    'N': 'לילה (23-07)',
+    'DM': 'כפולה בוקר (07-19)',
+    'DN': 'כפולה לילה (19-07)',
+}
+
+
+# Named CP-SAT parameter sets. 'auto' picks one of these from the model size.
+SOLVE_PROFILES = {
+    'quick': {
+        'label': 'תצוגה מהירה',
+        'num_search_workers': 4,
+        'max_time_in_seconds': 5.0,
+        'relative_gap_limit': 0.05,
+        'random_seed': 0,
+    },
+    'balanced': {
+        'label': 'מאוזן',
+        'num_search_workers': 8,
+        'max_time_in_seconds': 30.0,
+        'relative_gap_limit': 0.01,
+        'random_seed': 0,
+    },
+    'exhaustive': {
+        'label': 'יסודי (עד אופטימום)',
+        'num_search_workers': 8,
+        'max_time_in_seconds': 300.0,
+        'relative_gap_limit': 0.0,
+        'random_seed': 0,
+    },
+}
+
+# Assignment-variable counts up to which 'auto' still picks the more thorough profile
+AUTO_PROFILE_THRESHOLDS = [
+    (3000, 'exhaustive'),
+    (20000, 'balanced'),
+]
+
+
+def pick_solve_profile(profile, n_vars):
+    """Resolves 'auto' (or an unknown name) to a concrete profile name based on model size."""
+    if profile in SOLVE_PROFILES:
+        return profile
+    for max_vars, name in AUTO_PROFILE_THRESHOLDS:
+        if n_vars <= max_vars:
+            return name
+    return 'quick'
+
+
+def configure_solver(solver, profile_name, max_workers=None):
+    """Applies a named solve profile to a CpSolver. max_workers caps the profile's worker count."""
+    prof = SOLVE_PROFILES[profile_name]
+    # Never ask for more workers than the machine has cores
+    workers = min(prof['num_search_workers'], os.cpu_count() or 1)
+    if max_workers:
+        workers = min(workers, max_workers)
+    solver.parameters.num_search_workers = max(1, workers)
+    solver.parameters.max_time_in_seconds = prof['max_time_in_seconds']
+    solver.parameters.relative_gap_limit = prof['relative_gap_limit']
+    solver.parameters.random_seed = prof['random_seed']
+
+
+def solve_stats(solver, status, profile_name):
+    """Summary of how the solve went: profile used, wall time and the achieved optimality gap."""
+    stats = {
+        'profile': profile_name,
+        'wall_time': round(solver.WallTime(), 3),
+        'objective': None,
+        'best_bound': None,
+        'gap': None,
+    }
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        obj = solver.ObjectiveValue()
+        bound = solver.BestObjectiveBound()
+        stats['objective'] = obj
+        stats['best_bound'] = bound
+        # OPTIMAL may still carry a small gap when relative_gap_limit > 0
+        stats['gap'] = abs(bound - obj) / max(1.0, abs(obj))
+    return stats
+
+
+# Objective bonus per kept assignment in repair mode (> max preference 10, << min slack penalty)
+REPAIR_STABILITY_BONUS = 11
+
+
+def new_assignment_store(n_units, n_pos, n_days):
+    """
+    Compact, integer-indexed store of the model's assignment variables.
+    Assignment k is (store['emp'][k], store['pos'][k], store['day'][k], store['shift'][k])
+    with variable store['vars'][k]; employee unit/position/day are index positions,
+    not names (see build_employee_units - a unit is usually a single employee). The by_* lists hold assignment indices so constraints can be built
+    without scanning the whole store.
+    """
+    return {
+        'vars': [],
+        'emp': [],
+        'pos': [],
+        'day': [],
+        'shift': [],
+        'by_emp': [[] for _ in range(n_units)],
+        'by_emp_day': [[[] for _ in range(n_days)] for _ in range(n_units)],
+        'by_pos_day': [[[] for _ in range(n_days)] for _ in range(n_pos)],
+    }
+
+
+def _new_assignment_var(model, size, name):
+    """BoolVar for a single employee, integer head-count variable for a unit of `size` employees."""
+    if size == 1:
+        return model.NewBoolVar(f"x_{name}")
+    return model.NewIntVar(0, size, f"n_{name}")
+
+
+def add_assignment(store, var, u, p_idx, d_i, s):
+    """Registers an assignment variable of employee unit u and returns its index in the store."""
+    k = len(store['vars'])
+    store['vars'].append(var)
+    store['emp'].append(u)
+    store['pos'].append(p_idx)
+    store['day'].append(d_i)
+    store['shift'].append(s)
+    store['by_emp'][u].append(k)
+    store['by_emp_day'][u][d_i].append(k)
+    store['by_pos_day'][p_idx][d_i].append(k)
+    return k
+
+
+def batch_values(solver, variables, response=None):
     """
+    Reads the values of many variables in one pass over the solver response
+    (or over `response`, e.g. a solution callback's response_proto).
+    """
+    if not variables:
+        return np.zeros(0, dtype=np.int64)
+    if response is None:
+        response = solver.ResponseProto()
+    solution = np.asarray(response.solution, dtype=np.int64)
+    return solution[np.fromiter((v.Index() for v in variables), dtype=np.int64, count=len(variables))]
+
+
+class RosterSolutionStreamer(cp_model.CpSolverSolutionCallback):
+    """
+    Publishes improving CP-SAT solutions while the search is still running.
+    on_solution(snapshot) gets {'roster', 'objective', 'best_bound', 'shortage', 'elapsed', 'solutions'};
+    'roster' is built by build_snapshot(counts, slack_values) and may be None when an intermediate
+    solution cannot be turned into a roster. Snapshots are rate-limited to one per min_interval
+    seconds of the running Solve (call reset() before reusing the streamer in another Solve);
+    the final result is always returned by solve_roster itself.
+    """
+
+    def __init__(self, on_solution, build_snapshot, assignment_vars, slack_vars, min_interval=1.0):
+        super().__init__()
+        self._on_solution = on_solution
+        self._build_snapshot = build_snapshot
+        self._assignment_vars = assignment_vars
+        self._slack_vars = slack_vars
+        self._min_interval = min_interval
+        self._last_publish = None
+        self.solutions = 0
+
+    def reset(self):
+        """Restarts the rate limit - WallTime() starts from zero in every Solve."""
+        self._last_publish = None
+
+    def on_solution_callback(self):
+        self.solutions += 1
+        if self._on_solution is None:
+            return
+        elapsed = self.WallTime()
+        if self._last_publish is not None and elapsed - self._last_publish < self._min_interval:
+            return
+        self._last_publish = elapsed
+
+        response = self.response_proto
+        counts = batch_values(None, self._assignment_vars, response).tolist()
+        slack_vals = batch_values(None, self._slack_vars, response).tolist()
+        self._on_solution({
+            'roster': self._build_snapshot(counts, slack_vals),
+            'objective': self.ObjectiveValue(),
+            'best_bound': self.BestObjectiveBound(),
+            'shortage': sum(slack_vals),
+            'elapsed': round(elapsed, 2),
+            'solutions': self.solutions,
+        })
+
+
+def watch_stop_event(solver, stop_event):
+    """
+    Stops solver's running search as soon as stop_event is set - the solve then returns the
+    best solution found so far (status FEASIBLE). Set the returned event once Solve returns.
+    """
+    done = threading.Event()
+
+    def _watch():
+        while not done.is_set():
+            if stop_event.wait(0.1):
+                solver.StopSearch()
+                return
+
+    threading.Thread(target=_watch, daemon=True).start()
+    return done
+
+
+def map_roster_to_assignments(store, emp_list, units, unit_of, positions, shifts, roster):
+    """
+    Maps the rows of an existing roster (יום / עמדה / raw_shift / עובד) onto the
+    assignment indices of the current model. Shortage rows are ignored, and rows whose
+    employee, position, day or shift no longer has a variable (not eligible / not
+    available anymore) are skipped.
+    Returns ({assignment index: number of roster rows on it}, number of roster rows considered).
+    Counts are capped at the unit size, so for single-employee units they are always 1.
+    """
+    emp_rows_by_name = {}
+    for e_i, e in enumerate(emp_list):
+        emp_rows_by_name.setdefault(str(e['name']), []).append(e_i)
+    pos_idx_by_name = {}
+    for p_idx, p in enumerate(positions):
+        pos_idx_by_name.setdefault(p['name'], []).append(p_idx)
+    day_index = {d: i for i, d in enumerate(shifts)}
+
+    var_key = {
+        (u, p_idx, d_i, s): k
+        for k, (u, p_idx, d_i, s) in enumerate(zip(store['emp'], store['pos'], store['day'], store['shift']))
+    }
+
+    matched = {}
+    n_rows = 0
+    for day, pos_name, raw_shift, emp_name in zip(
+        roster["יום"], roster["עמדה"], roster["raw_shift"], roster["עובד"]
+    ):
+        if raw_shift == 'SHORTAGE':
+            continue
+        n_rows += 1
+        d_i = day_index.get(day)
+        if d_i is None:
+            continue
+        # Same name / position may appear twice - take the first match with room left
+        candidates = (
+            var_key.get((unit_of[e_i], p_idx, d_i, raw_shift))
+            for e_i in emp_rows_by_name.get(str(emp_name), [])
+            for p_idx in pos_idx_by_name.get(pos_name, [])
+        )
+        k = next(
+            (k for k in candidates
+             if k is not None and matched.get(k, 0) < len(units[store['emp'][k]]['members'])),
+            None
+        )
+        if k is not None:
+            matched[k] = matched.get(k, 0) + 1
+
+    return matched, n_rows
+
+
+def apply_roster_hints(model, store, emp_list, units, unit_of, positions, shifts, hint_roster):
+    """
+    Warm start: maps a previous roster onto the current model's assignment variables as
+    solution hints (see map_roster_to_assignments). Every other assignment variable is
+    hinted 0 so the hint is a complete starting point.
+    Returns {'rows': hint rows considered, 'kept': rows mapped onto a variable, 'ratio': kept/rows}.
+    """
+    hinted, n_rows = map_roster_to_assignments(store, emp_list, units, unit_of, positions, shifts, hint_roster)
+
+    for k, var in enumerate(store['vars']):
+        model.AddHint(var, hinted.get(k, 0))
+
+    kept = sum(hinted.values())
+    return {
+        'rows': n_rows,
+        'kept': kept,
+        'ratio': round(kept / n_rows, 3) if n_rows else 0.0,
+    }
+
+
+def build_employee_units(emp_list, elig, shifts, pref_weights, enabled=True):
+    """
+    Groups interchangeable employees into equivalence classes ("units"): same qualifications,
+    same availability (and override flags, carried-in rest blocks) on every day, same max
+    shifts and same position preferences. Employees with iron shifts always stay on their own.
+    The model then gets one integer count variable per (unit, position, day, shift)
+    instead of one BoolVar per guard, which removes the symmetric permutations.
+
+    Returns (units, unit_of) where units[u] = {'rep': e_i, 'members': [e_i, ...]} and
+    unit_of[e_i] = u. With enabled=False every employee is its own unit and u == e_i.
+    """
+    units = []
+    unit_of = [0] * len(emp_list)
+    by_signature = {}
+    for e_i, e in enumerate(emp_list):
+        signature = None
+        if enabled and not e.get('fixed_shifts'):
+            prefs = pref_weights.get(e['id'], {}) if pref_weights else {}
+            signature = (
+                elig['qualified'][e_i].tobytes(),
+                tuple(tuple(e['avail'].get(d, [])) for d in shifts),
+                tuple(e['avail_from_override'].get(d, False) for d in shifts),
+                tuple(sorted(e.get('rest_blocked', ()))),
+                e['max_shifts'],
+                tuple(sorted((k, v) for k, v in prefs.items() if v)),
+            )
+        u = by_signature.get(signature) if signature is not None else None
+        if u is None:
+            u = len(units)
+            units.append({'rep': e_i, 'members': []})
+            if signature is not None:
+                by_signature[signature] = u
+        units[u]['members'].append(e_i)
+        unit_of[e_i] = u
+    return units, unit_of
+
+
+def _split_unit_greedy(members, budget, store, counts, day_ks, conflicts, start_of):
+    """Greedy split of one unit's counts: each day, fill the earliest shifts first, always picking the members with most shifts left."""
+    budget = dict(budget)
+    offsets = sorted({off for _, _, off in conflicts})
+    worked = {m: {} for m in members}  # member -> {day index: shift code}
+    pairs = []
+    for d_i, ks in enumerate(day_ks):
+        busy = set()
+        for k in sorted((k for k in ks if counts[k] > 0), key=lambda k: start_of[store['shift'][k]]):
+            s = store['shift'][k]
+            cands = [m for m in members if m not in busy and budget[m] > 0
+                     and not any((worked[m].get(d_i - off), s, off) in conflicts for off in offsets)]
+            if len(cands) < counts[k]:
+                return None
+            cands.sort(key=lambda m: -budget[m])
+            for m in cands[:counts[k]]:
+                busy.add(m)
+                budget[m] -= 1
+                worked[m][d_i] = s
+                pairs.append((m, k))
+    return pairs
+
+
+def _split_unit_exact(members, budget, store, counts, day_ks, conflicts):
+    """Exact split of one unit's counts with a tiny CP-SAT feasibility model (fallback for the greedy)."""
     model = cp_model.CpModel()
-    
-    # --- 1. Data Parsing ---
+    x = {}
+    for ks in day_ks:
+        for k in ks:
+            if counts[k] > 0:
+                for m in members:
+                    x[(m, k)] = model.NewBoolVar(f"split_{m}_{k}")
+                model.Add(sum(x[(m, k)] for m in members) == counts[k])
+    for m in members:
+        day_sums = [[x[(m, k)] for k in ks if (m, k) in x] for ks in day_ks]
+        for vs in day_sums:
+            if len(vs) > 1:
+                model.Add(sum(vs) <= 1)
+        model.Add(sum(v for vs in day_sums for v in vs) <= budget[m])
+        for c1, c2, off in conflicts:
+            for d_i in range(len(day_ks) - off):
+                first = [x[(m, k)] for k in day_ks[d_i] if (m, k) in x and store['shift'][k] == c1]
+                later = [x[(m, k)] for k in day_ks[d_i + off] if (m, k) in x and store['shift'][k] == c2]
+                if first and later:
+                    model.Add(sum(first) + sum(later) <= 1)
+    solver = cp_model.CpSolver()
+    solver.parameters.num_search_workers = 1
+    solver.parameters.max_time_in_seconds = 10.0
+    if solver.Solve(model) not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None
+    return [(m, k) for (m, k), v in x.items() if solver.Value(v)]
+
+
+def disaggregate_units(units, emp_list, store, counts, conflicts, coverage=None, exact=True):
+    """
+    Assigns individual employees to the per-unit counts of a solved model, respecting the
+    rest conflicts (see shift_templates.rest_conflicts) between an employee's shifts.
+    Returns a list of (employee row, assignment index) pairs, or None if some unit's
+    counts cannot be split between its members (the aggregated model is a relaxation).
+    exact=False skips the CP-SAT fallback when the greedy split fails (None instead).
+    """
+    start_of = {s: span[0] for s, span in (coverage or DEFAULT_COVERAGE)['spans'].items()}
+    pairs = []
+    for u, unit in enumerate(units):
+        members = unit['members']
+        if len(members) == 1:
+            pairs.extend((members[0], k) for k in store['by_emp'][u] if counts[k] > 0)
+            continue
+        day_ks = store['by_emp_day'][u]
+        budget = {m: emp_list[m]['max_shifts'] for m in members}
+        split = _split_unit_greedy(members, budget, store, counts, day_ks, conflicts, start_of)
+        if split is None and exact:
+            split = _split_unit_exact(members, budget, store, counts, day_ks, conflicts)
+        if split is None:
+            return None
+        pairs.extend(split)
+    return pairs
+
+
+def allowed_shift_codes(e, d, pos_name, active_map, constraints, fixed, coverage=None):
+    """
+    Shift codes employee e may take at position pos_name on day d (qualification is checked
+    by the caller). Returns a list of (code, is_fixed) in template order - M, A, N, DM, DN
+    for the default templates. A shift needs every demand window it overlaps to be active.
+    """
+    coverage = coverage or DEFAULT_COVERAGE
+    eid = e['id']
+    day_av = e['avail'].get(d, [])
+    codes = []
+
+    # Rule: auto_doubles only kicks in when the day was NOT manually overridden by the user.
+    # If the user manually set Can_DM/Can_DN to False in the table → we MUST respect that.
+    day_was_overridden = e.get('avail_from_override', {}).get(d, False)
+    auto_doubles = not day_was_overridden and constraints.get('auto_doubles', False)
+    # Shifts ruled out by the rest rule against shifts worked before the horizon (rolling carry-in)
+    rest_blocked = e.get('rest_blocked', ())
+
+    for s, template in coverage['templates'].items():
+        active = all(active_map.get(w, True) for w in coverage['windows_of'][s]) and (d, s) not in rest_blocked
+        if not template.get('double'):
+            # Single Shifts - available and active, or an iron shift (always allowed)
+            is_fixed = (eid, d, pos_name, s) in fixed
+            if (template['avail'] in day_av and active) or is_fixed:
+                codes.append((s, is_fixed))
+        elif constraints['allow_double']:
+            # Double Shifts
+            can_do = template['avail'] in day_av or (auto_doubles and template.get('auto_from') in day_av)
+            if can_do and active:
+                codes.append((s, False))
+
+    return codes
+
+
+# Solver availability codes, in the order of availability.AVAILABILITY_CODES
+_AVAIL_CODE_NAMES = ('M', 'A', 'N', 'Can_DM', 'Can_DN')
+
+
+# Share of the profile's time limit given to each lexicographic stage
+LEXICOGRAPHIC_SHARES = (0.5, 0.25, 0.25)
+
+
+def solve_lexicographic(model, stages, hint_vars, profile_name, max_workers=None, streamer=None, stop_event=None):
+    """
+    Optimises the stages one after the other instead of one big-M weighted sum.
+    stages: [(name, terms, 'min' | 'max', share of the profile time limit)]; stages without
+    terms are skipped, and time a stage does not use is shared out among the later ones.
+    Once a stage is solved its best value is added as a constraint, and its solution (over
+    hint_vars) hints the next stage. A stage that finds no solution in its budget (or a set
+    stop_event) ends the sequence with the previous stage's roster.
+
+    Returns (solver holding the final solution, status, per-stage stats). The status is
+    OPTIMAL only if every stage was proven optimal.
+    """
+    stages = [stage for stage in stages if stage[1]]
+    time_left = SOLVE_PROFILES[profile_name]['max_time_in_seconds']
+    best_solver, best_status = None, cp_model.UNKNOWN
+    all_optimal = True
+    stage_stats = []
+
+    for i, (name, terms, sense, share) in enumerate(stages):
+        budget = time_left * share / sum(s[3] for s in stages[i:])
+        expr = sum(terms)
+        if sense == 'min':
+            model.Minimize(expr)
+        else:
+            model.Maximize(expr)
+
+        solver = cp_model.CpSolver()
+        configure_solver(solver, profile_name, max_workers)
+        solver.parameters.max_time_in_seconds = max(1.0, budget)
+        stop_watch = watch_stop_event(solver, stop_event) if stop_event is not None else None
+        if streamer is not None:
+            streamer.reset()
+        status = solver.Solve(model, streamer)
+        if stop_watch is not None:
+            stop_watch.set()
+
+        stats = solve_stats(solver, status, profile_name)
+        stats['stage'] = name
+        stage_stats.append(stats)
+        time_left = max(0.0, time_left - solver.WallTime())
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            if best_solver is None:
+                best_solver, best_status = solver, status
+            else:
+                all_optimal = False  # this stage and the ones after it were never optimised
+            break
+        best_solver, best_status = solver, status
+        all_optimal = all_optimal and status == cp_model.OPTIMAL
+        if stop_event is not None and stop_event.is_set():
+            all_optimal = False
+            break
+
+        # Lock in this stage and start the next one from its solution (which satisfies the
+        # new bound, so every stage has a feasible start)
+        value = int(round(solver.ObjectiveValue()))
+        model.Add(expr <= value if sense == 'min' else expr >= value)
+        model.ClearHints()
+        for var, val in zip(hint_vars, batch_values(solver, hint_vars).tolist()):
+            model.AddHint(var, val)
+
+    if best_solver is None:
+        # Nothing to optimise at all
+        best_solver = cp_model.CpSolver()
+        best_status = best_solver.Solve(model)
+    elif best_status == cp_model.OPTIMAL and not all_optimal:
+        best_status = cp_model.FEASIBLE
+    return best_solver, best_status, stage_stats
+
+
+def _diversity_cut(model, assign_vars, sizes, counts, min_difference, tag):
+    """
+    Adds  sum over the roster's assignments of (count - new count)^+ >= min_difference:
+    the next roster must drop at least min_difference of these assignments. For a single
+    employee (size 1) the term is just 1 - x, a classic no-good.
+    """
+    dropped = []
+    for k, c in enumerate(counts):
+        if c <= 0:
+            continue
+        if sizes[k] == 1:
+            dropped.append(1 - assign_vars[k])
+            continue
+        # d <= (c - x)^+ : either d <= c - x, or d = 0
+        d = model.NewIntVar(0, c, f"drop_{tag}_{k}")
+        takes = model.NewBoolVar(f"drop_on_{tag}_{k}")
+        model.Add(d <= c - assign_vars[k]).OnlyEnforceIf(takes)
+        model.Add(d == 0).OnlyEnforceIf(takes.Not())
+        dropped.append(d)
+    # A roster cannot drop more assignments than it has (unit counts, not distinct variables)
+    model.Add(sum(dropped) >= min(min_difference, sum(c for c in counts if c > 0)))
+
+
+def solve_diverse(model, assign_vars, sizes, value_vars, first_counts, n_more, min_difference, profile_name,
+                  max_workers=None, stop_event=None):
+    """
+    Up to n_more further rosters from the already built model: before each search a diversity
+    cut (see _diversity_cut) against the best roster and every alternative found so far is
+    added, so each new roster differs from all earlier ones by at least min_difference
+    assignments while the objective still picks the best such roster.
+    Ends early when a search finds nothing (no more rosters that different) or on stop_event.
+    Returns [(values of value_vars, status name, solve_stats)] per alternative, best first.
+    """
+    found = []
+    counts = first_counts
+    for i in range(n_more):
+        _diversity_cut(model, assign_vars, sizes, counts, min_difference, i)
+        model.ClearHints()
+        solver = cp_model.CpSolver()
+        configure_solver(solver, profile_name, max_workers)
+        stop_watch = watch_stop_event(solver, stop_event) if stop_event is not None else None
+        status = solver.Solve(model)
+        if stop_watch is not None:
+            stop_watch.set()
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            break
+        values = batch_values(solver, value_vars).tolist()
+        found.append((values, solver.StatusName(status), solve_stats(solver, status, profile_name)))
+        counts = values[:len(assign_vars)]
+        if stop_event is not None and stop_event.is_set():
+            break
+    return found
+
+
+def parse_employees(employees_df, col_map, shifts, avail_overrides=None, max_shifts_map=None, fixed_shifts_map=None):
+    """
+    Parses the employees sheet (plus the manual per-employee overrides) into the solver's
+    employee records: id (df index), name, roles string, per-day availability codes
+    ('M', 'A', 'N', 'Can_DM', 'Can_DN'), which days were manually overridden, max shifts
+    and iron shifts. Availability comes from the shared availability array (see availability.py).
+    """
+    avail_data = build_availability(employees_df, shifts, avail_overrides, col_map.get('note'))
+    avail_arr = avail_data['array']
+    from_override = avail_data['from_override']
+    names = employees_df[col_map['name']].tolist()
+    roles = employees_df[col_map['pos']].tolist()
+
     emp_list = []
-    
-    # Safe helper for double shift column
-    note_col = col_map.get('note')
-    has_double_col = note_col and note_col not in ['None', 'ללא']
-    
-    for idx, row in employees_df.iterrows():
-        name = row[col_map['name']]
-        pos = row[col_map['pos']] 
-        
-        is_double = True # Default to allowed if no column specifies otherwise
-        
-        # Re-evaluating: The user wants to ignore the column IN THE APP. 
-        # So col_map['note'] will be None.
-        
-        # However, to be safe:
-        if has_double_col and note_col in employees_df.columns:
-             val = str(row[note_col]).lower()
-             if 'double' in val or 'כפולה' in val or 'כן' in val:
-                 is_double = True
-             else:
-                 is_double = False
-        
-        # Availability parse
+    for i, idx in enumerate(employees_df.index):
         avail = {}
         avail_from_override = {}  # tracks which days came from manual override
-        override_df = avail_overrides.get(idx) if avail_overrides else None
-        
-        for s_col in shifts:
-            day_avail = []
-            
-            # Check for override first
-            clean_day_label = str(s_col).strip()
-            
-            # Defensive check
-            is_valid_df = override_df is not None and hasattr(override_df, 'columns')
-            if is_valid_df and clean_day_label in override_df.columns:
-                # Use overridden values — these are MANUAL and must NOT be overridden by auto_doubles
-                # Structure: 0=M, 1=A, 2=N, 3=DoubleM, 4=DoubleN
-                try:
-                    vals = override_df[clean_day_label].tolist()
-                    if len(vals) >= 3:
-                        if vals[0]: day_avail.append('M')
-                        if vals[1]: day_avail.append('A')
-                        if vals[2]: day_avail.append('N')
-                    
-                    # Double capability: read EXACTLY what the user set — never auto-override
-                    if len(vals) >= 5:
-                        if vals[3]: day_avail.append('Can_DM')
-                        if vals[4]: day_avail.append('Can_DN')
-                    
-                    avail_from_override[s_col] = True  # mark as manually set
-                except Exception:
-                    avail_from_override[s_col] = False
-            elif s_col in employees_df.columns:
-                # Use original file data (Standard M/A/N)
-                cell = str(row[s_col]).lower()
-                if 'בוקר' in cell or 'morning' in cell: day_avail.append('M')
-                if 'צהריים' in cell or 'afternoon' in cell: day_avail.append('A')
-                if 'לילה' in cell or 'night' in cell: day_avail.append('N')
-                
-                # Global fallback for double shifts (only when NOT manually overridden)
-                if is_double:
-                    day_avail.append('Can_DM')
-                    day_avail.append('Can_DN')
-                avail_from_override[s_col] = False
-
-            avail[s_col] = day_avail
-            
+        for j, s_col in enumerate(shifts):
+            # Structure: 0=M, 1=A, 2=N, 3=DoubleM, 4=DoubleN
+            avail[s_col] = [_AVAIL_CODE_NAMES[c] for c in np.flatnonzero(avail_arr[i, j])]
+            avail_from_override[s_col] = bool(from_override[i, j])
+
         emp_list.append({
             'id': idx,
-            'name': name,
-            'pos': str(pos), 
+            'name': names[i],
+            'pos': str(roles[i]),
             'avail': avail,
             'avail_from_override': avail_from_override,  # which days were manually set
             'max_shifts': max_shifts_map.get(idx, 6) if max_shifts_map else 6,
             'fixed_shifts': fixed_shifts_map.get(idx, []) if fixed_shifts_map else []
         })
+
+    return emp_list
+
+
+BASE_PENALTY = 10000
+
+
+def _w(pos_p, shift_p):
+    """Convert 1-based priority to integer penalty weight."""
+    return max(1, int(BASE_PENALTY / (pos_p * shift_p)))
+
+
+def shift_penalty_weights(pos_data):
+    """Shortage penalty per missing guard for each shift of a position ({'M', 'A', 'N'} -> weight)."""
+    pos_priority = pos_data.get('priority', 5)  # 1=most important
+    return {
+        'M': _w(pos_priority, pos_data.get('priority_morning', 1)),
+        'A': _w(pos_priority, pos_data.get('priority_afternoon', 1)),
+        'N': _w(pos_priority, pos_data.get('priority_night', 1)),
+    }
+
+
+# Coverage of the default shift templates (see shift_templates.compile_coverage):
+# segments M, A1 (15:00-19:00), A2 (19:00-23:00), N; A and the doubles span two of them
+DEFAULT_COVERAGE = compile_coverage()
+SHIFT_SEGMENTS = DEFAULT_COVERAGE['segments_of']
+SEGMENT_LABELS = {key: label for key, _, _, _, label in DEFAULT_COVERAGE['segments']}
+_DEMAND_KEYS = {w_code: (req_key, prio_key) for w_code, _, _, req_key, prio_key, _ in DEMAND_WINDOWS}
+
+
+def shift_coverage(constraints):
+    """Compiled coverage of constraints['shift_templates'] (the default M/A/N/DM/DN set if missing)."""
+    templates = constraints.get('shift_templates')
+    return compile_coverage(templates) if templates else DEFAULT_COVERAGE
+
+
+def demand_slots(positions, d, coverage=None):
+    """Active coverage slots of day d as (p_idx, segment, required) - same rules as the slack constraints."""
+    coverage = coverage or DEFAULT_COVERAGE
+    slots = []
+    for p_idx, pos_data in enumerate(positions):
+        active_map = pos_data.get('active_shifts', {}).get(d, {'M': True, 'A': True, 'N': True})
+        for seg, w_code, _, _, _ in coverage['segments']:
+            req = pos_data[_DEMAND_KEYS[w_code][0]]
+            if req > 0 and active_map.get(w_code, True):
+                slots.append((p_idx, seg, req))
+    return slots
+
+
+def _employee_reach(e_i, e, elig, positions, constraints, d, slot_of, coverage):
+    """(span, slot indices) of one employee in the coverage network of day d (see _solve_day_coverage)."""
+    reach = set()
+    span = 0
+    for p_idx, pos_data in enumerate(positions):
+        pos_name = pos_data['name']
+        if not elig['qualified'][e_i, p_idx] and (e['id'], d, pos_name) not in elig['fixed_any']:
+            continue
+        active_map = pos_data.get('active_shifts', {}).get(d, {'M': True, 'A': True, 'N': True})
+        for s, _ in allowed_shift_codes(e, d, pos_name, active_map, constraints, elig['fixed'], coverage):
+            covered = [slot_of[(p_idx, seg)] for seg in coverage['segments_of'][s] if (p_idx, seg) in slot_of]
+            if covered:
+                reach.update(covered)
+                span = max(span, len(covered))
+    return span, reach
+
+
+def _max_flow(tails, heads, caps):
+    from ortools.graph.python import max_flow
+
+    flow = max_flow.SimpleMaxFlow()
+    flow.add_arcs_with_capacity(tails, heads, caps)
+    flow.solve(0, 1)
+    return flow
+
+
+def _solve_day_coverage(emp_list, elig, positions, constraints, d, slots, coverage):
+    """
+    Builds and solves the max-flow coverage network of day d (see capacity_bounds).
+    Nodes: 0 source, 1 sink, 2 + employee row, 2 + len(emp_list) + slot index.
+    Returns (solved SimpleMaxFlow, arc tails, arc heads, #eligible employees per slot, flow per slot).
+    """
+    slot_of = {(p_idx, seg): j for j, (p_idx, seg, _) in enumerate(slots)}
+    first_slot = 2 + len(emp_list)
+
+    tails, heads, caps = [], [], []
+    eligible = np.zeros(len(slots), dtype=np.int64)
+    for e_i, e in enumerate(emp_list):
+        span, reach = _employee_reach(e_i, e, elig, positions, constraints, d, slot_of, coverage)
+        if not reach:
+            continue
+        tails.append(0); heads.append(2 + e_i); caps.append(span)
+        for j in reach:
+            tails.append(2 + e_i); heads.append(first_slot + j); caps.append(1)
+            eligible[j] += 1
+    for j, (_, _, req) in enumerate(slots):
+        tails.append(first_slot + j); heads.append(1); caps.append(req)
+
+    tails = np.array(tails, dtype=np.int32)
+    heads = np.array(heads, dtype=np.int32)
+    flow = _max_flow(tails, heads, np.array(caps, dtype=np.int64))
+    # Slot -> sink arcs are the last len(slots) arcs
+    slot_flows = flow.flows(np.arange(len(tails) - len(slots), len(tails), dtype=np.int32))
+    return flow, tails, heads, eligible, slot_flows
+
+
+def capacity_bounds(emp_list, elig, positions, constraints, shifts, coverage=None):
+    """
+    Pre-solve capacity analysis. For every day a max-flow network
+        source -> employee -> (position, segment) slot -> sink
+    is solved, where an employee's capacity is the most segments one of their allowed shifts
+    spans (2 for A / DM / DN) and a slot has capacity = required guards.
+    Since each employee works at most one shift per day, the max flow is an upper bound on
+    the coverage the roster can reach that day, so demand - max_flow is a guaranteed shortage.
+
+    Per slot, required - #eligible employees is a guaranteed shortage on its own; 'unfilled'
+    is what the max-flow solution left open in that slot (indicative only - another maximum
+    flow may spread the day's shortage differently).
+    """
+    coverage = coverage or DEFAULT_COVERAGE
+    seg_labels = {key: label for key, _, _, _, label in coverage['segments']}
+
+    day_info = {}
+    slot_info = []
+    for d in shifts:
+        slots = demand_slots(positions, d, coverage)
+        if not slots:
+            day_info[d] = {'demand': 0, 'max_coverage': 0, 'guaranteed_shortage': 0}
+            continue
+        flow, _, _, eligible, slot_flows = _solve_day_coverage(emp_list, elig, positions, constraints, d, slots, coverage)
+
+        demand = sum(req for _, _, req in slots)
+        max_cov = int(flow.optimal_flow())
+        day_info[d] = {'demand': demand, 'max_coverage': max_cov, 'guaranteed_shortage': demand - max_cov}
+        for j, (p_idx, seg, req) in enumerate(slots):
+            slot_info.append({
+                'day': d,
+                'p_idx': p_idx,
+                'position': positions[p_idx]['name'],
+                'segment': seg,
+                'shift': seg_labels[seg],
+                'required': req,
+                'eligible': int(eligible[j]),
+                'guaranteed_shortage': max(0, req - int(eligible[j])),
+                'unfilled': req - int(slot_flows[j]),
+            })
+
+    return {
+        'days': day_info,
+        'slots': slot_info,
+        'demand': sum(v['demand'] for v in day_info.values()),
+        'max_coverage': sum(v['max_coverage'] for v in day_info.values()),
+        'guaranteed_shortage': sum(v['guaranteed_shortage'] for v in day_info.values()),
+    }
+
+
+def analyze_capacity(employees_df, positions, constraints, col_map, shifts, avail_overrides=None,
+                     fixed_shifts_map=None):
+    """
+    Standalone capacity analysis (no CP model) - cheap enough to run on every upload/edit.
+    Returns capacity_bounds(...) plus 'wall_time' in seconds; empty dict without employees.
+    """
+    t0 = time.perf_counter()
+    emp_list = parse_employees(employees_df, col_map, shifts, avail_overrides, None, fixed_shifts_map)
+    if not emp_list:
+        return {}
+    elig = build_eligibility_index(emp_list, positions, shifts)
+    analysis = capacity_bounds(emp_list, elig, positions, constraints, shifts, shift_coverage(constraints))
+    analysis['wall_time'] = time.perf_counter() - t0
+    return analysis
+
+
+def shortage_root_causes(emp_list, elig, positions, constraints, shifts, coverage=None):
+    """
+    Why a day is short: the min-cut of its coverage network (see capacity_bounds). The sink
+    side of the cut holds the slots left open plus every slot whose guards could be moved
+    onto them; together they need more than the guards able to work any of them can give.
+    For each day whose max flow is below demand:
+      'shortage'          - demand - max flow
+      'short_slots'       - [(position, shift label, missing)] left open by the max flow
+      'competing'         - {position: [shift labels]} slots competing for the pool
+      'pool'              - employee rows able to work a competing slot (all used up by them)
+      'unlock'            - {employee row: [demand window codes]}: guards qualified for a short
+                            slot's position who are outside the pool, and for whom availability
+                            for one of those windows that day adds coverage (each claim is
+                            checked by re-solving the day's network)
+    Days without an entry are not short on availability alone - their roster shortages come
+    from the weekly limits (max_shifts, rest between shifts).
+    """
+    coverage = coverage or DEFAULT_COVERAGE
+    seg_labels = {key: label for key, _, _, _, label in coverage['segments']}
+    seg_window = {key: w_code for key, w_code, _, _, _ in coverage['segments']}
+    qualified = elig['qualified']
+    first_slot = 2 + len(emp_list)
+
+    causes = {}
+    for d in shifts:
+        slots = demand_slots(positions, d, coverage)
+        if not slots:
+            continue
+        flow, tails, heads, _, slot_flows = _solve_day_coverage(emp_list, elig, positions, constraints, d, slots, coverage)
+        demand = sum(req for _, _, req in slots)
+        if flow.optimal_flow() >= demand:
+            continue
+
+        sink_side = np.zeros(flow.num_nodes(), dtype=bool)
+        sink_side[flow.get_sink_side_min_cut()] = True
+        # Everyone with an arc into a bottleneck slot - the whole pool those slots can draw on
+        into_cut = (tails >= 2) & (tails < first_slot) & sink_side[heads]
+        in_pool = set((np.unique(tails[into_cut]) - 2).tolist())
+        pool = sorted(in_pool)
+        competing = {}
+        short_slots = []
+        needed = {}  # position idx -> demand windows left open
+        for j, (p_idx, seg, req) in enumerate(slots):
+            if not sink_side[first_slot + j]:
+                continue
+            pos_name = positions[p_idx]['name']
+            competing.setdefault(pos_name, []).append(seg_labels[seg])
+            missing = req - int(slot_flows[j])
+            if missing > 0:
+                short_slots.append((pos_name, seg_labels[seg], missing))
+                needed.setdefault(p_idx, set()).add(seg_window[seg])
+
+        # Keep only claims that raise the day's max flow - a guard whose capacity is already
+        # used elsewhere may add nothing. Each check re-solves the network with that guard's
+        # arcs rebuilt for the extra availability.
+        slot_of = {(p_idx, seg): j for j, (p_idx, seg, _) in enumerate(slots)}
+        caps = np.array([flow.capacity(a) for a in range(flow.num_arcs())], dtype=np.int64)
+        unlock = {}
+        for p_idx, windows in needed.items():
+            for e_i in np.flatnonzero(qualified[:, p_idx]):
+                e_i = int(e_i)
+                if e_i in in_pool:
+                    continue
+                e = emp_list[e_i]
+                own = (tails == 2 + e_i) | ((tails == 0) & (heads == 2 + e_i))
+                for w_code in windows - unlock.get(e_i, set()):
+                    trial = {**e, 'avail': {**e['avail'], d: list(e['avail'].get(d, [])) + [w_code]}}
+                    span, reach = _employee_reach(e_i, trial, elig, positions, constraints, d, slot_of, coverage)
+                    if not reach:
+                        continue
+                    reach = sorted(reach)
+                    trial_flow = _max_flow(
+                        np.concatenate([tails[~own], [0], np.full(len(reach), 2 + e_i)]).astype(np.int32),
+                        np.concatenate([heads[~own], [2 + e_i], first_slot + np.array(reach)]).astype(np.int32),
+                        np.concatenate([caps[~own], [span], np.ones(len(reach))]).astype(np.int64),
+                    )
+                    if trial_flow.optimal_flow() > flow.optimal_flow():
+                        unlock.setdefault(e_i, set()).add(w_code)
+
+        causes[d] = {
+            'shortage': int(demand - flow.optimal_flow()),
+            'short_slots': short_slots,
+            'competing': competing,
+            'pool': pool,
+            'unlock': {e_i: sorted(w) for e_i, w in unlock.items()},
+        }
+    return causes
+
+
+def analyze_shortage_causes(employees_df, positions, constraints, col_map, shifts, avail_overrides=None,
+                            max_shifts_map=None, fixed_shifts_map=None):
+    """
+    Standalone shortage_root_causes(...) with employee names instead of rows:
+    {day: {..., 'pool': [names], 'unlock': [(name, [window codes])]}}.
+    """
+    emp_list = parse_employees(employees_df, col_map, shifts, avail_overrides, max_shifts_map, fixed_shifts_map)
+    if not emp_list:
+        return {}
+    elig = build_eligibility_index(emp_list, positions, shifts)
+    causes = shortage_root_causes(emp_list, elig, positions, constraints, shifts, shift_coverage(constraints))
+    for info in causes.values():
+        info['pool'] = [emp_list[e_i]['name'] for e_i in info['pool']]
+        info['unlock'] = [(emp_list[e_i]['name'], w) for e_i, w in info['unlock'].items()]
+    return causes
+
+
+def iron_shift_load(emp_list, elig, positions, shifts, coverage=None):
+    """
+    Iron shifts that become model assignments (a single shift template - M / A / N by default -
+    at a known position and day; see allowed_shift_codes).
+    Returns ({emp_id: number of iron shifts}, {(emp_id, day)} taken by an iron shift).
+    """
+    coverage = coverage or DEFAULT_COVERAGE
+    singles = {s for s, t in coverage['templates'].items() if not t.get('double')}
+    pos_names = {p['name'] for p in positions}
+    days = set(shifts)
+    count, taken = {}, set()
+    for eid, d, pos_name, s in elig['fixed']:
+        if d in days and pos_name in pos_names and s in singles:
+            count[eid] = count.get(eid, 0) + 1
+            taken.add((eid, d))
+    return count, taken
+
+
+def prune_shift_codes(codes, constrained, busy, coverage=None):
+    """
+    Presolve pass over allowed_shift_codes(...) of one employee, position and day. Drops:
+      'no_demand'        - the shift fills no segment that has a coverage constraint
+      'dominated_double' - a double whose demanded segments are all covered by a single shift
+                           inside its hours (DM -> M, DN -> N), which the employee may take
+      'fixed_budget'     - the employee is busy: an iron shift that day, or max_shifts
+                           already used up by iron shifts
+    Iron shifts themselves are always kept. constrained: demanded segments of this position/day.
+    Returns (kept codes, {reason: pruned count}).
+    """
+    coverage = coverage or DEFAULT_COVERAGE
+    templates, spans, segments_of = coverage['templates'], coverage['spans'], coverage['segments_of']
+    singles = [s for s, _ in codes if not templates[s].get('double')]
+    kept, pruned = [], {}
+    for s, is_fixed in codes:
+        reason = None
+        if not is_fixed:
+            covered = set(segments_of[s]) & constrained
+            if busy:
+                reason = 'fixed_budget'
+            elif not covered:
+                reason = 'no_demand'
+            elif templates[s].get('double') and any(
+                    covered <= set(segments_of[t]) and spans[s][0] <= spans[t][0] and spans[t][1] <= spans[s][1]
+                    for t in singles):
+                reason = 'dominated_double'
+        if reason is None:
+            kept.append((s, is_fixed))
+        else:
+            pruned[reason] = pruned.get(reason, 0) + 1
+    return kept, pruned
+
+
+def rest_settings(constraints, coverage):
+    """
+    (rest hours, rest conflicts) of the no back-to-back rule: at least min_rest hours between
+    the end of a shift and the next one (at least a minute with min_rest = 0); 8h reproduces
+    the classic night -> morning rule. No conflicts when the rule is off.
+    """
+    if not constraints.get('no_back_to_back', False):
+        return None, set()
+    rest_hours = max(constraints.get('min_rest', 8), 1 / 60)
+    return rest_hours, rest_conflicts(coverage, rest_hours)
+
+
+def flow_engine_applicable(constraints, repair_from=None, objective_mode='weighted'):
+    """
+    Without doubles and without the night -> morning rest rule the only links between days
+    are the per-employee max_shifts budgets, and the whole roster is a transportation problem
+    that min-cost flow solves exactly (see solve_assignment_flow). Only for the weighted
+    objective: the lexicographic stages rank coverage strictly above participation, which a
+    single min-cost flow with the weighted costs does not.
+    """
+    return (not constraints.get('allow_double', False)
+            and not constraints.get('no_back_to_back', False)
+            and not constraints.get('shift_templates')
+            and repair_from is None
+            and objective_mode != 'lexicographic')
+
+
+def solve_assignment_flow(emp_list, elig, positions, constraints, shifts, pref_weights=None, prune=True):
+    """
+    Exact min-cost-flow engine for flow_engine_applicable() instances. Network:
+        source -> employee (max_shifts) -> employee-day (1 shift per day)
+               -> (position, day, shift) slot -> sink (required guards)
+    plus a zero-cost source -> sink bypass. An assignment earns the same objective as in the
+    CP model: +1 participation, + preference score, and + the shortage weight of every
+    coverage segment it fills (twice for an afternoon, which covers both halves). Slots that
+    have no coverage constraint (0 required but active) take any number of employees, unless
+    prune is set (then, as in the CP model, nobody is assigned to them).
+
+    Iron shifts are pre-assigned. Returns (store, assigned, slack_values, objective), or None
+    when the iron shifts alone break the model (two on one day, over max_shifts or over the
+    demand) - the CP engine then reports the infeasibility.
+    """
+    from ortools.graph.python import min_cost_flow
+
+    qualified = elig['qualified']
+    fixed = elig['fixed']
+    fixed_any = elig['fixed_any']
+    n_emp = len(emp_list)
+
+    # Coverage-constrained slots and their remaining demand after the iron shifts
+    weights = [shift_penalty_weights(p) for p in positions]
+    segments = {}  # (p_idx, day) -> [(segment, required)]
+    remaining = {}
+    for d in shifts:
+        for p_idx, seg, req in demand_slots(positions, d):
+            segments.setdefault((p_idx, d), []).append((seg, req))
+            if seg != 'A2':
+                remaining[(p_idx, d, 'A' if seg == 'A1' else seg)] = req
+
+    store = new_assignment_store(n_emp, len(positions), len(shifts))
+    assigned = []
+    fixed_days = set()
+    budget = []
+    for e_i, e in enumerate(emp_list):
+        n_fixed = 0
+        for d_i, d in enumerate(shifts):
+            for p_idx, pos_data in enumerate(positions):
+                if (e['id'], d, pos_data['name']) not in fixed_any:
+                    continue
+                active_map = pos_data.get('active_shifts', {}).get(d, {'M': True, 'A': True, 'N': True})
+                for s, is_fixed in allowed_shift_codes(e, d, pos_data['name'], active_map, constraints, fixed):
+                    if not is_fixed:
+                        continue
+                    if (e_i, d) in fixed_days:
+                        return None
+                    fixed_days.add((e_i, d))
+                    n_fixed += 1
+                    slot = (p_idx, d, s)
+                    if slot in remaining:
+                        if remaining[slot] == 0:
+                            return None
+                        remaining[slot] -= 1
+                    add_assignment(store, None, e_i, p_idx, d_i, s)
+                    assigned.append((e_i, len(store['vars']) - 1))
+        if n_fixed > e['max_shifts']:
+            return None
+        budget.append(e['max_shifts'] - n_fixed)
+
+    # Node ids: 0 source, 1 sink, then employees, employee-days and slots as they appear
+    node_ids = {}
+    def node(key):
+        if key not in node_ids:
+            node_ids[key] = 2 + len(node_ids)
+        return node_ids[key]
+
+    tails, heads, caps, costs = [], [], [], []
+    def arc(t, h, cap, cost=0):
+        tails.append(t); heads.append(h); caps.append(cap); costs.append(cost)
+
+    assign_arcs = []  # (arc index, employee row, p_idx, d_i, shift)
+    supply = 0
+    for e_i, e in enumerate(emp_list):
+        if budget[e_i] <= 0:
+            continue
+        emp_prefs = pref_weights.get(e['id'], {}) if pref_weights else {}
+        emp_node = node(('e', e_i))
+        out_degree = 0
+        for d_i, d in enumerate(shifts):
+            if (e_i, d) in fixed_days:
+                continue
+            day_arcs = []
+            for p_idx, pos_data in enumerate(positions):
+                pos_name = pos_data['name']
+                if not qualified[e_i, p_idx] and (e['id'], d, pos_name) not in fixed_any:
+                    continue
+                active_map = pos_data.get('active_shifts', {}).get(d, {'M': True, 'A': True, 'N': True})
+                score = emp_prefs.get(pos_name, 0)
+                gain = 1 + (score if score > 0 else 0)
+                for s, _ in allowed_shift_codes(e, d, pos_name, active_map, constraints, fixed):
+                    if prune and (p_idx, d, s) not in remaining:
+                        continue
+                    day_arcs.append((p_idx, s, gain))
+            if not day_arcs:
+                continue
+            day_node = node(('ed', e_i, d_i))
+            arc(emp_node, day_node, 1)
+            out_degree += 1
+            for p_idx, s, gain in day_arcs:
+                assign_arcs.append((len(tails), e_i, p_idx, d_i, s))
+                arc(day_node, node(('s', p_idx, d_i, s)), 1, -gain)
+        if out_degree:
+            cap = min(budget[e_i], out_degree)
+            arc(0, emp_node, cap)
+            supply += cap
+
+    # Slot -> sink: filling a coverage slot earns its shortage weight(s)
+    for key in list(node_ids):
+        if key[0] != 's':
+            continue
+        _, p_idx, d_i, s = key
+        slot = (p_idx, shifts[d_i], s)
+        if slot in remaining:
+            if remaining[slot] > 0:
+                arc(node_ids[key], 1, remaining[slot], -weights[p_idx][s] * len(SHIFT_SEGMENTS[s]))
+        else:
+            arc(node_ids[key], 1, n_emp)
+    arc(0, 1, supply)
+
+    flow = min_cost_flow.SimpleMinCostFlow()
+    flow.add_arcs_with_capacity_and_unit_cost(
+        np.array(tails, dtype=np.int32), np.array(heads, dtype=np.int32),
+        np.array(caps, dtype=np.int64), np.array(costs, dtype=np.int64))
+    flow.set_nodes_supplies(np.array([0, 1], dtype=np.int32), np.array([supply, -supply], dtype=np.int64))
+    if flow.solve() != flow.OPTIMAL:
+        return None
+
+    arc_flows = flow.flows(np.array([a[0] for a in assign_arcs], dtype=np.int32)) if assign_arcs else []
+    for (_, e_i, p_idx, d_i, s), f in zip(assign_arcs, arc_flows):
+        if f > 0:
+            add_assignment(store, None, e_i, p_idx, d_i, s)
+            assigned.append((e_i, len(store['vars']) - 1))
+    covered = {}
+    for k in range(len(store['vars'])):
+        slot = (store['pos'][k], shifts[store['day'][k]], store['shift'][k])
+        covered[slot] = covered.get(slot, 0) + 1
+
+    # Slack values in the CP model's order: position, day, then M / A1 / A2 / N
+    slack_values = []
+    objective = 0
+    for p_idx, pos_data in enumerate(positions):
+        for d in shifts:
+            for seg, req in segments.get((p_idx, d), []):
+                code = 'A' if seg in ('A1', 'A2') else seg
+                val = req - covered.get((p_idx, d, code), 0)
+                slack_values.append((f"{d}|{pos_data['name']}|{SEGMENT_LABELS[seg]}", val))
+                objective -= weights[p_idx][code] * val
+    for e_i, k in assigned:
+        score = (pref_weights or {}).get(emp_list[e_i]['id'], {}).get(positions[store['pos'][k]]['name'], 0)
+        objective += 1 + (score if score > 0 else 0)
+
+    return store, assigned, slack_values, objective
+
+
+def solve_assignment_greedy(emp_list, elig, positions, constraints, shifts, pref_weights=None, coverage=None):
+    """
+    Constructive preview engine (no optimality claim, typically a few milliseconds).
+    Iron shifts are placed first; then the demanded (position, day, segment) slots are
+    filled in shortage-weight order (the same _w weights as the CP model), each time with the
+    shift / employee that covers the most weight still missing, then best preference, then
+    most shifts left. One shift per day, max_shifts, the rest rule (see rest_settings) and
+    the exact coverage of the CP model (no segment over its demand) are respected, so the
+    roster is a feasible warm start (hint_roster) for the full solve.
+    Returns (store, assigned, slack_values, objective) like solve_assignment_flow.
+    """
+    coverage = coverage or DEFAULT_COVERAGE
+    qualified = elig['qualified']
+    fixed = elig['fixed']
+    fixed_any = elig['fixed_any']
+    segments_of = coverage['segments_of']
+    _, conflicts = rest_settings(constraints, coverage)
+    offsets = sorted({off for _, _, off in conflicts})
+
+    # Demanded slots: remaining demand and shortage weight
+    remaining, weight, labels = {}, {}, {}
+    seg_info = {key: (w_code, label) for key, w_code, _, _, label in coverage['segments']}
+    for d_i, d in enumerate(shifts):
+        for p_idx, seg, req in demand_slots(positions, d, coverage):
+            pos_data = positions[p_idx]
+            w_code, label = seg_info[seg]
+            remaining[(p_idx, d_i, seg)] = req
+            weight[(p_idx, d_i, seg)] = _w(pos_data.get('priority', 5), pos_data.get(_DEMAND_KEYS[w_code][1], 1))
+            labels[(p_idx, d_i, seg)] = f"{d}|{pos_data['name']}|{label}"
+
+    store = new_assignment_store(len(emp_list), len(positions), len(shifts))
+    assigned = []
+    worked = [{} for _ in emp_list]  # employee row -> {day index: shift code}
+    budget = [e['max_shifts'] for e in emp_list]
+
+    def _place(e_i, p_idx, d_i, s):
+        add_assignment(store, None, e_i, p_idx, d_i, s)
+        assigned.append((e_i, len(store['vars']) - 1))
+        worked[e_i][d_i] = s
+        budget[e_i] -= 1
+        for seg in segments_of[s]:
+            if remaining.get((p_idx, d_i, seg), 0) > 0:
+                remaining[(p_idx, d_i, seg)] -= 1
+
+    # Candidates per demanded slot; iron shifts go in right away
+    candidates = {}
+    n_options = [0] * len(emp_list)
+    active_maps = [[p.get('active_shifts', {}).get(d, {'M': True, 'A': True, 'N': True}) for d in shifts] for p in positions]
+    pos_of_name = {}
+    for p_idx, pos_data in enumerate(positions):
+        pos_of_name.setdefault(pos_data['name'], []).append(p_idx)
+    iron_positions = {}  # emp_id -> positions of its iron shifts
+    for eid, _, pos_name in fixed_any:
+        iron_positions.setdefault(eid, set()).update(pos_of_name.get(pos_name, ()))
+    for e_i, e in enumerate(emp_list):
+        emp_prefs = pref_weights.get(e['id'], {}) if pref_weights else {}
+        emp_positions = sorted(set(np.flatnonzero(qualified[e_i]).tolist()) | iron_positions.get(e['id'], set()))
+        for d_i, d in enumerate(shifts):
+            for p_idx in emp_positions:
+                pos_name = positions[p_idx]['name']
+                if not qualified[e_i, p_idx] and (e['id'], d, pos_name) not in fixed_any:
+                    continue
+                active_map = active_maps[p_idx][d_i]
+                for s, is_fixed in allowed_shift_codes(e, d, pos_name, active_map, constraints, fixed, coverage):
+                    if is_fixed:
+                        if d_i not in worked[e_i]:
+                            _place(e_i, p_idx, d_i, s)
+                        continue
+                    segs = tuple((p_idx, d_i, seg) for seg in segments_of[s] if (p_idx, d_i, seg) in remaining)
+                    if not segs:
+                        continue
+                    n_options[e_i] += 1
+                    cand = (e_i, s, segs, max(emp_prefs.get(pos_name, 0), 0), sum(weight[x] for x in segs))
+                    for sl in segs:
+                        candidates.setdefault(sl, []).append(cand)
+
+    def _rest_ok(e_i, d_i, s):
+        days = worked[e_i]
+        return not any((days.get(d_i - off), s, off) in conflicts or (s, days.get(d_i + off), off) in conflicts
+                       for off in offsets)
+
+    # Each slot takes its candidates in order: most demanded weight covered, then the least
+    # flexible employee (keeps the flexible ones for later slots), then preference. A candidate
+    # that is ruled out once stays ruled out, so every list is scanned a single time.
+    for cands in candidates.values():
+        cands.sort(key=lambda c: (c[4], -n_options[c[0]], c[3]), reverse=True)
+
+    for slot in sorted(remaining, key=lambda sl: (-weight[sl], len(candidates.get(sl, ())), sl[1], sl[0])):
+        d_i = slot[1]
+        for e_i, s, segs, _, _ in candidates.get(slot, ()):
+            if remaining[slot] <= 0:
+                break
+            if budget[e_i] <= 0 or d_i in worked[e_i] or not _rest_ok(e_i, d_i, s):
+                continue
+            if any(remaining[x] <= 0 for x in segs):
+                continue  # would over-cover a segment - the CP model's coverage is exact
+            _place(e_i, slot[0], d_i, s)
+
+    slack_values = []
+    objective = len(assigned)
+    for p_idx in range(len(positions)):
+        for d_i in range(len(shifts)):
+            for seg, *_ in coverage['segments']:
+                slot = (p_idx, d_i, seg)
+                if slot in remaining:
+                    slack_values.append((labels[slot], remaining[slot]))
+                    objective -= weight[slot] * remaining[slot]
+    for e_i, k in assigned:
+        score = (pref_weights or {}).get(emp_list[e_i]['id'], {}).get(positions[store['pos'][k]]['name'], 0)
+        objective += max(score, 0)
+    return store, assigned, slack_values, objective
+
+
+def solve_roster(employees_df, positions, constraints, col_map, shifts, avail_overrides=None, pref_weights=None, max_shifts_map=None, fixed_shifts_map=None, calc_potentials=False, solve_profile='auto', hint_roster=None,
+                 repair_from=None, repair_free_cells=None, symmetry_reduction=True, max_search_workers=None,
+                 rest_carry_in=None, capacity_cuts=True, engine='auto', on_solution=None, stop_event=None,
+                 objective_mode='weighted', prune=True, parsed=None, num_rosters=1, min_difference=10,
+                 metrics_log=None, shortage_caps=None):
+    """
+    Main solver function with updated Double Shift logic.
+    Double Morning (DM): 07:00-19:00 (Covers M + First half A)
+    Double Night (DN): 19:00-07:00 (Covers Second half A + N)
+    constraints['shift_templates'] replaces these five shifts with any set of start/end-time
+    templates (see shift_templates.py); coverage is then compiled into time segments.
+    With no_back_to_back, min_rest hours must separate an employee's consecutive shifts.
+
+    solve_profile: key of SOLVE_PROFILES, or 'auto' to pick one from the model size.
+    hint_roster: previous result['roster'] to warm-start from (see apply_roster_hints).
+    repair_from / repair_free_cells: used by repair_roster - every assignment outside the
+        free (day, position name) cells is frozen to its value in the repair_from roster.
+    shortage_caps: {shortage label ("day|position|segment"): most units it may be short} - hard
+        upper bounds on single shortages (repair_suggestions forces one shortage to shrink).
+        Forces CP-SAT; the result is INFEASIBLE when the caps cannot be met.
+    symmetry_reduction: model interchangeable employees as one unit with integer counts
+        (see build_employee_units). Always off in repair mode, where identities matter.
+    max_search_workers: upper bound on CP-SAT workers (used when several solves run in parallel).
+    rest_carry_in: {employee id: [(days before shifts[0], shift code), ...]} of shifts worked just
+        before the horizon (rolling horizon); with no_back_to_back every shift of the first days
+        that conflicts with them (see rest_conflicts) is ruled out. A plain set of ids means a
+        night on the day before shifts[0].
+    capacity_cuts: bound the slacks from below with the pre-solve max-flow analysis
+        (see capacity_bounds); the bounds are exact, so the optimum is unchanged.
+    engine: 'cp_sat', 'flow' (min-cost flow, see solve_assignment_flow) or 'auto' - flow whenever
+        flow_engine_applicable(); 'flow' on an instance it cannot model falls back to CP-SAT.
+        'greedy' returns an instant, feasible but not optimised preview (see solve_assignment_greedy)
+        that can be passed back as hint_roster for the full solve.
+    on_solution: callable receiving a snapshot of every improving solution during the search
+        (see RosterSolutionStreamer) - used to render the roster progressively.
+    stop_event: threading.Event; setting it ends the search early with the best roster so far.
+    objective_mode: 'weighted' (one objective: slack penalties, +1 participation, preferences)
+        or 'lexicographic' - shortage, then participation, then preferences, each optimised
+        in its own stage (see solve_lexicographic).
+    prune: presolve away assignments that cannot fill any demanded slot or are dominated
+        (see prune_shift_codes); result['prune_stats'] reports what was removed.
+    parsed: (emp_list, elig) from parse_employees / build_eligibility_index for these positions
+        and shifts, used instead of parsing employees_df again (scenario batches share one).
+        avail_overrides / max_shifts_map / fixed_shifts_map are then already applied.
+    num_rosters / min_difference: with num_rosters > 1, result['alternatives'] holds up to
+        num_rosters - 1 further rosters (same structure as the result, plus 'difference' from
+        the best roster), each at least min_difference assignments away from all earlier ones
+        (see solve_diverse). Always solved with CP-SAT.
+    metrics_log: JSONL file to append result['metrics'] to (default: AUTOSHIFT_METRICS_LOG, see
+        solve_metrics.py). result['metrics'] always holds the wall time / peak memory of every
+        phase, the model size and the CP-SAT search statistics.
+    """
+    timer = PhaseTimer()
+    model = cp_model.CpModel()
     
+    # --- 1. Data Parsing ---
+    if parsed is None:
+        emp_list = parse_employees(employees_df, col_map, shifts, avail_overrides, max_shifts_map, fixed_shifts_map)
+    else:
+        emp_list = parsed[0]
+    
+    # Rest rule across the window boundary: shifts worked before this horizon block the
+    # conflicting shifts of its first days
+    carry_conflicts = rest_settings(constraints, shift_coverage(constraints))[1] if rest_carry_in and shifts else set()
+    if carry_conflicts:
+        if not isinstance(rest_carry_in, dict):
+            rest_carry_in = {eid: [(1, 'N')] for eid in rest_carry_in}
+        if parsed is not None:
+            emp_list = copy.deepcopy(emp_list)  # the shared list must stay untouched
+        for e in emp_list:
+            blocked = {
+                (shifts[off - before], c2)
+                for before, worked in rest_carry_in.get(e['id'], [])
+                for c1, c2, off in carry_conflicts
+                if c1 == worked and 0 <= off - before < len(shifts)
+            }
+            if blocked:
+                e['rest_blocked'] = blocked
+
     # Handle case with no employees
     if not emp_list:
         return {'status': 'No Employees Found', 'roster': None}
 
     # --- 2. Variables & Constraints ---
-    SHIFTS = ['M', 'A', 'N', 'DM', 'DN']
-    assignments = {} 
+    elig = build_eligibility_index(emp_list, positions, shifts) if parsed is None else parsed[1]
+    qualified = elig['qualified']
+    fixed = elig['fixed']
+    fixed_any = elig['fixed_any']
+    coverage = shift_coverage(constraints)
+    sizes = {'employees': len(emp_list), 'positions': len(positions), 'days': len(shifts)}
+    timer.lap('parse')
+
+    # --- Polynomial engine for the no-doubles / no-rest-rule case ---
+    if engine in ('auto', 'flow') and num_rosters <= 1 and not shortage_caps and flow_engine_applicable(constraints, repair_from, objective_mode):
+        t0 = time.perf_counter()
+        flow_out = solve_assignment_flow(emp_list, elig, positions, constraints, shifts, pref_weights, prune)
+        timer.lap('solve')
+        if flow_out is not None:
+            store, assigned, slack_values, objective = flow_out
+            result = {
+                'status': 'OPTIMAL',
+                'roster': None,
+                'diagnostics': [],
+                'solve_stats': {
+                    'profile': 'flow',
+                    'wall_time': round(time.perf_counter() - t0, 3),
+                    'objective': objective,
+                    'best_bound': objective,
+                    'gap': 0.0,
+                },
+                'hint_stats': None,
+                'repair_stats': None,
+                'symmetry_stats': {'employees': len(emp_list), 'units': len(emp_list), 'assignment_vars': len(assigned)},
+                'capacity': None,
+            }
+            build_roster_output(result, emp_list, elig, positions, shifts, constraints, store, assigned,
+                                slack_values, calc_potentials, pref_weights, timer)
+            record_metrics(result, timer, 'flow', metrics_log, sizes={**sizes, 'assignment_vars': len(assigned)})
+            return result
+
+    # --- Instant constructive preview ---
+    if engine == 'greedy':
+        t0 = time.perf_counter()
+        store, assigned, slack_values, objective = solve_assignment_greedy(emp_list, elig, positions, constraints,
+                                                                           shifts, pref_weights, coverage)
+        timer.lap('solve')
+        result = {
+            'status': 'FEASIBLE',
+            'roster': None,
+            'diagnostics': [],
+            'solve_stats': {
+                'profile': 'greedy',
+                'wall_time': round(time.perf_counter() - t0, 3),
+                'objective': objective,
+                'best_bound': None,
+                'gap': None,
+            },
+            'hint_stats': None,
+            'repair_stats': None,
+            'symmetry_stats': {'employees': len(emp_list), 'units': len(emp_list), 'assignment_vars': len(assigned)},
+            'capacity': None,
+        }
+        build_roster_output(result, emp_list, elig, positions, shifts, constraints, store, assigned,
+                            slack_values, calc_potentials, pref_weights, timer)
+        record_metrics(result, timer, 'greedy', metrics_log, sizes={**sizes, 'assignment_vars': len(assigned)})
+        return result
+
+    # Repair mode freezes individual assignments, so it needs one unit per employee
+    use_units = symmetry_reduction and repair_from is None
+    units, unit_of = build_employee_units(emp_list, elig, shifts, pref_weights, enabled=use_units)
+
+    store = new_assignment_store(len(units), len(positions), len(shifts))
+
+    # Structural shortages known before the solve tighten the slack variables
+    capacity = None
+    slack_lb = {}
+    if capacity_cuts:
+        capacity = capacity_bounds(emp_list, elig, positions, constraints, shifts, coverage)
+        slack_lb = {(s['day'], s['p_idx'], s['segment']): s['guaranteed_shortage']
+                    for s in capacity['slots'] if s['guaranteed_shortage'] > 0}
     
+    # Presolve: demanded segments per (position, day) and employees taken by iron shifts
+    prune_stats = None
+    if prune:
+        constrained_segs = {}
+        for d in shifts:
+            for p_idx, seg, _ in demand_slots(positions, d, coverage):
+                constrained_segs.setdefault((p_idx, d), set()).add(seg)
+        fixed_count, fixed_days = iron_shift_load(emp_list, elig, positions, shifts, coverage)
+        prune_stats = {'pruned_vars': 0, 'no_demand': 0, 'dominated_double': 0, 'fixed_budget': 0}
+    timer.lap('presolve')
+
     # Objective tracking
     all_double_shifts = []
     slacks = []
 
     for p_idx, pos_data in enumerate(positions):
         pos_name = pos_data['name']
-        req_m = pos_data['guards_morning']
-        req_a = pos_data['guards_afternoon']
-        req_n = pos_data['guards_night']
-        
         pos_priority = pos_data.get('priority', 5)  # 1=most important
-        pm_priority  = pos_data.get('priority_morning', 1)
-        pa_priority  = pos_data.get('priority_afternoon', 1)
-        pn_priority  = pos_data.get('priority_night', 1)
-
-        BASE_PENALTY = 10000
-        def _w(pos_p, shift_p):
-            """Convert 1-based priority to integer penalty weight."""
-            return max(1, int(BASE_PENALTY / (pos_p * shift_p)))
-        
-        for d in shifts:
+
+        for d_i, d in enumerate(shifts):
             # vars for this pos/day by shift type
-            pos_day_vars = {'M': [], 'A': [], 'N': [], 'DM': [], 'DN': []}
-
-            for e in emp_list:
-                # Qualification check (Flexible containment)
-                emp_pos_str = str(e['pos']) if e['pos'] else ""
-                # Normalize employee roles: split, strip, lower
-                emp_roles = [r.strip().lower() for r in emp_pos_str.split(',') if r.strip()]
-                
-                # Check if this position is in their allowed roles
-                # We normalize the required position name as well
-                norm_pos_name = pos_name.strip().lower()
-                
-                is_qualified = False
-                if 'all' in emp_roles:
-                    is_qualified = True
-                else:
-                    # Flexible Match:
-                    # 1. Exact token match
-                    if norm_pos_name in emp_roles:
-                        is_qualified = True
-                    # 2. Substring match (e.g. "Security" in "Head of Security")
-                    # We check if the expected Position Name is contained in any of the employee's roles
-                    # OR if any of the employee's roles is contained in the Position Name.
-                    elif any(norm_pos_name in r or r in norm_pos_name for r in emp_roles):
-                        is_qualified = True
-                
+            pos_day_vars = {s: [] for s in coverage['templates']}
+            # Check which shifts are active for this position on this day
+            active_map = pos_data.get('active_shifts', {}).get(d, {'M': True, 'A': True, 'N': True})
+
+            for u, unit in enumerate(units):
+                e_i = unit['rep']
+                e = emp_list[e_i]
+                eid = e['id']
+                size = len(unit['members'])
                 # Fixed Shift override: If this (e, p, d, s) is a fixed shift, we MUST consider them qualified.
-                emp_fixed_shifts = e.get('fixed_shifts', [])
-                is_fixed_any_shift = any(f['day'] == d and f['pos_name'] == pos_name for f in emp_fixed_shifts)
-                
-                if not is_qualified and not is_fixed_any_shift:
+                if not qualified[e_i, p_idx] and (eid, d, pos_name) not in fixed_any:
                     continue
-                
-                day_av = e['avail'].get(d, [])
-                
-                # Single Shifts
-                # Check if this shift is active for this position on this day
-                active_map = pos_data.get('active_shifts', {}).get(d, {'M': True, 'A': True, 'N': True})
-                
-                if ('M' in day_av and active_map.get('M', True)) or any(f['day'] == d and f['shift'] == 'M' and f['pos_name'] == pos_name for f in emp_fixed_shifts):
-                    v = model.NewBoolVar(f"x_{e['id']}_{p_idx}_{d}_M")
-                    assignments[(e['id'], p_idx, d, 'M')] = v
-                    pos_day_vars['M'].append(v)
-                    # Force assign if fixed
-                    if any(f['day'] == d and f['shift'] == 'M' and f['pos_name'] == pos_name for f in emp_fixed_shifts):
-                        model.Add(v == 1)
-                
-                if ('A' in day_av and active_map.get('A', True)) or any(f['day'] == d and f['shift'] == 'A' and f['pos_name'] == pos_name for f in emp_fixed_shifts):
-                    v = model.NewBoolVar(f"x_{e['id']}_{p_idx}_{d}_A")
-                    assignments[(e['id'], p_idx, d, 'A')] = v
-                    pos_day_vars['A'].append(v)
-                    # Force assign if fixed
-                    if any(f['day'] == d and f['shift'] == 'A' and f['pos_name'] == pos_name for f in emp_fixed_shifts):
-                        model.Add(v == 1)
-                
-                if ('N' in day_av and active_map.get('N', True)) or any(f['day'] == d and f['shift'] == 'N' and f['pos_name'] == pos_name for f in emp_fixed_shifts):
-                    v = model.NewBoolVar(f"x_{e['id']}_{p_idx}_{d}_N")
-                    assignments[(e['id'], p_idx, d, 'N')] = v
-                    pos_day_vars['N'].append(v)
+
+                codes = allowed_shift_codes(e, d, pos_name, active_map, constraints, fixed, coverage)
+                if prune:
+                    busy = (eid, d) in fixed_days or fixed_count.get(eid, 0) >= e['max_shifts']
+                    codes, pruned = prune_shift_codes(codes, constrained_segs.get((p_idx, d), set()), busy, coverage)
+                    for reason, n in pruned.items():
+                        prune_stats[reason] += n
+                        prune_stats['pruned_vars'] += n
+                for s, is_fixed in codes:
+                    v = _new_assignment_var(model, size, f"{eid}_{p_idx}_{d}_{s}")
+                    add_assignment(store, v, u, p_idx, d_i, s)
+                    pos_day_vars[s].append(v)
+                    if coverage['templates'][s].get('double'):
+                        all_double_shifts.append(v)
                     # Force assign if fixed
-                    if any(f['day'] == d and f['shift'] == 'N' and f['pos_name'] == pos_name for f in emp_fixed_shifts):
+                    if is_fixed:
                         model.Add(v == 1)
-                
-                # Double Shifts
-                # Rule: auto_doubles only kicks in when the day was NOT manually overridden by the user.
-                # If the user manually set Can_DM/Can_DN to False in the table → we MUST respect that.
-                day_was_overridden = e.get('avail_from_override', {}).get(d, False)
-
-                can_do_dm = 'Can_DM' in day_av
-                if not day_was_overridden and constraints.get('auto_doubles', False) and 'M' in day_av:
-                    # Apply global auto_doubles rule if enabled (only for new/non-overridden days)
-                    can_do_dm = True
-
-                if constraints['allow_double'] and can_do_dm and active_map.get('M', True) and active_map.get('A', True):
-                    v = model.NewBoolVar(f"x_{e['id']}_{p_idx}_{d}_DM")
-                    assignments[(e['id'], p_idx, d, 'DM')] = v
-                    pos_day_vars['DM'].append(v)
-                    all_double_shifts.append(v)
-                
-                can_do_dn = 'Can_DN' in day_av
-                if not day_was_overridden and constraints.get('auto_doubles', False) and 'N' in day_av:
-                    # Apply global auto_doubles rule if enabled (only for new/non-overridden days)
-                    can_do_dn = True
-
-                if constraints['allow_double'] and can_do_dn and active_map.get('A', True) and active_map.get('N', True):
-                    v = model.NewBoolVar(f"x_{e['id']}_{p_idx}_{d}_DN")
-                    assignments[(e['id'], p_idx, d, 'DN')] = v
-                    pos_day_vars['DN'].append(v)
-                    all_double_shifts.append(v)
             
             # Coverage Constraints with Slack (Priority-weighted Soft Constraints)
             # Penalties are only added if the shift is ACTIVE for this position today
-            active_map = pos_data.get('active_shifts', {}).get(d, {'M': True, 'A': True, 'N': True})
+            # Lower bounds come from the capacity analysis (0 when capacity_cuts is off)
+            # One row of the template x segment coverage matrix per segment (M, A1, A2, N by default)
+            for seg, w_code, _, _, label in coverage['segments']:
+                req_key, prio_key = _DEMAND_KEYS[w_code]
+                req = pos_data[req_key]
+                if req > 0 and active_map.get(w_code, True):
+                    slack = model.NewIntVar(slack_lb.get((d, p_idx, seg), 0), req, f"slack_{p_idx}_{d}_{seg}")
+                    covering = [v for s in coverage['templates'] if seg in coverage['segments_of'][s] for v in pos_day_vars[s]]
+                    model.Add(sum(covering) + slack == req)
+                    slacks.append((f"{d}|{pos_name}|{label}", slack, _w(pos_priority, pos_data.get(prio_key, 1))))
 
-            # Morning
-            if req_m > 0 and active_map.get('M', True):
-                slack_m = model.NewIntVar(0, req_m, f"slack_{p_idx}_{d}_M")
-                model.Add(sum(pos_day_vars['M'] + pos_day_vars['DM']) + slack_m == req_m)
-                slacks.append((f"{d}|{pos_name}|בוקר", slack_m, _w(pos_priority, pm_priority)))
-            
-            # Afternoon
-            if req_a > 0 and active_map.get('A', True):
-                slack_a1 = model.NewIntVar(0, req_a, f"slack_{p_idx}_{d}_A1")
-                model.Add(sum(pos_day_vars['A'] + pos_day_vars['DM']) + slack_a1 == req_a)
-                slacks.append((f"{d}|{pos_name}|צהריים (15:00-19:00)", slack_a1, _w(pos_priority, pa_priority)))
-
-                slack_a2 = model.NewIntVar(0, req_a, f"slack_{p_idx}_{d}_A2")
-                model.Add(sum(pos_day_vars['A'] + pos_day_vars['DN']) + slack_a2 == req_a)
-                slacks.append((f"{d}|{pos_name}|צהריים (19:00-23:00)", slack_a2, _w(pos_priority, pa_priority)))
-
-            # Night
-            if req_n > 0 and active_map.get('N', True):
-                slack_n = model.NewIntVar(0, req_n, f"slack_{p_idx}_{d}_N")
-                model.Add(sum(pos_day_vars['N'] + pos_day_vars['DN']) + slack_n == req_n)
-                slacks.append((f"{d}|{pos_name}|לילה", slack_n, _w(pos_priority, pn_priority)))
+    # A day's total slack can never be below its max-flow shortage
+    if capacity is not None:
+        day_slacks = {}
+        for label, s_var, _ in slacks:
+            day_slacks.setdefault(label.split('|')[0], []).append(s_var)
+        for d, info in capacity['days'].items():
+            if info['guaranteed_shortage'] > 0 and day_slacks.get(d):
+                model.Add(sum(day_slacks[d]) >= info['guaranteed_shortage'])
+
+    if shortage_caps:
+        for label, s_var, _ in slacks:
+            if label in shortage_caps:
+                model.Add(s_var <= shortage_caps[label])
 
     # --- 3. Employee Global Constraints ---
-    for e in emp_list:
-        for i, d in enumerate(shifts):
-            # Gather assignments for (e, d) across all positions/shifts
-            day_vars = []
-            for p_idx in range(len(positions)):
-                for s in SHIFTS:
-                    if (e['id'], p_idx, d, s) in assignments:
-                        day_vars.append(assignments[(e['id'], p_idx, d, s)])
-            
-            if not day_vars: continue
+    all_vars = store['vars']
+    all_shifts = store['shift']
+
+    rest_hours, rest_rules = rest_settings(constraints, coverage)
+    rest_codes = {c for c1, c2, _ in rest_rules for c in (c1, c2)}
+    # A unit of n interchangeable employees gets the same limits scaled by n
+    for u, unit in enumerate(units):
+        e = emp_list[unit['rep']]
+        size = len(unit['members'])
+        emp_days = store['by_emp_day'][u]
+        for ks in emp_days:
+            if not ks: continue
 
             # Max 1 shift per day (No Overlap)
-            model.Add(sum(day_vars) <= 1)
+            model.Add(sum(all_vars[k] for k in ks) <= size)
             
         # Global Workload Constraint: Max total shifts
-        all_emp_vars = []
-        for (eid, pid, d, s), v in assignments.items():
-            if eid == e['id']:
-                all_emp_vars.append(v)
-        
-        if all_emp_vars:
-            model.Add(sum(all_emp_vars) <= e['max_shifts'])
-
-        for i, d in enumerate(shifts):
-            # No Back-to-Back (Night -> Next Morning)
-            if constraints['no_back_to_back'] and i < len(shifts) - 1:
-                d_next = shifts[i+1]
-                
-                # Night today (N or DN)
-                night_today = []
-                for p_idx in range(len(positions)):
-                    if (e['id'], p_idx, d, 'N') in assignments: night_today.append(assignments[(e['id'], p_idx, d, 'N')])
-                    if (e['id'], p_idx, d, 'DN') in assignments: night_today.append(assignments[(e['id'], p_idx, d, 'DN')])
-                
-                # Morning next (M or DM)
-                morning_next = []
-                for p_idx in range(len(positions)):
-                    if (e['id'], p_idx, d_next, 'M') in assignments: morning_next.append(assignments[(e['id'], p_idx, d_next, 'M')])
-                    if (e['id'], p_idx, d_next, 'DM') in assignments: morning_next.append(assignments[(e['id'], p_idx, d_next, 'DM')])
-                
-                if night_today and morning_next:
-                    model.Add(sum(night_today) + sum(morning_next) <= 1)
+        if store['by_emp'][u]:
+            model.Add(sum(all_vars[k] for k in store['by_emp'][u]) <= e['max_shifts'] * size)
+
+        # Rest between shifts: every shift that can clash with one on a later day becomes an
+        # interval [start, end + rest); one employee's intervals may not overlap, a unit's
+        # may overlap up to its size
+        if rest_rules:
+            intervals, demands = [], []
+            for d_i, ks in enumerate(emp_days):
+                for k in ks:
+                    if all_shifts[k] not in rest_codes:
+                        continue
+                    start, length = interval_minutes(coverage, all_shifts[k], d_i, rest_hours)
+                    name = f"rest_{u}_{d_i}_{all_shifts[k]}_{store['pos'][k]}"
+                    if size == 1:
+                        intervals.append(model.NewOptionalFixedSizeIntervalVar(start, length, all_vars[k], name))
+                    else:
+                        intervals.append(model.NewFixedSizeIntervalVar(start, length, name))
+                        demands.append(all_vars[k])
+            if size == 1:
+                model.AddNoOverlap(intervals)
+            elif intervals:
+                model.AddCumulative(intervals, demands, size)
 
     # --- Objective: Minimize Weighted Slack (Highest Priority) + Maximize Participation (Secondary) + Preference Bonus (Tertiary) --- 
     # Priority 1: Fill all positions (avoid big slack penalties ~1,000-10,000).
@@ -287,233 +1574,928 @@ def solve_roster(employees_df, positions, constraints, col_map, shifts, avail_ov
     # Since max preference = 10 and min slack penalty = 1,000:
     # Preferences can NEVER override coverage. They only break ties.
 
-    all_assigned_vars = list(assignments.values())
-    
     obj_terms = []
-    if all_assigned_vars:
-        obj_terms.extend(all_assigned_vars)  # +1 bonus per ANY shift assigned
+    if all_vars:
+        obj_terms.extend(all_vars)  # +1 bonus per ANY shift assigned
+    bonus_terms = []  # preferences (and repair stability) - the last lexicographic stage
 
     # --- Preference Bonus Terms ---
     # Note: emp 'id' is the DataFrame index, so pref_weights keys match directly
     if pref_weights:
-        for (eid, p_idx, d, s), var in assignments.items():
-            pos_name = positions[p_idx]['name']
-            emp_prefs = pref_weights.get(eid, {})
-            score = emp_prefs.get(pos_name, 0)
+        for k, var in enumerate(all_vars):
+            emp_prefs = pref_weights.get(emp_list[units[store['emp'][k]]['rep']]['id'], {})
+            score = emp_prefs.get(positions[store['pos'][k]]['name'], 0)
             if score > 0:
-                obj_terms.append(score * var)
+                bonus_terms.append(score * var)
 
+    # --- Repair Mode: freeze everything outside the neighbourhood ---
+    repair_stats = None
+    prev_on = set()
+    prev_free = set()  # previous assignments inside the free cells (they carry the stability bonus)
+    if repair_from is not None:
+        prev_on, _ = map_roster_to_assignments(store, emp_list, units, unit_of, positions, shifts, repair_from)
+        n_frozen = 0
+        for k, var in enumerate(all_vars):
+            cell = (shifts[store['day'][k]], positions[store['pos'][k]]['name'])
+            if cell not in repair_free_cells:
+                model.Add(var == (1 if k in prev_on else 0))
+                n_frozen += 1
+            elif k in prev_on:
+                # Keeping a previous assignment outweighs any preference but never a shortage
+                bonus_terms.append(REPAIR_STABILITY_BONUS * var)
+                model.AddHint(var, 1)
+                prev_free.add(k)
+        repair_stats = {
+            'frozen_vars': n_frozen,
+            'free_vars': len(all_vars) - n_frozen,
+            'free_cells': len(repair_free_cells),
+        }
+
+    obj_terms.extend(bonus_terms)
+    penalty_terms = [w * s_var for (_, s_var, w) in slacks]
     if slacks:
-        penalty_terms = [w * s_var for (_, s_var, w) in slacks]
         model.Maximize(sum(obj_terms) - sum(penalty_terms))
     elif obj_terms:
          # No slacks defined (unlikely), just maximize assignments
         model.Maximize(sum(obj_terms))
 
+    # --- Warm Start ---
+    hint_stats = None
+    if hint_roster is not None and not hint_roster.empty:
+        hint_stats = apply_roster_hints(model, store, emp_list, units, unit_of, positions, shifts, hint_roster)
+
+    timer.lap('build')
+
     # --- Solvers ---
     solver = cp_model.CpSolver()
-    status = solver.Solve(model)
+    profile_name = pick_solve_profile(solve_profile, len(all_vars))
+    configure_solver(solver, profile_name, max_search_workers)
+
+    # --- Streaming / early stop ---
+    streamer = None
+    stop_watch = None
+    if on_solution is not None:
+        def _snapshot(counts, slack_vals):
+            # Greedy split only: the exact fallback is a CP-SAT solve of its own, too slow for a callback
+            assigned = disaggregate_units(units, emp_list, store, counts, rest_rules, coverage, exact=False)
+            if assigned is None:
+                return None
+            partial = {'diagnostics': []}
+            build_roster_output(partial, emp_list, elig, positions, shifts, constraints, store, assigned,
+                                [(label, val) for (label, _, _), val in zip(slacks, slack_vals)])
+            return partial['roster']
+        streamer = RosterSolutionStreamer(on_solution, _snapshot, all_vars, [s_var for (_, s_var, _) in slacks])
+
+    lex_stats = None
+    if objective_mode == 'lexicographic':
+        stages = [
+            ('shortage', penalty_terms, 'min'),
+            ('participation', list(all_vars), 'max'),
+            ('preferences', bonus_terms, 'max'),
+        ]
+        solver, status, lex_stats = solve_lexicographic(
+            model, [(name, terms, sense, share) for (name, terms, sense), share in zip(stages, LEXICOGRAPHIC_SHARES)],
+            all_vars + [s_var for (_, s_var, _) in slacks], profile_name, max_search_workers, streamer, stop_event
+        )
+        stats = solve_stats(solver, status, profile_name)
+        stats['wall_time'] = round(sum(s['wall_time'] for s in lex_stats), 3)
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            # Report the weighted objective of the final roster, so both modes are comparable
+            values = batch_values(solver, all_vars + [s_var for (_, s_var, _) in slacks]).tolist()
+            counts, slack_vals = values[:len(all_vars)], values[len(all_vars):]
+            bonus = sum(solver.Value(t) for t in bonus_terms)
+            stats['objective'] = sum(counts) + bonus - sum(w * v for (_, _, w), v in zip(slacks, slack_vals))
+            solved = [s for s in lex_stats if s['objective'] is not None]
+            stats['best_bound'] = stats['objective'] + sum(abs(s['best_bound'] - s['objective']) for s in solved)
+            stats['gap'] = max(s['gap'] for s in solved)
+    else:
+        if stop_event is not None:
+            stop_watch = watch_stop_event(solver, stop_event)
+
+        status = solver.Solve(model, streamer)
+        if stop_watch is not None:
+            stop_watch.set()
+        stats = solve_stats(solver, status, profile_name)
+    timer.lap('solve')
     
-    result = {'status': solver.StatusName(status), 'roster': None, 'diagnostics': []}
+    result = {
+        'status': solver.StatusName(status),
+        'roster': None,
+        'diagnostics': [],
+        'solve_stats': stats,
+        'lexicographic_stats': lex_stats,
+        'prune_stats': prune_stats,
+        'hint_stats': hint_stats,
+        'repair_stats': repair_stats,
+        'symmetry_stats': {'employees': len(emp_list), 'units': len(units), 'assignment_vars': len(all_vars)},
+        'capacity': capacity,
+    }
     
     if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-        data = []
-        for (eid, pid, d, s), var in assignments.items():
-            if solver.Value(var):
-                emp_name = next(e['name'] for e in emp_list if e['id'] == eid)
-                pos_name = positions[pid]['name']
-                
-                # Convert Shift Code to Display Name
-                s_display = s
-                if s == 'M': s_display = 'בוקר (07-15)'
-                elif s == 'A': s_display = 'צהריים (15-23)'
-                elif s == 'N': s_display = 'לילה (23-07)'
-                elif s == 'DM': s_display = 'כפולה בוקר (07-19)'
-                elif s == 'DN': s_display = 'כפולה לילה (19-07)'
-                
-                data.append({
-                    "יום": d,
-                    "עמדה": pos_name,
-                    "משמרת": s_display,
-                    "raw_shift": s,
-                    "עובד": emp_name
+        # Batch read all assignment and slack values in one pass
+        counts = batch_values(solver, all_vars).tolist()
+        if repair_stats is not None:
+            now_on = {k for k, c in enumerate(counts) if c > 0}
+            repair_stats['added'] = len(now_on - set(prev_on))
+            # Previous rows without a variable anymore (removed guard, lost availability) are gone too
+            prev_rows = repair_from[(repair_from['raw_shift'] != 'SHORTAGE') & repair_from['יום'].isin(shifts)]
+            unmatched = len(prev_rows) - sum(prev_on.values())
+            repair_stats['removed'] = len(set(prev_on) - now_on) + unmatched
+            # objective - REPAIR_STABILITY_BONUS * kept is the plain roster objective
+            repair_stats['kept'] = len(prev_free & now_on)
+        slack_vals = batch_values(solver, [s_var for (_, s_var, _) in slacks])
+
+        # Individual (employee row, assignment index) pairs
+        assigned = disaggregate_units(units, emp_list, store, counts, rest_rules, coverage)
+        if assigned is None:
+            # The class-level counts could not be split between individuals - solve per employee
+            return solve_roster(
+                employees_df, positions, constraints, col_map, shifts,
+                avail_overrides=avail_overrides, pref_weights=pref_weights, max_shifts_map=max_shifts_map,
+                fixed_shifts_map=fixed_shifts_map, calc_potentials=calc_potentials, solve_profile=solve_profile,
+                hint_roster=hint_roster, symmetry_reduction=False, max_search_workers=max_search_workers,
+                rest_carry_in=rest_carry_in, capacity_cuts=capacity_cuts, engine='cp_sat', on_solution=on_solution,
+                stop_event=stop_event, objective_mode=objective_mode, prune=prune, parsed=parsed,
+                num_rosters=num_rosters, min_difference=min_difference, metrics_log=metrics_log,
+                shortage_caps=shortage_caps
+            )
+
+        slack_values = [(label, val) for (label, _, _), val in zip(slacks, slack_vals.tolist())]
+        timer.lap('extract')
+        build_roster_output(result, emp_list, elig, positions, shifts, constraints, store, assigned,
+                            slack_values, calc_potentials, pref_weights, timer)
+
+        # --- Diverse alternatives on the same model ---
+        if num_rosters > 1 and not (stop_event is not None and stop_event.is_set()):
+            slack_vars = [s_var for (_, s_var, _) in slacks]
+            unit_sizes = [len(units[u]['members']) for u in store['emp']]
+            result['alternatives'] = []
+            for values, alt_status, alt_stats in solve_diverse(model, all_vars, unit_sizes, all_vars + slack_vars, counts,
+                                                               num_rosters - 1, min_difference, profile_name,
+                                                               max_search_workers, stop_event):
+                alt_counts = values[:len(all_vars)]
+                alt_assigned = disaggregate_units(units, emp_list, store, alt_counts, rest_rules, coverage)
+                if alt_assigned is None:
+                    continue
+                alt = {
+                    'status': alt_status,
+                    'roster': None,
+                    'diagnostics': [],
+                    'solve_stats': alt_stats,
+                    'difference': sum(max(0, c - a) for c, a in zip(counts, alt_counts)),
+                }
+                build_roster_output(alt, emp_list, elig, positions, shifts, constraints, store, alt_assigned,
+                                    [(label, val) for (label, _, _), val in zip(slacks, values[len(all_vars):])])
+                result['alternatives'].append(alt)
+            timer.lap('alternatives')
+
+    record_metrics(result, timer, 'cp_sat', metrics_log, model=model, solver=solver, prune_stats=prune_stats,
+                   sizes={**sizes, 'units': len(units), 'assignment_vars': len(all_vars)})
+    return result
+
+
+def record_metrics(result, timer, engine, metrics_log=None, **kwargs):
+    """Stores result['metrics'] (see solve_metrics.build_metrics) and appends it to the JSONL log, if any."""
+    result['metrics'] = build_metrics(timer, engine, **kwargs)
+    append_metrics_log(result['metrics'], result.get('status'), metrics_log)
+
+
+def build_gap_index(emp_list, elig, positions, shifts, constraints, emp_assignments_map):
+    """
+    Lookup sets for the gap recommendations, built once per roster (employee rows):
+      'free'         - {day: employees with no assignment that day}
+      'available'    - {(day, shift code): employees who marked that shift's availability}
+      'rest_blocked' - {(day, shift code): employees whose assignments on the neighbouring
+                       days leave too little rest for that shift (see rest_settings)}
+      'eligible'     - {position name: employees qualified for it}
+      'headroom'     - max_shifts left per employee
+      'covering'     - {segment label: shift codes that cover the segment}
+    Shift codes are the codes of the active templates (constraints['shift_templates']);
+    doubles only count when constraints['allow_double'] is on.
+    """
+    coverage = shift_coverage(constraints)
+    _, conflicts = rest_settings(constraints, coverage)
+    codes = [s for s, t in coverage['templates'].items() if not t.get('double') or constraints.get('allow_double')]
+    covering = {label: [s for s in codes if key in coverage['segments_of'][s]]
+                for key, _, _, _, label in coverage['segments']}
+    free, available, rest_blocked = {}, {}, {}
+    headroom = []
+    for e_i, e in enumerate(emp_list):
+        worked = emp_assignments_map[e['id']]
+        headroom.append(e['max_shifts'] - sum(len(v) for v in worked.values()))
+        worked_idx = {elig['day_index'][d]: codes for d, codes in worked.items() if d in elig['day_index']}
+        for d_i, d in enumerate(shifts):
+            if d not in worked:
+                free.setdefault(d, set()).add(e_i)
+            day_av = e['avail'].get(d, [])
+            for code in codes:
+                if coverage['templates'][code]['avail'] in day_av:
+                    available.setdefault((d, code), set()).add(e_i)
+        for c1, c2, off in conflicts:
+            for d_i, codes in worked_idx.items():
+                if c1 in codes and d_i + off < len(shifts):
+                    rest_blocked.setdefault((shifts[d_i + off], c2), set()).add(e_i)
+                if c2 in codes and d_i - off >= 0:
+                    rest_blocked.setdefault((shifts[d_i - off], c1), set()).add(e_i)
+    eligible = {}
+    for p_idx, pos_data in enumerate(positions):
+        eligible.setdefault(pos_data['name'], set()).update(np.flatnonzero(elig['qualified'][:, p_idx]).tolist())
+    return {'free': free, 'available': available, 'rest_blocked': rest_blocked, 'eligible': eligible,
+            'headroom': headroom, 'covering': covering}
+
+
+def gap_candidates(gap_index, emp_list, pos_name, day, segment_label, pref_weights=None):
+    """
+    Employees who could fill a shortage of the segment labelled segment_label (the last part
+    of a slack label) at pos_name on `day`: qualified, free that day and not blocked by the
+    rest rule for at least one shift that covers the segment. Returns (available - marked
+    such a shift, potential - technically free), each ranked by preference for the position,
+    then by max_shifts headroom.
+    """
+    free = gap_index['eligible'].get(pos_name, set()) & gap_index['free'].get(day, set())
+    cands, marked = set(), set()
+    for code in gap_index['covering'].get(segment_label, ()):
+        open_for = free - gap_index['rest_blocked'].get((day, code), set())
+        cands |= open_for
+        marked |= open_for & gap_index['available'].get((day, code), set())
+
+    def _rank(e_i):
+        score = (pref_weights or {}).get(emp_list[e_i]['id'], {}).get(pos_name, 0)
+        return (-score, -gap_index['headroom'][e_i], e_i)
+
+    return sorted(marked, key=_rank), sorted(cands - marked, key=_rank)
+
+
+def build_roster_output(result, emp_list, elig, positions, shifts, constraints, store, assigned,
+                        slack_values, calc_potentials=False, pref_weights=None, timer=None):
+    """
+    Fills result with the solved roster: 'roster' (with shortage rows), 'diagnostics',
+    'shortage_summary', 'gap_recommendations' and 'surplus_report'.
+    Gap recommendations (calc_potentials) come from set lookups (see build_gap_index).
+    assigned: (employee row, assignment index in store) pairs; slack_values: (label, value) pairs.
+    timer: PhaseTimer of the solve - gets the 'shortages', 'roster_frame' and 'surplus' phases.
+    Shared by every engine so they all return the same result dict.
+    """
+    # Columnar roster: one list per output column
+    data = {"יום": [], "עמדה": [], "משמרת": [], "raw_shift": [], "עובד": []}
+    display_names = {s: t.get('name', SHIFT_DISPLAY_NAMES.get(s, s)) for s, t in shift_coverage(constraints)['templates'].items()}
+    for e_i, k in assigned:
+        s = store['shift'][k]
+        data["יום"].append(shifts[store['day'][k]])
+        data["עמדה"].append(positions[store['pos'][k]]['name'])
+        data["משמרת"].append(display_names.get(s, s))
+        data["raw_shift"].append(s)
+        data["עובד"].append(emp_list[e_i]['name'])
+    
+    # NOTE: roster DataFrame is created AFTER slacks loop below,
+    # so that shortage rows injected during slack analysis are included.
+    
+    # Check Slacks for Warnings & Stats
+    shortage_summary = {}
+    # gap_recommendations will be grouped by shortage
+    gap_recs_by_shortage = {}
+    injected_shortages = set()  # Track (day, pos, shift_group) to avoid duplicate shortage rows
+    gap_index = None  # built on the first shortage that needs recommendations
+    
+    # 1. Map assigned shifts per employee per day for fast lookup
+    # Format: emp_assignments[emp_id][day] = list of assigned shift types ('M', 'N', 'DM'...)
+    emp_assignments_map = {e['id']: {} for e in emp_list}
+    for e_i, k in assigned:
+        emp_assignments_map[emp_list[e_i]['id']].setdefault(shifts[store['day'][k]], []).append(store['shift'][k])
+    
+    # 2. Analyze Slacks
+    for label, val in slack_values:
+        # Label format: "Day|PosName|ShiftType" e.g. "ראשון|שער ראשי|בוקר"
+        if val > 0:
+            shortage_summary[label] = val
+            result['diagnostics'].append(f"חסר/ים {val} עובדים ב: {label}")
+    
+            # --- Gap Filling Logic & Roster Injection ---
+            # Parse label to understand what is missing
+            parts = label.split('|')
+            if len(parts) >= 3:
+               miss_day = parts[0]
+               miss_pos = parts[1]
+               miss_type_desc = parts[2]
+    
+               # Determine shift GROUP for deduplication
+               shift_group = 'other'
+               if 'בוקר' in miss_type_desc: shift_group = 'בוקר'
+               elif 'צהריים' in miss_type_desc: shift_group = 'צהריים'
+               elif 'לילה' in miss_type_desc: shift_group = 'לילה'
+    
+               # Clean display shift name
+               display_shift = shift_group
+               if shift_group == 'בוקר': display_shift = 'בוקר (07:00-15:00)'
+               elif shift_group == 'צהריים': display_shift = 'צהריים (15:00-23:00)'
+               elif shift_group == 'לילה': display_shift = 'לילה (23:00-07:00)'
+    
+               dedup_key = (miss_day, miss_pos, shift_group)
+    
+               # Only inject ONE shortage row per raw shortage group
+               if dedup_key not in injected_shortages:
+                   injected_shortages.add(dedup_key)
+    
+                   data["יום"].append(miss_day)
+                   data["עמדה"].append(miss_pos)
+                   data["משמרת"].append(display_shift)
+                   data["raw_shift"].append("SHORTAGE")
+                   data["עובד"].append(f"⚠️ חוסר ({val})")
+    
+               # --- Recommendation Logic PER UNIQUE SHORTAGE ---
+               if calc_potentials:
+                   # Only generate recs if this is the first time we see this shortage group
+                   # OR if we want to allow partial suggestions (let's stick to unique group to assume coverage)
+                   # Actually, simple slacks loop is fine, but result key should be readable.
+    
+                   shortage_key = f"{miss_pos} | {miss_day} | {display_shift}"
+                   if shortage_key not in gap_recs_by_shortage:
+                       gap_recs_by_shortage[shortage_key] = {'available': [], 'potential': []}
+    
+                   if gap_index is None:
+                       gap_index = build_gap_index(emp_list, elig, positions, shifts, constraints, emp_assignments_map)
+                   available, potential = gap_candidates(gap_index, emp_list, miss_pos, miss_day, miss_type_desc, pref_weights)
+                   # Simplify message since it's grouped under the shortage header now
+                   gap_recs_by_shortage[shortage_key]['available'].extend(f"**{emp_list[e_i]['name']}**" for e_i in available)
+                   gap_recs_by_shortage[shortage_key]['potential'].extend(f"**{emp_list[e_i]['name']}**" for e_i in potential)
+    
+    result['shortage_summary'] = shortage_summary
+    result['gap_recommendations'] = gap_recs_by_shortage
+    if timer is not None:
+        timer.lap('shortages')
+    
+    # NOW build the roster DataFrame (after shortage rows were appended to data)
+    result['roster'] = pd.DataFrame(data)
+    if not result['roster'].empty:
+        result['roster'] = result['roster'].sort_values(by=["יום", "עמדה", "משמרת"])
+    if timer is not None:
+        timer.lap('roster_frame')
+    # --- Surplus Report: Available but not assigned ---
+    # Employees who marked availability but weren't scheduled (all positions full)
+    surplus_report = {}  # { day: [ {'name': str, 'shifts': str} ] }
+    
+    SHIFT_DISPLAY = {'M': 'בוקר', 'A': 'צהריים', 'N': 'לילה'}
+    coverage = shift_coverage(constraints)
+    _, rest_conflict_set = rest_settings(constraints, coverage)
+    singles = [s for s, t in coverage['templates'].items() if not t.get('double')]
+    
+    for e in emp_list:
+        eid = e['id']
+        ename = e['name']
+        for d_i, day in enumerate(shifts):
+            day_avail = e['avail'].get(day, [])
+            # Only count single shifts the employee marked (M, A, N by default), not doubles
+            real_avail = [s for s in singles if coverage['templates'][s]['avail'] in day_avail]
+    
+            if not real_avail:
+                continue  # Not available this day
+    
+            # Check if assigned anywhere this day
+            assigned_today = emp_assignments_map[eid].get(day, [])
+    
+            if not assigned_today:
+                # Before marking as surplus, filter out shifts blocked by rest constraints:
+                # too little rest after a shift on an earlier day or before one on a later day
+                truly_available = [
+                    s for s in real_avail
+                    if not any(
+                        (c2 == s and d_i - off >= 0 and c1 in emp_assignments_map[eid].get(shifts[d_i - off], []))
+                        or (c1 == s and d_i + off < len(shifts) and c2 in emp_assignments_map[eid].get(shifts[d_i + off], []))
+                        for c1, c2, off in rest_conflict_set
+                    )
+                ]
+    
+                if not truly_available:
+                    continue  # All availability was blocked by rest rules → not surplus
+    
+                # Available but NOT assigned → Surplus!
+                avail_display = ", ".join([SHIFT_DISPLAY.get(s, display_names.get(s, s)) for s in truly_available])
+                if day not in surplus_report:
+                    surplus_report[day] = []
+                surplus_report[day].append({
+                    'name': ename,
+                    'shifts': avail_display
                 })
-        
-        # NOTE: roster DataFrame is created AFTER slacks loop below,
-        # so that shortage rows injected during slack analysis are included.
-            
-        # Check Slacks for Warnings & Stats
-        shortage_summary = {}
-        # gap_recommendations will be grouped by shortage
-        gap_recs_by_shortage = {}
-        injected_shortages = set()  # Track (day, pos, shift_group) to avoid duplicate shortage rows
-        
-        # 1. Map assigned shifts per employee per day for fast lookup
-        # Format: emp_assignments[emp_id][day] = list of assigned shift types ('M', 'N', 'DM'...)
-        emp_assignments_map = {e['id']: {} for e in emp_list}
-        for (eid, pid, d, s), var in assignments.items():
-            if solver.Value(var):
-                if d not in emp_assignments_map[eid]:
-                    emp_assignments_map[eid][d] = []
-                emp_assignments_map[eid][d].append(s)
-
-        # 2. Analyze Slacks
-        for slack_tuple in slacks:
-            # Tuple structure: (label, var, weight)
-            # Label format: "Day|PosName|ShiftType" e.g. "ראשון|שער ראשי|בוקר"
-            label, s_var, _ = slack_tuple
-            val = solver.Value(s_var)
-            
-            if val > 0:
-                shortage_summary[label] = val
-                result['diagnostics'].append(f"חסר/ים {val} עובדים ב: {label}")
-                
-                # --- Gap Filling Logic & Roster Injection ---
-                # Parse label to understand what is missing
-                parts = label.split('|')
-                if len(parts) >= 3:
-                   miss_day = parts[0]
-                   miss_pos = parts[1]
-                   miss_type_desc = parts[2]
-                   
-                   # Determine shift GROUP for deduplication
-                   shift_group = 'other'
-                   if 'בוקר' in miss_type_desc: shift_group = 'בוקר'
-                   elif 'צהריים' in miss_type_desc: shift_group = 'צהריים'
-                   elif 'לילה' in miss_type_desc: shift_group = 'לילה'
-
-                   # Clean display shift name
-                   display_shift = shift_group
-                   if shift_group == 'בוקר': display_shift = 'בוקר (07:00-15:00)'
-                   elif shift_group == 'צהריים': display_shift = 'צהריים (15:00-23:00)'
-                   elif shift_group == 'לילה': display_shift = 'לילה (23:00-07:00)'
-                   
-                   dedup_key = (miss_day, miss_pos, shift_group)
-                   
-                   # Only inject ONE shortage row per raw shortage group
-                   if dedup_key not in injected_shortages:
-                       injected_shortages.add(dedup_key)
-                       
-                       data.append({
-                            "יום": miss_day,
-                            "עמדה": miss_pos,
-                            "משמרת": display_shift,
-                            "raw_shift": "SHORTAGE",
-                            "עובד": f"⚠️ חוסר ({val})" 
-                       })
-                       
-                   # --- Recommendation Logic PER UNIQUE SHORTAGE ---
-                   if calc_potentials:
-                       # Only generate recs if this is the first time we see this shortage group
-                       # OR if we want to allow partial suggestions (let's stick to unique group to assume coverage)
-                       # Actually, simple slacks loop is fine, but result key should be readable.
-                       
-                       shortage_key = f"{miss_pos} | {miss_day} | {display_shift}"
-                       if shortage_key not in gap_recs_by_shortage:
-                           gap_recs_by_shortage[shortage_key] = {'available': [], 'potential': []}
-
-                       # Determine required shift code based on description
-                       req_code = '?' 
-                       if 'בוקר' in miss_type_desc: req_code = 'M'
-                       if 'צהריים' in miss_type_desc: req_code = 'A'
-                       if 'לילה' in miss_type_desc: req_code = 'N'
-                       
-                       # Scan all employees for potential match for THIS shortage
-                       for e in emp_list:
-                           eid = e['id']
-                           ename = e['name']
-                           
-                           # A. Check Explicit Availability
-                           day_avail = e['avail'].get(miss_day, [])
-                           is_explicitly_available = req_code in day_avail
-                           
-                           # B. Check Hard Constraints
-                           occupied_today = emp_assignments_map[eid].get(miss_day, [])
-                           if occupied_today: continue
-                               
-                           # Rest Rules
-                           violates_rest = False
-                           if req_code == 'M':
-                               try:
-                                   d_idx = shifts.index(miss_day)
-                                   if d_idx > 0:
-                                       prev_day = shifts[d_idx - 1]
-                                       prev_shifts = emp_assignments_map[eid].get(prev_day, [])
-                                       if 'N' in prev_shifts or 'DN' in prev_shifts: violates_rest = True
-                               except ValueError: pass
-                           if req_code == 'N':
-                               try:
-                                   d_idx = shifts.index(miss_day)
-                                   if d_idx < len(shifts) - 1:
-                                       next_day = shifts[d_idx + 1]
-                                       next_shifts = emp_assignments_map[eid].get(next_day, [])
-                                       if 'M' in next_shifts or 'DM' in next_shifts: violates_rest = True
-                               except ValueError: pass
-                
-                           if violates_rest: continue
-                
-                           # C. Categorize Recommendation
-                           # Simplify message since it's grouped under the shortage header now
-                           rec_msg = f"**{ename}**" 
-                           
-                           if is_explicitly_available:
-                               gap_recs_by_shortage[shortage_key]['available'].append(rec_msg)
-                           else:
-                               gap_recs_by_shortage[shortage_key]['potential'].append(rec_msg)
-
-        result['shortage_summary'] = shortage_summary
-        result['gap_recommendations'] = gap_recs_by_shortage
-
-        # NOW build the roster DataFrame (after shortage rows were appended to data)
-        result['roster'] = pd.DataFrame(data)
-        if not result['roster'].empty:
-            result['roster'] = result['roster'].sort_values(by=["יום", "עמדה", "משמרת"])
-        # --- Surplus Report: Available but not assigned ---
-        # Employees who marked availability but weren't scheduled (all positions full)
-        surplus_report = {}  # { day: [ {'name': str, 'shifts': str} ] }
-        
-        SHIFT_DISPLAY = {'M': 'בוקר', 'A': 'צהריים', 'N': 'לילה'}
-        
-        for e in emp_list:
-            eid = e['id']
-            ename = e['name']
-            for d_i, day in enumerate(shifts):
-                day_avail = e['avail'].get(day, [])
-                # Only count real shift availability (M, A, N), not Can_DM/Can_DN
-                real_avail = [s for s in day_avail if s in ('M', 'A', 'N')]
-                
-                if not real_avail:
-                    continue  # Not available this day
-                    
-                # Check if assigned anywhere this day
-                assigned_today = emp_assignments_map[eid].get(day, [])
-                
-                if not assigned_today:
-                    # Before marking as surplus, filter out shifts blocked by rest constraints
-                    # Rule: Night/DN yesterday → Morning today is blocked
-                    truly_available = list(real_avail)
-                    
-                    if constraints.get('no_back_to_back', False) and d_i > 0:
-                        prev_day = shifts[d_i - 1]
-                        prev_assigned = emp_assignments_map[eid].get(prev_day, [])
-                        worked_night_yesterday = any(s in ('N', 'DN') for s in prev_assigned)
-                        
-                        if worked_night_yesterday:
-                            # Remove morning shifts — blocked by rest rule, not surplus
-                            truly_available = [s for s in truly_available if s not in ('M',)]
-                    
-                    if not truly_available:
-                        continue  # All availability was blocked by rest rules → not surplus
-                    
-                    # Available but NOT assigned → Surplus!
-                    avail_display = ", ".join([SHIFT_DISPLAY.get(s, s) for s in truly_available])
-                    if day not in surplus_report:
-                        surplus_report[day] = []
-                    surplus_report[day].append({
-                        'name': ename,
-                        'shifts': avail_display
-                    })
-        
-        result['surplus_report'] = surplus_report
+    
+    result['surplus_report'] = surplus_report
+    if timer is not None:
+        timer.lap('surplus')
 
-        return result
+
+def repair_roster(previous_roster, change_set, employees_df, positions, constraints, col_map, shifts,
+                  radius=0, avail_overrides=None, **solve_kwargs):
+    """
+    Incremental repair: re-solves only the neighbourhood of the roster affected by an edit
+    and keeps every other assignment exactly as it is in previous_roster.
+
+    change_set keys (all optional):
+      'availability'      - {emp_id: {day: [M, A, N, DM, DN] bools}} new availability per day
+      'removed_employees' - [emp_id, ...] guards to drop (e.g. called in sick for the week)
+      'demand'            - {pos_name: {field: value}} position updates ('guards_night', 'active_shifts', ...)
+      'days' / 'positions' - extra days / position names to open for re-optimisation
+
+    The neighbourhood is (affected positions) x (affected days +- radius days). A cell is
+    affected when a changed/removed guard worked it in previous_roster, when it had a
+    shortage on a day a guard gained availability, or when its position's demand changed.
+    Remaining keyword arguments are passed to solve_roster.
+    """
+    positions = [dict(p) for p in positions]
+    overrides = dict(avail_overrides) if avail_overrides else {}
+    affected_days = set(change_set.get('days', []))
+    affected_positions = set(change_set.get('positions', []))
+
+    rows = previous_roster[previous_roster['raw_shift'] != 'SHORTAGE']
+    shortage_rows = previous_roster[previous_roster['raw_shift'] == 'SHORTAGE']
+    name_col = col_map['name']
+
+    def _worked_cells(emp_id, days=None):
+        emp_name = str(employees_df.at[emp_id, name_col])
+        emp_rows = rows[rows['עובד'].astype(str) == emp_name]
+        if days is not None:
+            emp_rows = emp_rows[emp_rows['יום'].isin(days)]
+        return set(zip(emp_rows['יום'], emp_rows['עמדה']))
+
+    # 1. Availability changes -> merged into the manual overrides (only the changed days)
+    for emp_id, day_map in change_set.get('availability', {}).items():
+        ov = overrides.get(emp_id)
+        ov = ov.copy() if ov is not None and hasattr(ov, 'columns') else pd.DataFrame(index=range(5))
+        for day, vals in day_map.items():
+            ov[str(day).strip()] = list(vals)
+        overrides[emp_id] = ov
+
+        days = set(day_map.keys())
+        for d, p in _worked_cells(emp_id, days):
+            affected_days.add(d)
+            affected_positions.add(p)
+        # Newly available on a short-staffed day - open the short positions
+        for d, p in zip(shortage_rows['יום'], shortage_rows['עמדה']):
+            if d in days:
+                affected_days.add(d)
+                affected_positions.add(p)
+
+    # 2. Removed employees -> every cell they worked
+    removed = list(change_set.get('removed_employees', []))
+    for emp_id in removed:
+        for d, p in _worked_cells(emp_id):
+            affected_days.add(d)
+            affected_positions.add(p)
+    employees_df = employees_df.drop(index=[i for i in removed if i in employees_df.index])
+
+    # 3. Demand changes -> the whole position (limited to the days whose activity changed, if given)
+    for pos_name, updates in change_set.get('demand', {}).items():
+        for p in positions:
+            if p['name'] != pos_name:
+                continue
+            new_active = updates.get('active_shifts')
+            only_activity = set(updates.keys()) == {'active_shifts'}
+            if only_activity and new_active is not None:
+                old_active = p.get('active_shifts', {})
+                affected_days.update(d for d in shifts if new_active.get(d) != old_active.get(d))
+            else:
+                affected_days.update(shifts)
+            affected_positions.add(pos_name)
+            p.update(updates)
+
+    # 4. Expand by radius (in days) and build the free cells
+    day_idx = {d: i for i, d in enumerate(shifts)}
+    free_days = set()
+    for d in affected_days:
+        if d not in day_idx:
+            continue
+        i = day_idx[d]
+        free_days.update(shifts[max(0, i - radius):i + radius + 1])
+    free_cells = {(d, p) for d in free_days for p in affected_positions}
+
+    result = solve_roster(
+        employees_df, positions, constraints, col_map, shifts,
+        avail_overrides=overrides,
+        repair_from=previous_roster,
+        repair_free_cells=free_cells,
+        **solve_kwargs
+    )
+    if result.get('repair_stats') is not None:
+        result['repair_stats']['free_days'] = [d for d in shifts if d in free_days]
+        result['repair_stats']['free_positions'] = sorted(affected_positions)
+    return result
+
+
+# Below this many employees a single in-process solve beats the process start-up cost
+PARALLEL_MIN_EMPLOYEES = 150
+
+
+def find_roster_components(employees_df, positions, col_map, fixed_shifts_map=None):
+    """
+    Connected components of the employee-position eligibility graph (qualification by role
+    string, plus iron shifts). Employees in different components never compete for the same
+    position, so each component can be solved on its own.
+    Returns a list of (employee df indices, position indices); employees qualified for no
+    position come back as components with an empty position list.
+    """
+    norm_pos_names = [p['name'].strip().lower() for p in positions]
+    pos_idx_by_name = {}
+    for p_idx, p in enumerate(positions):
+        pos_idx_by_name.setdefault(p['name'], []).append(p_idx)
+
+    # Union-find over positions; each employee joins all the positions it can work
+    parent = list(range(len(positions)))
+
+    def _find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    emp_positions = {}
+    role_cache = {}
+    for idx, pos_str in zip(employees_df.index, employees_df[col_map['pos']]):
+        pos_str = str(pos_str)
+        if pos_str not in role_cache:
+            emp_roles = _parse_roles(pos_str)
+            role_cache[pos_str] = [p_idx for p_idx, n in enumerate(norm_pos_names) if _is_qualified(emp_roles, n)]
+        p_list = list(role_cache[pos_str])
+        for f in (fixed_shifts_map or {}).get(idx, []):
+            p_list.extend(pos_idx_by_name.get(f['pos_name'], []))
+        emp_positions[idx] = p_list
+        for p_idx in p_list[1:]:
+            a, b = _find(p_list[0]), _find(p_idx)
+            if a != b:
+                parent[b] = a
+
+    comp_of_root = {}
+    components = []
+    for p_idx in range(len(positions)):
+        root = _find(p_idx)
+        if root not in comp_of_root:
+            comp_of_root[root] = len(components)
+            components.append(([], []))
+        components[comp_of_root[root]][1].append(p_idx)
+    for idx, p_list in emp_positions.items():
+        if p_list:
+            components[comp_of_root[_find(p_list[0])]][0].append(idx)
+        else:
+            components.append(([idx], []))
+    return components
+
+
+def _merge_results(parts, shifts, sequential=False):
+    """
+    Merges the result dicts of independent sub-problems into one solve_roster-style result.
+    sequential=True when the parts ran one after another (rolling horizon windows).
+    """
+    solved = [r for r in parts if r.get('roster') is not None]
+    failed = [r for r in parts if r.get('roster') is None and r.get('status') != 'No Employees Found']
+    if failed or not solved:
+        merged = dict(failed[0]) if failed else dict(parts[0])
+        merged['diagnostics'] = [msg for r in parts for msg in r.get('diagnostics', [])]
+        return merged
+
+    statuses = {r['status'] for r in solved}
+    merged = {
+        'status': 'OPTIMAL' if statuses == {'OPTIMAL'} else 'FEASIBLE',
+        'diagnostics': [msg for r in solved for msg in r.get('diagnostics', [])],
+        'shortage_summary': {},
+        'gap_recommendations': {},
+        'surplus_report': {},
+    }
+    for r in solved:
+        merged['shortage_summary'].update(r.get('shortage_summary', {}))
+        merged['gap_recommendations'].update(r.get('gap_recommendations', {}))
+    for day in shifts:
+        day_surplus = [item for r in solved for item in r.get('surplus_report', {}).get(day, [])]
+        if day_surplus:
+            merged['surplus_report'][day] = day_surplus
+
+    roster = pd.concat([r['roster'] for r in solved], ignore_index=True)
+    if not roster.empty:
+        roster = roster.sort_values(by=["יום", "עמדה", "משמרת"])
+    merged['roster'] = roster
+
+    stats = [r['solve_stats'] for r in solved if r.get('solve_stats')]
+    if stats:
+        merged['solve_stats'] = _merge_solve_stats(stats, sequential)
+    # Every part ran the same lexicographic stages
+    lex = [r.get('lexicographic_stats') for r in solved]
+    merged['lexicographic_stats'] = None
+    if lex and all(lex) and len({len(stages) for stages in lex}) == 1:
+        merged['lexicographic_stats'] = [
+            {**_merge_solve_stats(list(stage), sequential), 'stage': stage[0]['stage']} for stage in zip(*lex)
+        ]
+    caps = [r.get('capacity') for r in solved]
+    merged['capacity'] = _merge_capacity(caps) if caps and all(caps) else None
+    hints = [r['hint_stats'] for r in solved if r.get('hint_stats')]
+    merged['hint_stats'] = None
+    if hints:
+        rows = sum(h['rows'] for h in hints)
+        kept = sum(h['kept'] for h in hints)
+        merged['hint_stats'] = {'rows': rows, 'kept': kept, 'ratio': round(kept / rows, 3) if rows else 0.0}
+    merged['symmetry_stats'] = {
+        key: sum(r.get('symmetry_stats', {}).get(key, 0) for r in solved)
+        for key in ('employees', 'units', 'assignment_vars')
+    }
+    prunes = [r['prune_stats'] for r in solved if r.get('prune_stats')]
+    merged['prune_stats'] = {key: sum(p[key] for p in prunes) for key in prunes[0]} if prunes else None
+    merged['metrics'] = merge_metrics([r.get('metrics') for r in solved], sequential)
+    merged['components'] = len(parts)
+
+    # Alternative k combines every part's alternative k (its best roster when it has fewer):
+    # it differs from the merged best by at least as much as any of its parts does
+    n_alternatives = max(len(r.get('alternatives') or []) for r in solved)
+    if n_alternatives:
+        merged['alternatives'] = []
+        for k in range(n_alternatives):
+            views = [
+                r['alternatives'][k] if k < len(r.get('alternatives') or [])
+                else {**{key: v for key, v in r.items() if key != 'alternatives'}, 'difference': 0}
+                for r in solved
+            ]
+            alt = _merge_results(views, shifts, sequential)
+            merged['alternatives'].append({
+                'status': alt['status'],
+                'roster': alt.get('roster'),
+                'diagnostics': alt.get('diagnostics', []),
+                'solve_stats': alt.get('solve_stats'),
+                'difference': sum(v.get('difference', 0) for v in views),
+                'shortage_summary': alt.get('shortage_summary', {}),
+                'gap_recommendations': alt.get('gap_recommendations', {}),
+                'surplus_report': alt.get('surplus_report', {}),
+            })
+    return merged
+
+
+def _merge_solve_stats(stats, sequential=False):
+    """
+    solve_stats of sub-problems as one: side-by-side parts take as long as the slowest one
+    (sequential parts add up), objectives and bounds add up, and an unsolved part leaves
+    the whole unsolved.
+    """
+    merged = {
+        'profile': stats[0]['profile'] if len({s['profile'] for s in stats}) == 1 else 'mixed',
+        'wall_time': round(sum(s['wall_time'] for s in stats), 3) if sequential else max(s['wall_time'] for s in stats),
+        'objective': None,
+        'best_bound': None,
+        'gap': None,
+    }
+    if all(s['objective'] is not None for s in stats):
+        obj = sum(s['objective'] for s in stats)
+        bound = sum(s['best_bound'] for s in stats)
+        merged.update({'objective': obj, 'best_bound': bound, 'gap': abs(bound - obj) / max(1.0, abs(obj))})
+    return merged
+
+
+def _merge_capacity(caps):
+    """capacity_bounds(...) of sub-problems on the same days as one: per-day figures add up, slots are listed together."""
+    days = {}
+    for cap in caps:
+        for d, info in cap['days'].items():
+            day = days.setdefault(d, {'demand': 0, 'max_coverage': 0, 'guaranteed_shortage': 0})
+            for key in day:
+                day[key] += info[key]
+    return {
+        'days': days,
+        'slots': [slot for cap in caps for slot in cap['slots']],
+        'demand': sum(cap['demand'] for cap in caps),
+        'max_coverage': sum(cap['max_coverage'] for cap in caps),
+        'guaranteed_shortage': sum(cap['guaranteed_shortage'] for cap in caps),
+    }
+
+
+def _merged_streamer(on_solution, n_parts):
+    """
+    Snapshot publisher of a streamed solve split into n_parts sub-problems: publish(part, snapshot)
+    keeps every part's latest RosterSolutionStreamer snapshot and, once each part has one, hands
+    on_solution a merged snapshot (rosters concatenated, objectives / bounds / shortages summed).
+    """
+    latest = {}
+    lock = threading.Lock()
+
+    def publish(part, snapshot):
+        with lock:
+            latest[part] = snapshot
+            if len(latest) < n_parts:
+                return
+            snaps = list(latest.values())
+            rosters = [snap['roster'] for snap in snaps]
+            on_solution({
+                'roster': pd.concat(rosters, ignore_index=True) if all(r is not None for r in rosters) else None,
+                'objective': sum(snap['objective'] for snap in snaps),
+                'best_bound': sum(snap['best_bound'] for snap in snaps),
+                'shortage': sum(snap['shortage'] for snap in snaps),
+                'elapsed': max(snap['elapsed'] for snap in snaps),
+                'solutions': sum(snap['solutions'] for snap in snaps),
+            })
+
+    return publish
+
+
+def solve_roster_decomposed(employees_df, positions, constraints, col_map, shifts, avail_overrides=None,
+                            pref_weights=None, max_shifts_map=None, fixed_shifts_map=None, max_workers=None,
+                            **solve_kwargs):
+    """
+    Splits the roster into independent sub-problems (see find_roster_components), solves them
+    in parallel processes and merges rosters, shortages, recommendations and surplus reports
+    back into the same result structure as solve_roster.
+    Small inputs, or inputs that form a single component, are solved directly. Streamed solves
+    (on_solution / stop_event cannot cross process boundaries) run their sub-problems in threads
+    instead - CP-SAT releases the GIL while searching - and publish merged snapshots once every
+    sub-problem has one (see _merged_streamer).
+    """
+    components = find_roster_components(employees_df, positions, col_map, fixed_shifts_map)
+    # max_search_workers, if given, is the CP-SAT worker budget of the whole call
+    worker_budget = solve_kwargs.get('max_search_workers') or os.cpu_count() or 1
+    workers = min(max_workers or os.cpu_count() or 1, worker_budget)
+    streamed = solve_kwargs.get('on_solution') is not None or solve_kwargs.get('stop_event') is not None
+    if len(components) <= 1 or workers <= 1 or len(employees_df) < PARALLEL_MIN_EMPLOYEES:
+        return solve_roster(
+            employees_df, positions, constraints, col_map, shifts, avail_overrides=avail_overrides,
+            pref_weights=pref_weights, max_shifts_map=max_shifts_map, fixed_shifts_map=fixed_shifts_map,
+            **solve_kwargs
+        )
+
+    # Pack components into at most `workers` batches of similar size (largest first)
+    n_batches = min(workers, len(components))
+    batches = [([], [], 0) for _ in range(n_batches)]
+    for emp_idx, pos_idx in sorted(components, key=lambda c: -len(c[0]) * max(1, len(c[1]))):
+        b = min(range(n_batches), key=lambda i: batches[i][2])
+        emps, poss, load = batches[b]
+        batches[b] = (emps + emp_idx, poss + pos_idx, load + len(emp_idx) * max(1, len(pos_idx)))
+
+    def _only(mapping, idx_list):
+        return {i: mapping[i] for i in idx_list if i in mapping} if mapping else mapping
+
+    # Share the machine's cores between the parallel CP-SAT runs
+    solve_kwargs['max_search_workers'] = max(1, worker_budget // n_batches)
+    batches = [(emps, poss) for emps, poss, _ in batches if emps or poss]
+    on_solution = solve_kwargs.pop('on_solution', None)
+    publish = _merged_streamer(on_solution, len(batches)) if on_solution is not None else None
+    executor = ThreadPoolExecutor if streamed else ProcessPoolExecutor
+    with executor(max_workers=len(batches)) as pool:
+        futures = [
+            pool.submit(
+                solve_roster,
+                employees_df.loc[emps], [positions[p] for p in sorted(poss)], constraints, col_map, shifts,
+                avail_overrides=_only(avail_overrides, emps), pref_weights=_only(pref_weights, emps),
+                max_shifts_map=_only(max_shifts_map, emps), fixed_shifts_map=_only(fixed_shifts_map, emps),
+                **solve_kwargs, **({'on_solution': functools.partial(publish, b)} if publish else {})
+            )
+            for b, (emps, poss) in enumerate(batches)
+        ]
+        parts = [f.result() for f in futures]
+    merged = _merge_results(parts, shifts)
+    if merged.get('capacity'):
+        # Slot position indices of the parts refer to their own position lists
+        pos_index = {p['name']: p_idx for p_idx, p in enumerate(positions)}
+        for slot in merged['capacity']['slots']:
+            slot['p_idx'] = pos_index.get(slot['position'], slot['p_idx'])
+    return merged
+
+
+def _result_for_days(result, days):
+    """Keeps only the roster rows, shortages, recommendations and surplus of the given days."""
+    days = set(days)
+    part = dict(result)
+    if result.get('roster') is not None:
+        part['roster'] = result['roster'][result['roster']['יום'].isin(days)]
+    part['shortage_summary'] = {
+        label: v for label, v in result.get('shortage_summary', {}).items() if label.split('|')[0] in days
+    }
+    part['diagnostics'] = [f"חסר/ים {v} עובדים ב: {label}" for label, v in part['shortage_summary'].items()]
+    # Recommendation keys are "pos | day | shift"
+    part['gap_recommendations'] = {
+        key: recs for key, recs in result.get('gap_recommendations', {}).items()
+        if len(key.split(' | ')) >= 2 and key.split(' | ')[1] in days
+    }
+    part['surplus_report'] = {d: v for d, v in result.get('surplus_report', {}).items() if d in days}
+    if result.get('capacity'):
+        cap = result['capacity']
+        part['capacity'] = _merge_capacity([{
+            'days': {d: info for d, info in cap['days'].items() if d in days},
+            'slots': [slot for slot in cap['slots'] if slot['day'] in days],
+            'demand': sum(info['demand'] for d, info in cap['days'].items() if d in days),
+            'max_coverage': sum(info['max_coverage'] for d, info in cap['days'].items() if d in days),
+            'guaranteed_shortage': sum(info['guaranteed_shortage'] for d, info in cap['days'].items() if d in days),
+        }])
+    return part
+
+
+def roster_diff(roster_a, roster_b):
+    """
+    Side-by-side difference of two rosters: one row per (day, position, shift) cell whose
+    employees differ, with the employees only in roster_a and only in roster_b.
+    Shortage rows are ignored.
+    """
+    def _cells(roster):
+        worked = roster[roster['raw_shift'] != 'SHORTAGE']
+        return worked.groupby(["יום", "עמדה", "משמרת"])["עובד"].agg(lambda names: set(map(str, names))).to_dict()
+
+    cells_a, cells_b = _cells(roster_a), _cells(roster_b)
+    rows = []
+    for day, pos, shift in sorted(set(cells_a) | set(cells_b)):
+        emps_a = cells_a.get((day, pos, shift), set())
+        emps_b = cells_b.get((day, pos, shift), set())
+        if emps_a != emps_b:
+            rows.append({"יום": day, "עמדה": pos, "משמרת": shift,
+                         "only_a": ", ".join(sorted(emps_a - emps_b)), "only_b": ", ".join(sorted(emps_b - emps_a))})
+    return pd.DataFrame(rows, columns=["יום", "עמדה", "משמרת", "only_a", "only_b"])
+
+
+def solve_roster_rolling(employees_df, positions, constraints, col_map, shifts, window_days=7, overlap_days=1,
+                         budget='horizon', avail_overrides=None, pref_weights=None, max_shifts_map=None,
+                         fixed_shifts_map=None, **solve_kwargs):
+    """
+    Rolling-horizon solve for long (multi-week / monthly) selections of shift columns.
+    Solves windows of `window_days` one after another; each window overlaps the next by
+    `overlap_days`, which are only used as look-ahead and re-solved by the next window.
+
+    Boundary state carried between windows:
+      - the shifts worked on the last committed days (no_back_to_back / min_rest across
+        windows, see rest_carry_in of solve_roster)
+      - shifts already committed, when budget='horizon' (max_shifts_map is a total for the
+        whole selection); every window gets its pro-rated share of the budget left, and
+        iron shifts on later days stay reserved in it.
+        With budget='window' every window gets the full max_shifts again.
+    Returns the same result structure as solve_roster, plus 'windows'.
+    """
+    if len(shifts) <= window_days:
+        return solve_roster_decomposed(
+            employees_df, positions, constraints, col_map, shifts, avail_overrides=avail_overrides,
+            pref_weights=pref_weights, max_shifts_map=max_shifts_map, fixed_shifts_map=fixed_shifts_map,
+            **solve_kwargs
+        )
+
+    step = max(1, window_days - overlap_days)
+    name_to_idx = {}
+    for idx, name in zip(employees_df.index, employees_df[col_map['name']]):
+        name_to_idx.setdefault(str(name), idx)
+    consumed = {idx: 0 for idx in employees_df.index}
+    carry_in = {}
+    worked_on = {}  # committed day -> [(employee index, shift code)]
+    parts = []
+    # How far back a committed shift can still clash with the next window
+    _, conflicts = rest_settings(constraints, shift_coverage(constraints))
+    carry_days = max((off for _, _, off in conflicts), default=0)
+    # Days each employee can work at all (marked availability or an iron shift)
+    open_days = {
+        e['id']: {d for d in shifts if e['avail'].get(d)} | {f['day'] for f in e.get('fixed_shifts', [])}
+        for e in parse_employees(employees_df, col_map, shifts, avail_overrides, max_shifts_map, fixed_shifts_map)
+    } if budget == 'horizon' else {}
+
+    start = 0
+    while start < len(shifts):
+        end = min(len(shifts), start + window_days)
+        commit_end = end if end == len(shifts) else start + step
+        win_days = shifts[start:end]
+        commit_days = shifts[start:commit_end]
+
+        if budget == 'horizon':
+            # Each window's committed days get the share of the remaining budget that they hold
+            # of the employee's remaining available days (rounded up), so early windows cannot
+            # spend it all. Iron shifts of later windows keep their share, and the window's
+            # own iron shifts always fit (a budget below them makes the window infeasible)
+            later_days = set(shifts[end:])
+            win_max = {}
+            for idx in employees_df.index:
+                irons = fixed_shifts_map.get(idx, []) if fixed_shifts_map else []
+                iron_later = sum(1 for f in irons if f['day'] in later_days)
+                iron_here = sum(1 for f in irons if f['day'] in win_days)
+                total = max_shifts_map.get(idx, 6) if max_shifts_map else 6
+                left = total - consumed[idx] - iron_later
+                days_left = sum(1 for d in shifts[start:] if d in open_days.get(idx, ()))
+                days_here = sum(1 for d in commit_days if d in open_days.get(idx, ()))
+                share = math.ceil(left * days_here / days_left) if days_left else left
+                win_max[idx] = max(iron_here, min(left, share))
+        else:
+            win_max = max_shifts_map
+
+        result = solve_roster_decomposed(
+            employees_df, positions, constraints, col_map, win_days, avail_overrides=avail_overrides,
+            pref_weights=pref_weights, max_shifts_map=win_max, fixed_shifts_map=fixed_shifts_map,
+            rest_carry_in=carry_in, **solve_kwargs
+        )
+        if result.get('roster') is None:
+            return result
+
+        part = _result_for_days(result, commit_days)
+        parts.append(part)
+
+        # Carry the committed state into the next window
+        committed = part['roster'][part['roster']['raw_shift'] != 'SHORTAGE']
+        for day, name, code in zip(committed['יום'], committed['עובד'], committed['raw_shift']):
+            idx = name_to_idx.get(str(name))
+            if idx is not None:
+                consumed[idx] += 1
+                worked_on.setdefault(day, []).append((idx, code))
+        carry_in = {}
+        for before in range(1, min(carry_days, commit_end) + 1):
+            for idx, code in worked_on.get(shifts[commit_end - before], []):
+                carry_in.setdefault(idx, []).append((before, code))
+        start = commit_end
+
+    merged = _merge_results(parts, shifts, sequential=True)
+    merged.pop('components', None)
+    # Optimal windows do not make an optimal horizon - and their bounds do not bound it
+    if merged.get('roster') is not None:
+        merged['status'] = 'FEASIBLE'
+        if merged.get('solve_stats'):
+            merged['solve_stats'].update({'best_bound': None, 'gap': None})
+    merged['windows'] = len(parts)
+    return merged
@@ -0,0 +1,114 @@
+import numpy as np
+
+# Demand windows of a day, as entered per position (hours from midnight; the night runs into
+# the next morning, so a roster day spans [07:00, 07:00 + 24h)).
+# (code, start, end, positions key, priority key, label)
+DEMAND_WINDOWS = (
+    ('M', 7, 15, 'guards_morning', 'priority_morning', 'בוקר'),
+    ('A', 15, 23, 'guards_afternoon', 'priority_afternoon', 'צהריים'),
+    ('N', 23, 31, 'guards_night', 'priority_night', 'לילה'),
+)
+DAY_START = 7
+DAY_END = DAY_START + 24
+
+# A shift template is a start/end time plus the availability it needs:
+#   'avail'     - availability code the employee must have that day ('M' / 'A' / 'N' /
+#                 'Can_DM' / 'Can_DN', see scheduler.parse_employees)
+#   'double'    - only allowed when constraints['allow_double'] is on
+#   'auto_from' - (doubles) single availability that enables it under auto_doubles
+# The defaults reproduce the classic M / A / N / DM / DN model.
+DEFAULT_SHIFT_TEMPLATES = (
+    {'code': 'M', 'name': 'בוקר (07-15)', 'start': 7, 'end': 15, 'avail': 'M'},
+    {'code': 'A', 'name': 'צהריים (15-23)', 'start': 15, 'end': 23, 'avail': 'A'},
+    {'code': 'N', 'name': 'לילה (23-07)', 'start': 23, 'end': 7, 'avail': 'N'},
+    {'code': 'DM', 'name': 'כפולה בוקר (07-19)', 'start': 7, 'end': 19, 'avail': 'Can_DM', 'double': True, 'auto_from': 'M'},
+    {'code': 'DN', 'name': 'כפולה לילה (19-07)', 'start': 19, 'end': 7, 'avail': 'Can_DN', 'double': True, 'auto_from': 'N'},
+)
+
+
+def _fmt(hour):
+    hour = hour % 24
+    return f"{int(hour):02d}:{int(round((hour % 1) * 60)):02d}"
+
+
+def _day_span(template):
+    """(start, end) of a template on the roster day's axis [DAY_START, DAY_END)."""
+    start = template['start'] + (24 if template['start'] < DAY_START else 0)
+    end = template['end']
+    while end <= start:
+        end += 24
+    if end > DAY_END:
+        raise ValueError(f"Shift template {template['code']} must end by {_fmt(DAY_END)} of the next day")
+    return start, end
+
+
+def compile_coverage(templates=None):
+    """
+    Compiles shift templates into time segments: the demand windows are cut at every template
+    start / end inside them, and every segment inherits its window's demand. Returns a dict:
+      'templates'   - {code: template}, in the given order
+      'spans'       - {code: (start, end)} in hours on the roster day's axis
+      'segments'    - [(key, window code, start, end, label)] in time order; a window that is
+                      not cut keeps its code as key ('M'), cut windows get 'A1', 'A2', ...
+      'matrix'      - bool [template, segment]: the template covers the segment
+      'segments_of' - {code: segment keys it covers}
+      'windows_of'  - {code: demand windows it overlaps (all must be active for the shift)}
+    """
+    templates = list(templates or DEFAULT_SHIFT_TEMPLATES)
+    spans = {t['code']: _day_span(t) for t in templates}
+
+    segments = []
+    for w_code, w_start, w_end, _, _, w_label in DEMAND_WINDOWS:
+        cuts = sorted({w_start, w_end} | {h for span in spans.values() for h in span if w_start < h < w_end})
+        pieces = list(zip(cuts[:-1], cuts[1:]))
+        for i, (s, e) in enumerate(pieces):
+            if len(pieces) == 1:
+                segments.append((w_code, w_code, s, e, w_label))
+            else:
+                segments.append((f"{w_code}{i + 1}", w_code, s, e, f"{w_label} ({_fmt(s)}-{_fmt(e)})"))
+
+    matrix = np.zeros((len(templates), len(segments)), dtype=bool)
+    for t_i, t in enumerate(templates):
+        start, end = spans[t['code']]
+        for s_i, (_, _, s, e, _) in enumerate(segments):
+            matrix[t_i, s_i] = start <= s and e <= end
+
+    segments_of = {}
+    windows_of = {}
+    for t_i, t in enumerate(templates):
+        start, end = spans[t['code']]
+        segments_of[t['code']] = tuple(segments[s_i][0] for s_i in np.flatnonzero(matrix[t_i]))
+        windows_of[t['code']] = tuple(w[0] for w in DEMAND_WINDOWS if start < w[2] and w[1] < end)
+
+    return {
+        'templates': {t['code']: t for t in templates},
+        'spans': spans,
+        'segments': segments,
+        'matrix': matrix,
+        'segments_of': segments_of,
+        'windows_of': windows_of,
+    }
+
+
+def rest_conflicts(coverage, rest_hours):
+    """
+    Template pairs that cannot be worked by one employee because the second one starts less
+    than rest_hours after the first one ends (or overlaps it): a set of (code, later code,
+    day offset >= 1). Same-day pairs are left out - one shift per day already covers them.
+    """
+    conflicts = set()
+    spans = coverage['spans']
+    for c1, (s1, e1) in spans.items():
+        blocked_until = e1 + rest_hours
+        for c2, (s2, _) in spans.items():
+            offset = 1
+            while 24 * offset + s2 < blocked_until:
+                conflicts.add((c1, c2, offset))
+                offset += 1
+    return conflicts
+
+
+def interval_minutes(coverage, code, d_i, rest_hours):
+    """(start, size) in minutes of a shift on roster day d_i, including the rest after it."""
+    start, end = coverage['spans'][code]
+    return int(round((24 * d_i + start) * 60)), int(round((end - start + rest_hours) * 60))
@@ -0,0 +1,181 @@
+import glob
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+import pandas as pd
+
+# On-disk cache of solve results, addressed by a hash of the canonicalised inputs.
+# File names are "<family>_<fingerprint>.pkl": the family hash only covers the roster's shape
+# (employees, positions, days), so a changed availability / demand / preference finds the
+# latest result of the same family and uses its roster as a warm start.
+CACHE_DIR = os.environ.get("AUTOSHIFT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".solve_cache"))
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Arguments that only steer the search (or the UI) - they never change what the answer should be
+_NON_SEMANTIC_ARGS = {'hint_roster', 'on_solution', 'stop_event', 'max_search_workers', 'max_workers', 'metrics_log'}
+
+
+def _canonical(value):
+    """JSON-serialisable, order-independent form of a solver input."""
+    if isinstance(value, pd.DataFrame):
+        return {
+            'columns': [str(c) for c in value.columns],
+            'index': [str(i) for i in value.index],
+            'rows': [[str(v) for v in row] for row in value.itertuples(index=False, name=None)],
+        }
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        items = [_canonical(v) for v in value]
+        return sorted(items, key=lambda v: json.dumps(v, sort_keys=True, default=str)) if isinstance(value, set) else items
+    if hasattr(value, 'item'):  # numpy scalars
+        return value.item()
+    return value
+
+
+def _hash(obj):
+    payload = json.dumps(_canonical(obj), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _solver_identity(solve_fn, solve_kwargs):
+    """Qualified name of solve_fn and the defaults of its keyword parameters not given in solve_kwargs."""
+    if solve_fn is None:
+        return None
+    func = getattr(solve_fn, 'func', solve_fn)  # functools.partial
+    try:
+        params = inspect.signature(solve_fn).parameters.values()
+    except (TypeError, ValueError):
+        params = []
+    defaults = {
+        p.name: p.default for p in params
+        if p.default is not inspect.Parameter.empty and p.name not in solve_kwargs and p.name not in _NON_SEMANTIC_ARGS
+    }
+    return {
+        'name': f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}",
+        'defaults': defaults,
+    }
+
+
+def fingerprint_inputs(employees_df, positions, constraints, col_map, shifts, solve_fn=None, **solve_kwargs):
+    """
+    Returns (family, fingerprint) for a solve request. fingerprint covers everything that can
+    change the result (employee rows, positions, constraints, overrides, preference weights,
+    max / fixed shifts, the shifts list, the solve profile and flags, and which solve_fn runs
+    with which defaulted parameters - e.g. the rolling window); family only the names of the
+    employees, positions and days.
+    """
+    semantic = {k: v for k, v in solve_kwargs.items() if k not in _NON_SEMANTIC_ARGS}
+    fingerprint = _hash({
+        'solver': _solver_identity(solve_fn, solve_kwargs),
+        'employees': employees_df,
+        'positions': positions,
+        'constraints': constraints,
+        'col_map': col_map,
+        'shifts': list(shifts),
+        'kwargs': semantic,
+    })
+    name_col = col_map.get('name')
+    names = employees_df[name_col].astype(str).tolist() if name_col in employees_df.columns else []
+    family = _hash({'employees': names, 'positions': [p['name'] for p in positions], 'shifts': list(shifts)})
+    return family[:16], fingerprint
+
+
+def _path(family, fingerprint):
+    return os.path.join(CACHE_DIR, f"{family}_{fingerprint}.pkl")
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+        os.utime(path)  # mtime is the LRU clock
+        return result
+    except (OSError, pickle.PickleError, EOFError):
+        return None
+
+
+def get_cached(family, fingerprint):
+    """Cached result for exactly these inputs, or None."""
+    path = _path(family, fingerprint)
+    return _read(path) if os.path.exists(path) else None
+
+
+def get_nearest(family):
+    """Most recently used cached result of the same family (same employees / positions / days), or None."""
+    candidates = glob.glob(os.path.join(CACHE_DIR, f"{family}_*.pkl"))
+    for path in sorted(candidates, key=os.path.getmtime, reverse=True):
+        result = _read(path)
+        if result is not None:
+            return result
+    return None
+
+
+def put_cached(family, fingerprint, result):
+    """Stores a result (atomically) and evicts least recently used entries above CACHE_MAX_BYTES."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _path(family, fingerprint)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    evict()
+
+
+def evict(max_bytes=None):
+    """Deletes the least recently used entries until the cache fits in max_bytes."""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for path in glob.glob(os.path.join(CACHE_DIR, "*.pkl")):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def cached_solve(solve_fn, employees_df, positions, constraints, col_map, shifts, fallback_hint=None, **solve_kwargs):
+    """
+    solve_fn(...) behind the cache. Identical inputs return the stored result immediately;
+    otherwise the closest cached roster of the same family seeds hint_roster (unless one was
+    given) and the new result is stored. Results of searches stopped early are not cached.
+    fallback_hint: roster to warm-start from when the cache has nothing of the same family
+    (e.g. the greedy preview). result['cache'] is {'hit': bool, 'warm_start': bool}.
+    """
+    family, fingerprint = fingerprint_inputs(employees_df, positions, constraints, col_map, shifts, solve_fn=solve_fn, **solve_kwargs)
+    cached = get_cached(family, fingerprint)
+    if cached is not None:
+        cached['cache'] = {'hit': True, 'warm_start': False}
+        return cached
+
+    warm_start = False
+    if solve_kwargs.get('hint_roster') is None:
+        nearest = get_nearest(family)
+        if nearest is not None and nearest.get('roster') is not None:
+            solve_kwargs['hint_roster'] = nearest['roster']
+            warm_start = True
+        elif fallback_hint is not None:
+            solve_kwargs['hint_roster'] = fallback_hint
+
+    result = solve_fn(employees_df, positions, constraints, col_map=col_map, shifts=shifts, **solve_kwargs)
+    stopped = solve_kwargs.get('stop_event') is not None and solve_kwargs['stop_event'].is_set()
+    if result and result.get('roster') is not None and not stopped:
+        try:
+            put_cached(family, fingerprint, result)
+        except OSError:
+            pass  # caching is best effort (read-only disk etc.)
+    if result is not None:
+        result['cache'] = {'hit': False, 'warm_start': warm_start}
+    return result
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+# Shared by every Streamlit session on this server (the module is imported once per process).
+# CP-SAT releases the GIL while searching, so a thread pool is enough and keeps callbacks /
+# StopSearch working; at most MAX_CONCURRENT_SOLVES solves search at the same time and each
+# gets an equal share of SEARCH_WORKER_CAP CP-SAT workers, the rest wait in the queue.
+SEARCH_WORKER_CAP = os.cpu_count() or 1
+MAX_CONCURRENT_SOLVES = max(1, min(4, SEARCH_WORKER_CAP // 4))
+FINISHED_JOB_TTL = 3600  # seconds a finished job's result stays available
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SOLVES, thread_name_prefix="solve-job")
+_jobs = {}
+_lock = threading.Lock()
+
+
+def _workers_per_solve():
+    return max(1, SEARCH_WORKER_CAP // MAX_CONCURRENT_SOLVES)
+
+
+def _purge_finished():
+    now = time.time()
+    for job_id in [j for j, job in _jobs.items() if job['finished'] and now - job['finished'] > FINISHED_JOB_TTL]:
+        del _jobs[job_id]
+
+
+def _run_job(job, solve_fn, args, kwargs, preview_fn=None):
+    with _lock:
+        if job['stop'].is_set():
+            job['status'] = 'cancelled'
+            job['finished'] = time.time()
+            return
+        job['status'] = 'running'
+        job['started'] = time.time()
+    try:
+        if preview_fn is not None:
+            preview = preview_fn()
+            if preview and preview.get('roster') is not None:
+                job['preview'] = preview
+                if kwargs.get('fallback_hint') is None:
+                    kwargs['fallback_hint'] = preview['roster']
+        result = solve_fn(*args, **kwargs)
+        with _lock:
+            job['result'] = result
+            job['status'] = 'cancelled' if job['stop'].is_set() else 'done'
+    except Exception as e:
+        with _lock:
+            job['error'] = e
+            job['status'] = 'failed'
+    finally:
+        with _lock:
+            job['finished'] = time.time()
+
+
+def submit_solve(solve_fn, *args, stream=True, preview_fn=None, **kwargs):
+    """
+    Queues solve_fn(*args, **kwargs) (solve_roster or one of its wrappers) and returns a job id.
+    The job's CP-SAT workers are capped by max_search_workers so that concurrent solves never
+    use more than SEARCH_WORKER_CAP workers in total. With stream=True the solve also gets
+    on_solution / stop_event, so job_status() exposes the latest intermediate roster and
+    cancel_job() can stop a running search.
+    preview_fn: quick result (e.g. the greedy engine) computed inside the job before the solve;
+    job_status() exposes it as 'preview', and its roster becomes solve_fn's fallback_hint
+    (see solve_cache.cached_solve) unless one was given.
+    """
+    job = {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'submitted': time.time(),
+        'started': None,
+        'finished': None,
+        'latest': None,
+        'preview': None,
+        'result': None,
+        'error': None,
+        'stop': threading.Event(),
+    }
+    kwargs['max_search_workers'] = min(kwargs.get('max_search_workers') or _workers_per_solve(), _workers_per_solve())
+    if stream:
+        kwargs['on_solution'] = lambda snap: job.__setitem__('latest', snap)
+        kwargs['stop_event'] = job['stop']
+
+    with _lock:
+        _purge_finished()
+        _jobs[job['id']] = job
+        job['future'] = _executor.submit(_run_job, job, solve_fn, args, kwargs, preview_fn)
+    return job['id']
+
+
+def submit_batch(batch_fn, *args, **kwargs):
+    """
+    Queues a batch of solves run in worker processes (scenarios.run_scenarios,
+    repair_suggestions.suggest_repairs) as one job. The batch's processes and their CP-SAT
+    workers together stay within one solve's share of SEARCH_WORKER_CAP.
+    """
+    share = _workers_per_solve()
+    kwargs['max_workers'] = min(kwargs.get('max_workers') or share, share)
+    return submit_solve(batch_fn, *args, stream=False, **kwargs)
+
+
+def wait_job(job_id):
+    """Blocks until a job has finished and returns pop_job_result(job_id)."""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return None, None
+    try:
+        job['future'].result()
+    except CancelledError:
+        pass
+    return pop_job_result(job_id)
+
+
+def job_status(job_id):
+    """
+    Snapshot of a job: status ('queued' / 'running' / 'done' / 'cancelled' / 'failed'),
+    queue_position (jobs submitted earlier that are still waiting), elapsed seconds and the
+    latest intermediate solution (and the preview, see submit_solve). Returns None for unknown
+    (or expired) job ids.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        queue_position = 0
+        if job['status'] == 'queued':
+            queue_position = sum(1 for j in _jobs.values() if j['status'] == 'queued' and j['submitted'] < job['submitted'])
+        started = job['started'] or time.time()
+        return {
+            'id': job_id,
+            'status': job['status'],
+            'queue_position': queue_position,
+            'elapsed': round((job['finished'] or time.time()) - started, 2) if job['started'] else 0.0,
+            'latest': job['latest'],
+            'preview': job['preview'],
+            'error': job['error'],
+        }
+
+
+def is_finished(job_id):
+    status = job_status(job_id)
+    return status is None or status['status'] in ('done', 'cancelled', 'failed')
+
+
+def cancel_job(job_id):
+    """
+    Cancels a job: a queued job never starts, a running one is stopped via StopSearch and
+    still returns the best roster it found so far. Returns False for unknown job ids.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return False
+        job['stop'].set()
+        if job['status'] == 'queued' and job['future'].cancel():
+            job['status'] = 'cancelled'
+            job['finished'] = time.time()
+    return True
+
+
+def pop_job_result(job_id):
+    """
+    Removes a finished job and returns (result, error). result is None while the job is still
+    queued / running (the job is then kept) or when it was cancelled before it started.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job['status'] in ('queued', 'running'):
+            return None, None
+        del _jobs[job_id]
+        return job['result'], job['error']
+
+
+def active_jobs():
+    """Number of queued and running jobs on this server."""
+    with _lock:
+        return sum(1 for j in _jobs.values() if j['status'] in ('queued', 'running'))
@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Set to a file path to append every solve's metrics as one JSON line (trend analysis)
+METRICS_LOG = os.environ.get("AUTOSHIFT_METRICS_LOG")
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far in MB (None where the OS does not report it)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class PhaseTimer:
+    """
+    Wall-clock and memory per phase of a solve. lap(name) closes the phase that started at
+    the previous lap (or at construction); repeated names accumulate. Memory is the all-time
+    peak RSS of the whole process after the phase ('process_peak_rss_mb' - it includes earlier
+    solves and other sessions of the server), and how much the phase raised that peak
+    ('process_peak_growth_mb' > 0 marks the phases that set a new high-water mark; 0 does not
+    mean the phase allocated nothing). It is not a per-phase measurement: most of a solve's
+    memory is CP-SAT's native heap, which tracemalloc cannot see.
+    """
+
+    def __init__(self):
+        self.start = self._last = time.perf_counter()
+        self._last_peak = peak_rss_mb()
+        self.phases = {}
+
+    def lap(self, name):
+        now = time.perf_counter()
+        peak = peak_rss_mb()
+        phase = self.phases.setdefault(name, {'seconds': 0.0, 'process_peak_rss_mb': None, 'process_peak_growth_mb': 0.0})
+        phase['seconds'] = round(phase['seconds'] + now - self._last, 4)
+        phase['process_peak_rss_mb'] = peak
+        if peak is not None and self._last_peak is not None:
+            phase['process_peak_growth_mb'] = round(phase['process_peak_growth_mb'] + peak - self._last_peak, 1)
+        self._last, self._last_peak = now, peak
+
+    def total(self):
+        return round(time.perf_counter() - self.start, 4)
+
+
+def model_stats(model):
+    """Size of a CpModel: variables and constraints."""
+    proto = model.Proto()
+    return {'variables': len(proto.variables), 'constraints': len(proto.constraints)}
+
+
+def response_stats(solver):
+    """CP-SAT search statistics of the last Solve()."""
+    return {
+        'branches': solver.NumBranches(),
+        'conflicts': solver.NumConflicts(),
+        'wall_time': round(solver.WallTime(), 4),
+        'best_bound': solver.BestObjectiveBound(),
+    }
+
+
+def build_metrics(timer, engine, model=None, solver=None, prune_stats=None, sizes=None):
+    """
+    result['metrics'] of a solve: per-phase 'phases' (see PhaseTimer), 'total_seconds',
+    'engine', 'sizes' (employees / positions / days / assignment vars), and for CP-SAT the
+    'model' size with pruned variables and the 'search' statistics.
+    """
+    metrics = {
+        'engine': engine,
+        'total_seconds': timer.total(),
+        'phases': timer.phases,
+        'sizes': sizes or {},
+        'model': None,
+        'search': None,
+    }
+    if model is not None:
+        metrics['model'] = model_stats(model)
+        metrics['model']['pruned_vars'] = prune_stats['pruned_vars'] if prune_stats else 0
+    if solver is not None:
+        metrics['search'] = response_stats(solver)
+    return metrics
+
+
+def append_metrics_log(metrics, status=None, path=None):
+    """Appends one solve's metrics (plus a timestamp and the status) to the JSONL log; best effort."""
+    path = path or METRICS_LOG
+    if not path:
+        return
+    record = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'status': status, **metrics}
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except OSError:
+        pass
+
+
+def merge_metrics(parts, sequential=False):
+    """
+    Metrics of a result merged from sub-solves (see scheduler._merge_results): phase times,
+    model size, search counters and the split dimension of 'sizes' add up; side-by-side parts
+    (sequential=False) take as long as the slowest one, and memory is the highest process peak of any part.
+    """
+    parts = [m for m in parts if m]
+    if not parts:
+        return None
+    phases = {}
+    for m in parts:
+        for name, phase in m['phases'].items():
+            merged = phases.setdefault(name, {'seconds': 0.0, 'process_peak_rss_mb': None, 'process_peak_growth_mb': 0.0})
+            merged['seconds'] = round(merged['seconds'] + phase['seconds'], 4)
+            merged['process_peak_growth_mb'] = round(merged['process_peak_growth_mb'] + phase['process_peak_growth_mb'], 1)
+            if phase['process_peak_rss_mb'] is not None:
+                merged['process_peak_rss_mb'] = max(merged['process_peak_rss_mb'] or 0, phase['process_peak_rss_mb'])
+
+    def _add(key):
+        blocks = [m[key] for m in parts if m.get(key)]
+        if not blocks:
+            return None
+        return {k: sum(b.get(k) or 0 for b in blocks) for k in blocks[0]}
+
+    sizes = _add('sizes') or {}
+    # Components share the days; rolling windows share the employees and positions
+    for key in (('employees', 'positions') if sequential else ('days',)):
+        if key in sizes:
+            sizes[key] = max(m['sizes'].get(key, 0) for m in parts)
+    totals = [m['total_seconds'] for m in parts]
+    engines = {m['engine'] for m in parts}
+    return {
+        'engine': engines.pop() if len(engines) == 1 else 'mixed',
+        'total_seconds': round(sum(totals), 4) if sequential else max(totals),
+        'phases': phases,
+        'sizes': sizes,
+        'model': _add('model'),
+        'search': _add('search'),
+        'parts': len(parts),
+    }
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import scheduler
+
+
+def _instance():
+    """A seeded benchmark instance where eight guards get two identical copies each (units of three)."""
+    inst = benchmark.synthetic_instance(16, 4, 7, 0)
+    df = inst['employees_df']
+    copies = []
+    for i in range(8):
+        for k in range(2):
+            row = df.iloc[i].copy()
+            row[inst['col_map']['name']] = f"{row[inst['col_map']['name']]} / {k + 1}"
+            copies.append(row)
+    inst['employees_df'] = pd.concat([df, pd.DataFrame(copies)], ignore_index=True)
+    return inst
+
+
+def _solve(inst, symmetry_reduction):
+    return scheduler.solve_roster(
+        inst['employees_df'], inst['positions'], inst['constraints'], inst['col_map'], inst['shifts'],
+        avail_overrides=inst['avail_overrides'], pref_weights=inst['pref_weights'],
+        max_shifts_map=inst['max_shifts_map'], fixed_shifts_map=inst['fixed_shifts_map'],
+        solve_profile='quick', max_search_workers=1, symmetry_reduction=symmetry_reduction
+    )
+
+
+def test_units_reach_the_per_guard_objective():
+    inst = _instance()
+    units = _solve(inst, True)
+    guards = _solve(inst, False)
+    assert units['symmetry_stats']['units'] < units['symmetry_stats']['employees']
+    assert units['status'] == guards['status'] == 'OPTIMAL'
+    assert units['solve_stats']['objective'] == guards['solve_stats']['objective']
+
+
+def test_disaggregated_roster_respects_every_guard():
+    inst = _instance()
+    result = _solve(inst, True)
+    roster = result['roster'][result['roster']['raw_shift'] != 'SHORTAGE']
+    _, conflicts = scheduler.rest_settings(inst['constraints'], scheduler.shift_coverage(inst['constraints']))
+    day_index = {d: i for i, d in enumerate(inst['shifts'])}
+    df = inst['employees_df']
+    max_shifts = {df.at[idx, inst['col_map']['name']]: inst['max_shifts_map'].get(idx, 6) for idx in df.index}
+
+    for name, rows in roster.groupby('עובד'):
+        worked = {day_index[d]: s for d, s in zip(rows['יום'], rows['raw_shift'])}
+        assert len(worked) == len(rows), f"{name} works twice on one day"
+        assert len(rows) <= max_shifts[name]
+        for c1, c2, off in conflicts:
+            assert not any(worked.get(d_i) == c1 and worked.get(d_i + off) == c2 for d_i in worked), \
+                f"{name} breaks the rest rule ({c1} -> {c2})"
@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import scheduler
+
+
+def _solve(engine, objective_mode='weighted'):
+    """One seeded benchmark instance without doubles or the rest rule, so the flow engine applies."""
+    inst = benchmark.synthetic_instance(40, 8, 7, 0)
+    constraints = {**inst['constraints'], 'allow_double': False, 'no_back_to_back': False}
+    return scheduler.solve_roster(
+        inst['employees_df'], inst['positions'], constraints, inst['col_map'], inst['shifts'],
+        avail_overrides=inst['avail_overrides'], pref_weights=inst['pref_weights'],
+        max_shifts_map=inst['max_shifts_map'], fixed_shifts_map=inst['fixed_shifts_map'],
+        solve_profile='quick', engine=engine, objective_mode=objective_mode, max_search_workers=1
+    )
+
+
+def test_flow_matches_cp_sat_objective():
+    flow = _solve('flow')
+    cp = _solve('cp_sat')
+    assert flow['metrics']['engine'] == 'flow'
+    assert cp['metrics']['engine'] == 'cp_sat'
+    assert cp['status'] == 'OPTIMAL'
+    assert flow['solve_stats']['objective'] == cp['solve_stats']['objective']
+    assert sum(flow['shortage_summary'].values()) == sum(cp['shortage_summary'].values())
+
+
+def test_lexicographic_stays_on_cp_sat():
+    result = _solve('auto', 'lexicographic')
+    assert result['metrics']['engine'] == 'cp_sat'
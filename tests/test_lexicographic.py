@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import scheduler
+
+
+def _solve(objective_mode, max_search_workers):
+    """One seeded benchmark instance, quick profile."""
+    inst = benchmark.synthetic_instance(40, 8, 7, 0)
+    return scheduler.solve_roster(
+        inst['employees_df'], inst['positions'], inst['constraints'], inst['col_map'], inst['shifts'],
+        avail_overrides=inst['avail_overrides'], pref_weights=inst['pref_weights'],
+        max_shifts_map=inst['max_shifts_map'], fixed_shifts_map=inst['fixed_shifts_map'],
+        solve_profile='quick', objective_mode=objective_mode, max_search_workers=max_search_workers
+    )
+
+
+def test_later_stages_run_with_one_search_worker():
+    result = _solve('lexicographic', 1)
+    stages = {s['stage']: s for s in result['lexicographic_stats']}
+    assert result['roster'] is not None
+    assert stages['participation']['objective'] is not None
+    assert stages['preferences']['objective'] is not None
+
@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import scheduler
+
+
+def _instance():
+    """A seeded benchmark instance whose first position needs nobody in the afternoon."""
+    inst = benchmark.synthetic_instance(25, 4, 7, 0)
+    inst['positions'][0] = {**inst['positions'][0], 'guards_afternoon': 0}
+    return inst
+
+
+def _solve(inst, prune):
+    return scheduler.solve_roster(
+        inst['employees_df'], inst['positions'], inst['constraints'], inst['col_map'], inst['shifts'],
+        avail_overrides=inst['avail_overrides'], pref_weights=inst['pref_weights'],
+        max_shifts_map=inst['max_shifts_map'], fixed_shifts_map=inst['fixed_shifts_map'],
+        solve_profile='quick', max_search_workers=1, engine='cp_sat', prune=prune
+    )
+
+
+def test_pruning_keeps_coverage_and_iron_shifts():
+    inst = _instance()
+    pruned = _solve(inst, True)
+    full = _solve(inst, False)
+    stats = pruned['prune_stats']
+    assert pruned['status'] == full['status'] == 'OPTIMAL'
+    assert stats['no_demand'] > 0 and stats['dominated_double'] > 0
+    assert full['metrics']['model']['variables'] - pruned['metrics']['model']['variables'] == stats['pruned_vars']
+    # Pruning only removes assignments that cover no demand - the shortages stay the same
+    assert sum(pruned['shortage_summary'].values()) == sum(full['shortage_summary'].values())
+
+    roster = pruned['roster']
+    idle = roster[(roster['עמדה'] == inst['positions'][0]['name']) & (roster['raw_shift'] == 'A')]
+    assert idle.empty
+    names = inst['employees_df'][inst['col_map']['name']]
+    for idx, irons in inst['fixed_shifts_map'].items():
+        for f in irons:
+            row = roster[(roster['יום'] == f['day']) & (roster['עמדה'] == f['pos_name']) & (roster['raw_shift'] == f['shift'])]
+            assert names[idx] in set(row['עובד'])
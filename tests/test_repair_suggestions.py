@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import repair_suggestions
+import scheduler
+
+
+def test_repairs_fill_shortages_of_an_optimal_roster():
+    inst = benchmark.synthetic_instance(25, 4, 7, 0)
+    args = (inst['employees_df'], inst['positions'], inst['constraints'], inst['col_map'], inst['shifts'])
+    kwargs = {key: inst[key] for key in ('avail_overrides', 'max_shifts_map', 'fixed_shifts_map', 'pref_weights')}
+    result = scheduler.solve_roster(*args, solve_profile='quick', max_search_workers=1, **kwargs)
+    assert result['status'] == 'OPTIMAL' and result['shortage_summary']
+
+    suggestions = repair_suggestions.suggest_repairs(result, *args, max_workers=1, **kwargs)
+    assert [s['shortage'] for s in suggestions] == list(result['shortage_summary'])
+    assert any(s['chain'] for s in suggestions)
+    for sug in suggestions:
+        if sug['status'] in ('OPTIMAL', 'FEASIBLE'):
+            assert sug['chain'] and sug['filled'] >= 1
+            assert sug['objective_change'] is not None
+        else:
+            assert not sug['chain'] and sug['filled'] == 0
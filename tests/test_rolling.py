@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import scheduler
+
+
+def _solve(solve_fn, inst, **kwargs):
+    return solve_fn(
+        inst['employees_df'], inst['positions'], inst['constraints'], inst['col_map'], inst['shifts'],
+        avail_overrides=inst['avail_overrides'], pref_weights=inst['pref_weights'],
+        max_shifts_map=inst['max_shifts_map'], fixed_shifts_map=inst['fixed_shifts_map'],
+        solve_profile='quick', max_search_workers=1, **kwargs
+    )
+
+
+def test_rolling_horizon_keeps_the_budget_for_later_windows():
+    inst = benchmark.synthetic_instance(30, 5, 21, 2)
+    rolling = _solve(scheduler.solve_roster_rolling, inst, window_days=7, overlap_days=1)
+    single = _solve(scheduler.solve_roster, inst)
+    assert rolling['windows'] == 4
+    assert rolling['status'] == 'FEASIBLE'
+    assert rolling['solve_stats']['gap'] is None
+
+    # max_shifts is a total for the whole selection
+    roster = rolling['roster'][rolling['roster']['raw_shift'] != 'SHORTAGE']
+    worked = roster.groupby('עובד').size()
+    df = inst['employees_df']
+    for idx, name in zip(df.index, df[inst['col_map']['name']]):
+        assert worked.get(name, 0) <= inst['max_shifts_map'].get(idx, 6)
+
+    # Early windows must not spend the budget the later ones need
+    assert sum(rolling['shortage_summary'].values()) <= 1.2 * sum(single['shortage_summary'].values())